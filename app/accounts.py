@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from app import auth
+from app.database import get_user_collection
+from app.email_service import email_service
+from app.validators import validate_password, validate_username
+
+logger = logging.getLogger(__name__)
+
+VERIFICATION_TOKEN_HOURS = 24
+# Số tài khoản được hash và ghi trong một lượt của bulk import
+IMPORT_BATCH_SIZE = int(os.getenv("USER_IMPORT_BATCH_SIZE", "500"))
+# Bulk import chừa lại ít nhất một worker bcrypt cho login/register đang chạy song song
+IMPORT_HASH_CONCURRENCY = int(os.getenv("USER_IMPORT_HASH_CONCURRENCY", str(max(1, auth.password_hasher.workers - 1))))
+
+DUPLICATE_MESSAGES = {
+    "email": "Email has been registered",
+    "username": "Username already in use",
+}
+
+
+def hash_token(token: str) -> str:
+    """Chỉ lưu SHA-256 của token xác thực; token gốc chỉ nằm trong email."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def new_verification(now: datetime) -> Tuple[str, dict]:
+    """Sinh token xác thực, trả về (token gốc để gửi email, các trường lưu vào user)."""
+    token = secrets.token_urlsafe(32)
+    return token, {
+        "verification_token_hash": hash_token(token),
+        "verification_token_expires": now + timedelta(hours=VERIFICATION_TOKEN_HOURS),
+    }
+
+
+def duplicate_field(error: dict) -> Optional[str]:
+    """Trường bị trùng (email/username) từ chi tiết của lỗi E11000."""
+    key = error.get("keyPattern") or error.get("keyValue") or {}
+    message = error.get("errmsg", "")
+    for field in DUPLICATE_MESSAGES:
+        if field in key or f"index: {field} " in message:
+            return field
+    return None
+
+
+def duplicate_message(error: dict) -> str:
+    return DUPLICATE_MESSAGES.get(duplicate_field(error), "Email or username already exists!")
+
+
+def validate_account(username: str, password: str) -> Optional[str]:
+    """Thông báo lỗi đầu tiên của username/mật khẩu, None nếu hợp lệ."""
+    is_valid, message = validate_username(username)
+    if not is_valid:
+        return message
+    is_valid, message = validate_password(password)
+    if not is_valid:
+        return message
+    return None
+
+
+def user_document(username: str, email: str, hashed_password: str, now: datetime, verified: bool = False,
+                  **profile) -> Tuple[Optional[str], dict]:
+    """Document user mới, kèm token xác thực (None nếu tài khoản được xác thực sẵn)."""
+    user = {
+        "username": username,
+        "email": email,
+        "hashed_password": hashed_password,
+        "is_email_verified": verified,
+        "created_at": now,
+        "email_verified_at": now if verified else None,
+        **{field: value for field, value in profile.items() if value is not None},
+    }
+    token = None
+    if not verified:
+        token, fields = new_verification(now)
+        user.update(fields)
+    return token, user
+
+
+async def verify_email_token(token: str) -> Optional[dict]:
+    """Xác thực email bằng một lệnh find_one_and_update trên hash của token; trả về user hoặc None."""
+    now = datetime.utcnow()
+    return await get_user_collection().find_one_and_update(
+        {"verification_token_hash": hash_token(token), "verification_token_expires": {"$gt": now}},
+        {
+            "$set": {"is_email_verified": True, "email_verified_at": now},
+            "$unset": {"verification_token_hash": "", "verification_token_expires": ""},
+        },
+        projection={"username": 1, "email": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def backfill_verification_tokens():
+    """Đổi token xác thực dạng rõ của các user đăng ký trước khi lưu hash sang verification_token_hash."""
+    users = get_user_collection()
+    count = 0
+    async for user in users.find({"verification_token": {"$type": "string"}}, {"verification_token": 1}):
+        await users.update_one(
+            {"_id": user["_id"]},
+            {
+                "$set": {"verification_token_hash": hash_token(user["verification_token"])},
+                "$unset": {"verification_token": ""},
+            },
+        )
+        count += 1
+    if count:
+        logger.info(f"Hashed verification tokens of {count} users")
+
+
+async def import_users(accounts: List[dict], verified: bool = False) -> dict:
+    """
+    Tạo nhiều tài khoản trong một lần gọi: kiểm tra từng dòng, hash mật khẩu song song trên pool của
+    PasswordHasher, ghi mỗi lô IMPORT_BATCH_SIZE tài khoản bằng một insert_many không theo thứ tự
+    (index unique email/username báo trùng theo từng dòng) và xếp email xác thực vào outbox bằng một insert_many.
+    Trả về {"created": số tài khoản đã tạo, "errors": [{"row", "error"}]} với row đánh số từ 1.
+    """
+    errors = []
+    rows = []
+    seen = {"email": set(), "username": set()}
+    for row, account in enumerate(accounts, start=1):
+        error = validate_account(account["username"], account["password"])
+        if error is None:
+            for field in DUPLICATE_MESSAGES:
+                if account[field] in seen[field]:
+                    error = f"Duplicate {field} in this import"
+                    break
+        if error:
+            errors.append({"row": row, "error": error})
+            continue
+        seen["email"].add(account["email"])
+        seen["username"].add(account["username"])
+        rows.append((row, account))
+
+    semaphore = asyncio.Semaphore(IMPORT_HASH_CONCURRENCY)
+
+    async def hash_password(password: str) -> str:
+        async with semaphore:
+            return await auth.password_hasher.hash(password)
+
+    created = 0
+    users = get_user_collection()
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        batch = rows[start:start + IMPORT_BATCH_SIZE]
+        hashes = await asyncio.gather(*(hash_password(account["password"]) for _, account in batch))
+        now = datetime.utcnow()
+        documents = []
+        tokens = []
+        for (_, account), hashed_password in zip(batch, hashes):
+            profile = {field: value for field, value in account.items() if field not in ("username", "email", "password")}
+            token, document = user_document(account["username"], account["email"], hashed_password, now, verified,
+                                            **profile)
+            documents.append(document)
+            tokens.append(token)
+
+        failed = set()
+        try:
+            await users.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                if error["code"] != 11000:
+                    raise
+                failed.add(error["index"])
+                errors.append({"row": batch[error["index"]][0], "error": duplicate_message(error)})
+        created += len(documents) - len(failed)
+
+        if not verified:
+            await email_service.enqueue_many([
+                email_service.verification_email(document["email"], token)
+                for i, (document, token) in enumerate(zip(documents, tokens)) if i not in failed
+            ])
+
+    errors.sort(key=lambda error: error["row"])
+    return {"created": created, "errors": errors}
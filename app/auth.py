@@ -1,34 +1,326 @@
+import asyncio
+import logging
+import os
+import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
 from jose import jwt, JWTError
+from pymongo import ReturnDocument
 from passlib.context import CryptContext
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 
+from app.database import PRIMARY, collection, get_user_collection
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
 SECRET_KEY = "your_secret_key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Số token đã xác thực được giữ trong bộ nhớ và chu kỳ đồng bộ danh sách thu hồi giữa các worker
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+REVOCATION_SYNC_SECONDS = float(os.getenv("AUTH_REVOCATION_SYNC_SECONDS", "5"))
+# Độ lệch đồng hồ tối đa giữa các worker: mỗi lần đồng bộ đọc lùi thêm bấy nhiêu giây so với lần trước
+REVOCATION_CLOCK_SKEW_SECONDS = float(os.getenv("AUTH_REVOCATION_CLOCK_SKEW_SECONDS", "60"))
+
+# Đổi BCRYPT_ROUNDS thì các hash cũ sẽ được hash lại khi user đăng nhập (needs_update)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    # jti để thu hồi từng token, iat để thu hồi mọi token cũ của một user
+    to_encode.update({"exp": expire, "jti": secrets.token_urlsafe(16)})
+    to_encode.setdefault("iat", int(time.time()))
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def user_claims(user: dict) -> dict:
+    """Thông tin user gọn đi kèm token để các endpoint không phải đọc collection users."""
+    return {
+        "sub": str(user["_id"]),
+        "username": user.get("username"),
+        "verified": user.get("is_email_verified", False),
+        "role": user.get("role", "user"),
+        # Phiên bản token của user, tăng mỗi lần thu hồi mọi token (TokenRevocations.revoke_user)
+        "tv": user.get("token_version", 0),
+    }
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Chạy bcrypt trong thread/process pool để không chặn event loop.
+    Số phép hash chạy đồng thời bị giới hạn bởi số worker; các request còn lại chờ ở semaphore.
+    """
+    def __init__(self, workers: int, use_processes: bool = False):
+        self.workers = workers
+        self.use_processes = use_processes
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(workers)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, func, *args):
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+            registry.observe("password_hash_duration_seconds", {"operation": func.__name__}, time.perf_counter() - start)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str):
+        """Trả về (hợp lệ, hash mới hoặc None nếu không cần hash lại)."""
+        return await self._run(verify_and_update_password, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "completed": self.completed,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1))),
+    use_processes=os.getenv("PASSWORD_HASH_EXECUTOR", "thread") == "process",
+)
+
+@dataclass(frozen=True)
+class UserContext:
+    id: str
+    username: Optional[str]
+    is_email_verified: bool
+    role: str
+    token_id: Optional[str]
+    issued_at: int
+    expires_at: int
+    token_version: int = 0
+
+
+def get_revocation_collection():
+    return collection("revoked_tokens", PRIMARY)
+
+
+class TokenRevocations:
+    """
+    Danh sách token bị thu hồi: từng token theo jti (logout) hoặc mọi token của user có phiên bản token (claim tv)
+    cũ hơn token_version hiện tại của user (đổi mật khẩu). So sánh số phiên bản thay vì iat nên không phụ thuộc
+    đồng hồ của các worker. Ghi vào Mongo (TTL) và giữ bản sao trong bộ nhớ;
+    worker ghi thấy ngay, các worker khác thấy sau tối đa REVOCATION_SYNC_SECONDS.
+    created_at do worker ghi đặt theo đồng hồ của nó, nên mỗi lần đồng bộ đọc chồng lên lần trước một khoảng
+    overlap; áp dụng lại một bản ghi đã thấy không đổi gì.
+    """
+    def __init__(self, sync_seconds: float, clock_skew_seconds: float = REVOCATION_CLOCK_SKEW_SECONDS):
+        self.sync_seconds = sync_seconds
+        self.overlap = timedelta(seconds=2 * sync_seconds + clock_skew_seconds)
+        self.revoked_ids = {}   # jti -> exp
+        self.min_version = {}   # user_id -> token_version tối thiểu còn hợp lệ
+        self.not_before = {}    # user_id -> iat tối thiểu, chỉ từ bản ghi thu hồi cũ (trước khi có token_version)
+        self._last_sync = None
+        self._task = None
+
+    def is_revoked(self, context: UserContext) -> bool:
+        if context.token_id and context.token_id in self.revoked_ids:
+            return True
+        if context.token_version < self.min_version.get(context.id, 0):
+            return True
+        return context.issued_at < self.not_before.get(context.id, 0)
+
+    def _apply(self, entry: dict):
+        user_id = entry.get("user_id")
+        if entry["kind"] == "token":
+            self.revoked_ids[entry["_id"]] = entry["expires_at"]
+        elif "min_version" in entry:
+            self.min_version[user_id] = max(self.min_version.get(user_id, 0), entry["min_version"])
+        else:
+            self.not_before[user_id] = max(self.not_before.get(user_id, 0), entry["not_before"])
+
+    async def _save(self, entry: dict):
+        self._apply(entry)
+        await get_revocation_collection().replace_one({"_id": entry["_id"]}, entry, upsert=True)
+
+    async def revoke_token(self, context: UserContext):
+        if not context.token_id:
+            return
+        await self._save({
+            "_id": context.token_id,
+            "kind": "token",
+            "user_id": context.id,
+            "expires_at": datetime.utcfromtimestamp(context.expires_at),
+            "created_at": datetime.utcnow(),
+        })
+
+    async def revoke_user(self, user_id: str) -> Optional[dict]:
+        """
+        Thu hồi mọi token của user bằng cách tăng token_version trên document user.
+        Trả về document user sau khi tăng; token mới phát hành từ đó (user_claims) mang phiên bản mới.
+        """
+        now = datetime.utcnow()
+        user = await get_user_collection().find_one_and_update(
+            {"_id": ObjectId(user_id)},
+            {"$inc": {"token_version": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if user is None:
+            return None
+        await self._save({
+            "_id": f"user:{user_id}",
+            "kind": "user",
+            "user_id": user_id,
+            "min_version": user["token_version"],
+            "expires_at": now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+            "created_at": now,
+        })
+        return user
+
+    async def sync(self):
+        query = {} if self._last_sync is None else {"created_at": {"$gte": self._last_sync - self.overlap}}
+        self._last_sync = datetime.utcnow()
+        async for entry in get_revocation_collection().find(query):
+            self._apply(entry)
+        now = datetime.utcnow()
+        self.revoked_ids = {jti: exp for jti, exp in self.revoked_ids.items() if exp > now}
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error syncing revoked tokens: {str(e)}")
+            await asyncio.sleep(self.sync_seconds)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class TokenCache:
+    """LRU các token đã giải mã và kiểm tra chữ ký, giữ đến khi token hết hạn."""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[UserContext]:
+        context = self._data.get(token)
+        if context is None:
+            self.misses += 1
+            return None
+        if context.expires_at <= time.time():
+            del self._data[token]
+            self.misses += 1
+            return None
+        self._data.move_to_end(token)
+        self.hits += 1
+        return context
+
+    def set(self, token: str, context: UserContext):
+        self._data[token] = context
+        self._data.move_to_end(token)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+
+token_revocations = TokenRevocations(REVOCATION_SYNC_SECONDS)
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+
+def decode_token(token: str) -> UserContext:
+    context = token_cache.get(token)
+    if context is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid token")
         sender_id: str = payload.get("sub")
         if sender_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication")
-        return sender_id
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        context = UserContext(
+            id=sender_id,
+            username=payload.get("username"),
+            is_email_verified=payload.get("verified", False),
+            role=payload.get("role", "user"),
+            token_id=payload.get("jti"),
+            issued_at=payload.get("iat", 0),
+            expires_at=payload.get("exp", 0),
+            token_version=payload.get("tv", 0),
+        )
+        token_cache.set(token, context)
+    if token_revocations.is_revoked(context):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return context
+
+# Các dependency là async để chạy trên event loop: decode_token dùng chung token_cache (OrderedDict) và
+# token_revocations, không an toàn khi FastAPI chạy dependency def thường song song trong threadpool
+async def get_current_user_context(token: str = Depends(oauth2_scheme)) -> UserContext:
+    return decode_token(token)
+
+async def get_current_user(context: UserContext = Depends(get_current_user_context)) -> str:
+    return context.id
+
+def require_role(*roles: str):
+    """Dependency chỉ cho phép user có role nằm trong roles (role lấy từ token, gán trong collection users)."""
+    async def dependency(context: UserContext = Depends(get_current_user_context)) -> UserContext:
+        if context.role not in roles:
+            raise HTTPException(status_code=403, detail="Not enough permissions")
+        return context
+    return dependency
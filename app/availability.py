@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+from pymongo.errors import OperationFailure
+
+from app.database import CATALOG, PRIMARY, collection
+
+logger = logging.getLogger(__name__)
+
+# Ngày bị thay đổi được gom lại và tính lại mỗi AVAILABILITY_FLUSH_SECONDS, thay vì một aggregation mỗi lần giữ ghế
+FLUSH_SECONDS = float(os.getenv("AVAILABILITY_FLUSH_SECONDS", "2"))
+# Số ngày tối đa trong một lần tính lại (số nhánh $or của $match)
+FLUSH_BATCH_DAYS = 500
+CALENDAR_MAX_DAYS = 90
+
+VIEW = "route_availability"
+
+
+def get_availability_collection(workload: str = CATALOG):
+    return collection(VIEW, workload)
+
+
+def day_key(route_id: str, day: date) -> str:
+    # _id = "<route_id>:<YYYY-MM-DD>": lịch của một route là một khoảng liên tục trên index _id
+    return f"{route_id}:{day.isoformat()}"
+
+
+def day_start(value) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def summary_pipeline(match: dict, stamp: datetime) -> List[dict]:
+    """
+    Gom các chuyến xe khớp match theo (route_id, ngày khởi hành): số chuyến, tổng ghế, ghế còn trống
+    (bộ đếm available_seats) và danh sách giờ khởi hành + bộ đếm ghế của từng chuyến để tính giá "từ".
+    """
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "route_id": "$route_id",
+                "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$departure_time"}},
+            },
+            "departures": {"$sum": 1},
+            "capacity": {"$sum": "$capacity"},
+            "available_seats": {"$sum": {"$ifNull": ["$available_seats", 0]}},
+            "first_departure": {"$min": "$departure_time"},
+            "trips": {"$push": {
+                "departure_time": "$departure_time",
+                "capacity": "$capacity",
+                "available_seats": {"$ifNull": ["$available_seats", 0]},
+                "held_seats": {"$ifNull": ["$held_seats", 0]},
+                "sold_seats": {"$ifNull": ["$sold_seats", 0]},
+            }},
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.route_id", ":", "$_id.date"]},
+            "route_id": "$_id.route_id",
+            "date": "$_id.date",
+            "departures": 1,
+            "capacity": 1,
+            "available_seats": 1,
+            "first_departure": 1,
+            "trips": 1,
+            "updated_at": {"$literal": stamp},
+        }},
+    ]
+
+
+async def days_with_departures(match: dict) -> Set[str]:
+    """_id (day_key) của các (route, ngày) còn ít nhất một chuyến khớp match, đọc lại từ buses trên primary."""
+    rows = await collection("buses", PRIMARY).aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"$concat": [
+            "$route_id", ":", {"$dateToString": {"format": "%Y-%m-%d", "date": "$departure_time"}}
+        ]}}},
+    ]).to_list(length=None)
+    return {row["_id"] for row in rows}
+
+
+class AvailabilityView:
+    """
+    Bảng tổng hợp route_availability, mỗi document là một (route, ngày): số chuyến, ghế còn trống, giờ khởi hành.
+    Ghi vào bus/ghế chỉ đánh dấu xe hoặc ngày bị ảnh hưởng (mark_bus/mark_day); vòng nền tính lại đúng các ngày đó
+    bằng một aggregation $merge trên buses (index route_id_departure_time_id) mỗi FLUSH_SECONDS.
+    rebuild() tính lại toàn bộ bằng cùng pipeline và xóa các ngày không còn chuyến nào (xét lại trên buses).
+    """
+    def __init__(self, flush_seconds: float):
+        self.flush_seconds = flush_seconds
+        self.flushes = 0
+        self.days_refreshed = 0
+        self._buses: Set[str] = set()
+        self._days: Set[Tuple[str, date]] = set()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def mark_bus(self, bus_id: str):
+        self._buses.add(bus_id)
+
+    def mark_day(self, route_id: str, departure_time: datetime):
+        self._days.add((route_id, departure_time.date()))
+
+    def pending(self) -> int:
+        return len(self._buses) + len(self._days)
+
+    async def _write(self, pipeline: List[dict]):
+        """Ghi kết quả pipeline vào view bằng $merge; server cũ hoặc driver không có $merge thì ghi bằng bulk_write."""
+        buses = collection("buses", PRIMARY)
+        try:
+            await buses.aggregate(pipeline + [
+                {"$merge": {"into": VIEW, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+            ]).to_list(length=None)
+            return
+        except (OperationFailure, NotImplementedError) as e:
+            # $merge cần MongoDB 4.2 (mongomock cũng chưa hỗ trợ)
+            logger.debug(f"$merge unavailable ({e}), writing availability with bulk_write")
+        rows = await buses.aggregate(pipeline).to_list(length=None)
+        if rows:
+            await get_availability_collection(PRIMARY).bulk_write(
+                [ReplaceOne({"_id": row["_id"]}, row, upsert=True) for row in rows], ordered=False
+            )
+
+    async def _refresh(self, days: List[Tuple[str, date]]):
+        stamp = datetime.utcnow()
+        match = {"$or": [
+            {"route_id": route_id,
+             "departure_time": {"$gte": day_start(day), "$lt": day_start(day) + timedelta(days=1)}}
+            for route_id, day in days
+        ]}
+        await self._write(summary_pipeline(match, stamp))
+        # Ngày không còn chuyến nào không có dòng kết quả nên phải xóa. Xét lại buses thay vì so updated_at:
+        # stamp theo đồng hồ từng worker, một worker khác ghi muộn hơn với stamp cũ hơn sẽ bị xóa nhầm
+        present = await days_with_departures(match)
+        empty = [key for key in (day_key(route_id, day) for route_id, day in days) if key not in present]
+        if empty:
+            await get_availability_collection(PRIMARY).delete_many({"_id": {"$in": empty}})
+
+    async def flush(self):
+        """Tính lại các ngày đã bị đánh dấu từ lần flush trước."""
+        if not self._buses and not self._days:
+            return
+        async with self._lock:
+            bus_ids, self._buses = self._buses, set()
+            days, self._days = self._days, set()
+            object_ids = [ObjectId(bus_id) for bus_id in bus_ids if ObjectId.is_valid(bus_id)]
+            if object_ids:
+                async for bus in collection("buses", PRIMARY).find(
+                    {"_id": {"$in": object_ids}}, {"route_id": 1, "departure_time": 1}
+                ):
+                    days.add((bus["route_id"], bus["departure_time"].date()))
+            days = sorted(days)
+            try:
+                for i in range(0, len(days), FLUSH_BATCH_DAYS):
+                    await self._refresh(days[i:i + FLUSH_BATCH_DAYS])
+            except Exception:
+                # Giữ lại để lần flush sau thử lại
+                self._days.update(days)
+                raise
+            self.flushes += 1
+            self.days_refreshed += len(days)
+
+    async def rebuild(self, since: Optional[datetime] = None) -> int:
+        """
+        Tính lại toàn bộ view (hoặc các chuyến từ since trở đi) bằng một aggregation $merge,
+        rồi xóa các ngày không còn chuyến nào trong buses. Trả về số (route, ngày) trong view sau khi rebuild.
+        """
+        stamp = datetime.utcnow()
+        match = {} if since is None else {"departure_time": {"$gte": day_start(since)}}
+        view = get_availability_collection(PRIMARY)
+        async with self._lock:
+            await self._write(summary_pipeline(match, stamp))
+            # Như _refresh: xóa theo các ngày không còn chuyến trong buses, không theo updated_at
+            present = await days_with_departures(match)
+            scope = {} if since is None else {"first_departure": {"$gte": day_start(since)}}
+            empty = [row["_id"] async for row in view.find(scope, {"_id": 1}) if row["_id"] not in present]
+            for i in range(0, len(empty), FLUSH_BATCH_DAYS):
+                await view.delete_many({"_id": {"$in": empty[i:i + FLUSH_BATCH_DAYS]}})
+        count = await get_availability_collection(PRIMARY).count_documents({})
+        logger.info(f"Rebuilt {VIEW}: {count} route days")
+        return count
+
+    async def calendar(self, route_id: str, start: date, days: int) -> List[dict]:
+        """Các ngày có chuyến của một route trong [start, start + days), bằng một lần đọc theo khoảng _id."""
+        end = start + timedelta(days=days)
+        return await get_availability_collection().find(
+            {"_id": {"$gte": day_key(route_id, start), "$lt": day_key(route_id, end)}}
+        ).sort("_id", 1).to_list(length=None)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refreshing route availability: {str(e)}")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error refreshing route availability on shutdown: {str(e)}")
+
+
+availability_view = AvailabilityView(FLUSH_SECONDS)
+
+
+if __name__ == "__main__":
+    # python -m app.availability                      -> dựng lại toàn bộ route_availability
+    # python -m app.availability --since 2026-01-01   -> chỉ các ngày từ --since
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--since", type=date.fromisoformat)
+    args = parser.parse_args()
+    asyncio.run(availability_view.rebuild(args.since))
@@ -0,0 +1,139 @@
+import asyncio
+import copy
+import os
+import time
+from collections import OrderedDict
+
+import bson
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory | redis
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemoryBackend:
+    """LRU trong tiến trình, mỗi key có thời hạn riêng."""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    async def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        # Handler sửa trực tiếp dict trả về nên luôn trả bản sao
+        return copy.deepcopy(value)
+
+    async def set(self, key: str, value, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, copy.deepcopy(value))
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    async def delete_prefix(self, prefix: str):
+        for key in [key for key in self._data if key.startswith(prefix)]:
+            del self._data[key]
+
+
+class RedisBackend:
+    """
+    Backend dùng chung giữa các worker, nhận bất kỳ client nào có API của redis.asyncio
+    (ví dụ fakeredis.aioredis.FakeRedis khi chạy local). Giá trị được mã hóa BSON để giữ ObjectId/datetime.
+    """
+    def __init__(self, client, namespace: str = "vexekhach:"):
+        self.client = client
+        self.namespace = namespace
+
+    async def get(self, key: str):
+        raw = await self.client.get(self.namespace + key)
+        if raw is None:
+            return None
+        return bson.decode(raw)["v"]
+
+    async def set(self, key: str, value, ttl: float):
+        await self.client.set(self.namespace + key, bson.encode({"v": value}), px=int(ttl * 1000))
+
+    async def delete(self, key: str):
+        await self.client.delete(self.namespace + key)
+
+    async def delete_prefix(self, prefix: str):
+        keys = [key async for key in self.client.scan_iter(match=self.namespace + prefix + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+class Cache:
+    """
+    Read-through cache: get_or_load trả về giá trị trong cache, nếu không có thì gọi loader.
+    Các request cùng miss một key trong lúc loader đang chạy sẽ chờ chung một kết quả.
+    Giá trị None không được cache.
+    """
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def get_or_load(self, key: str, loader, ttl: float = None):
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if key in self._inflight:
+            self.coalesced += 1
+            return copy.deepcopy(await asyncio.shield(self._inflight[key]))
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+            if value is not None:
+                await self.backend.set(key, value, ttl or self.ttl)
+            # Người gọi có thể sửa value ngay, nên các request đang chờ nhận bản sao riêng
+            future.set_result(copy.deepcopy(value))
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Tránh cảnh báo "exception was never retrieved" khi không có ai chờ
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        return value
+
+    async def invalidate(self, prefix: str):
+        await self.backend.delete_prefix(prefix)
+
+    async def delete(self, key: str):
+        await self.backend.delete(key)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+
+def build_backend():
+    if CACHE_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+        return RedisBackend(redis.from_url(REDIS_URL))
+    return MemoryBackend(CACHE_MAX_ENTRIES)
+
+
+cache = Cache(build_backend(), CACHE_TTL_SECONDS)
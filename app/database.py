@@ -1,20 +1,132 @@
+import asyncio
+import logging
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import uri_parser
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 from dotenv import load_dotenv
 
+from app.metrics import command_listener
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB = os.getenv("MONGO_DB")
 
-print(f"Connecting to MongoDB: {MONGO_URI}")
 
-try:
-    client = AsyncIOMotorClient(MONGO_URI)
-    db = client[MONGO_DB]
-    print("Kết nối thàng công")
-except Exception as e:
-    print(f"Lỗi {e}")
+def _env_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else None
+
+
+def client_options() -> dict:
+    """
+    Tùy chọn pool/timeout/read preference/write concern/nén của client, đọc từ biến môi trường.
+    Biến không đặt thì dùng mặc định của driver (hoặc tùy chọn trong MONGO_URI).
+    Mỗi worker uvicorn có pool riêng: tổng kết nối tới Mongo = số worker x MONGO_MAX_POOL_SIZE.
+    """
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE"),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE"),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS"),
+        "maxConnecting": _env_int("MONGO_MAX_CONNECTING"),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS") or 5000,
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS"),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS") or 5000,
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE"),
+        "w": os.getenv("MONGO_WRITE_CONCERN"),
+        "wTimeoutMS": _env_int("MONGO_WRITE_TIMEOUT_MS"),
+        "appname": os.getenv("MONGO_APP_NAME", "vexekhach"),
+    }
+    if options["w"] is not None and options["w"].isdigit():
+        options["w"] = int(options["w"])
+    journal = os.getenv("MONGO_JOURNAL")
+    if journal:
+        options["journal"] = journal.lower() == "true"
+    # zstd cần gói zstandard, snappy cần python-snappy; driver bỏ qua (kèm cảnh báo) thuật toán chưa cài
+    compressors = os.getenv("MONGO_COMPRESSORS", "zstd,zlib")
+    if compressors:
+        options["compressors"] = compressors
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def _hosts(uri: str) -> str:
+    # Chỉ log host, không log user/mật khẩu trong URI
+    try:
+        return ",".join(f"{host}:{port}" for host, port in uri_parser.parse_uri(uri)["nodelist"])
+    except Exception:
+        return "<invalid uri>"
+
+
+# Tạo client không mở kết nối ngay (driver kết nối lười); kết nối thật được kiểm tra trong connect()
+client = AsyncIOMotorClient(MONGO_URI, event_listeners=[command_listener], **client_options())
+db = client[MONGO_DB]
+
+
+async def connect(attempts: int = 5, delay: float = 2.0):
+    """
+    Ping Mongo khi khởi động (gọi từ lifespan), thử lại vài lần để chờ Mongo trong docker-compose lên.
+    Vẫn không được thì raise để tiến trình không nhận request khi chưa có database.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            await db.command("ping")
+            logger.info(f"Connected to MongoDB at {_hosts(MONGO_URI)}, database {MONGO_DB}")
+            return
+        except Exception as e:
+            if attempt == attempts:
+                raise RuntimeError(f"Cannot connect to MongoDB at {_hosts(MONGO_URI)}: {e}") from e
+            logger.warning(f"MongoDB not reachable (attempt {attempt}/{attempts}): {e}")
+            await asyncio.sleep(delay)
+
+
+def close():
+    """Đóng pool kết nối khi tắt app (gọi cuối lifespan, sau khi các worker nền đã dừng)."""
+    client.close()
+    logger.info("MongoDB client closed")
+
+
+# Định tuyến đọc theo loại workload, cấu hình tập trung tại đây. Module lấy collection qua
+# collection(name, workload) thay vì db[name] để mỗi endpoint đọc đúng nơi:
+# - PRIMARY: đọc ngay sau khi ghi (create_route/create_bus đọc lại), giữ/bán ghế, đăng nhập, đối soát
+# - CATALOG: duyệt route/chuyến xe và tìm chuyến, đọc từ secondary, chấp nhận trễ tối đa max_staleness giây
+#   (số ghế trống hiển thị có thể cũ, nhưng giữ ghế luôn kiểm tra lại trên primary)
+PRIMARY = "primary"
+CATALOG = "catalog"
+
+READ_ROUTING = {
+    PRIMARY: {"mode": "primary"},
+    CATALOG: {
+        "mode": os.getenv("MONGO_CATALOG_READ_PREFERENCE", "secondaryPreferred"),
+        # Driver yêu cầu tối thiểu 90 giây
+        "max_staleness": int(os.getenv("MONGO_CATALOG_MAX_STALENESS_SECONDS", "90")),
+    },
+}
+
+_READ_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def read_preference(workload: str):
+    routing = READ_ROUTING[workload]
+    mode = _READ_MODES[routing["mode"]]
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=routing.get("max_staleness", -1))
+
+
+def collection(name: str, workload: str = PRIMARY):
+    """Collection với read preference của workload; trên server đơn lẻ mọi workload đều đọc từ primary."""
+    return db.get_collection(name, read_preference=read_preference(workload))
+
 
 def get_user_collection():
-    return db["users"]
+    return collection("users")
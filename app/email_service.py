@@ -1,73 +1,334 @@
 import os
+import asyncio
 import smtplib
+import time
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 import logging
+from typing import List, Tuple
+
+from app.database import PRIMARY, collection
+from app.metrics import registry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
+
+# Trạng thái của một email trong outbox
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def get_outbox_collection():
+    return collection("email_outbox", PRIMARY)
+
+
+class SMTPConnectionPool:
+    """
+    Giữ lại các kết nối SMTP đã STARTTLS + login để dùng lại giữa các email.
+    Mọi thao tác mạng đều blocking nên được gọi qua asyncio.to_thread.
+    """
+    def __init__(self, server: str, port: int, username: str, password: str, use_starttls: bool, size: int):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_starttls = use_starttls
+        self.size = size
+        self._idle = []
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.server, self.port, timeout=30)
+        if self.use_starttls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+
+    async def acquire(self) -> smtplib.SMTP:
+        if self._idle:
+            return self._idle.pop()
+        return await asyncio.to_thread(self._connect)
+
+    def release(self, connection: smtplib.SMTP):
+        if len(self._idle) < self.size:
+            self._idle.append(connection)
+        else:
+            self.discard(connection)
+
+    def discard(self, connection: smtplib.SMTP):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        while self._idle:
+            connection = self._idle.pop()
+            try:
+                await asyncio.to_thread(connection.quit)
+            except Exception:
+                self.discard(connection)
+
+
 class EmailService:
     def __init__(self):
         self.smtp_server = os.getenv("SMTP_SERVER")
-        self.smtp_port = int(os.getenv("SMTP_PORT"))
+        self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
         self.smtp_username = os.getenv("SMTP_USERNAME")
         self.smtp_password = os.getenv("SMTP_PASSWORD")
+        self.smtp_starttls = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
         self.from_email = os.getenv("FROM_EMAIL")
 
         self.base_url = os.getenv("BASE_URL", "http://localhost:8000")
 
+        # Cấu hình hàng đợi gửi mail
+        self.queue_size = int(os.getenv("EMAIL_QUEUE_SIZE", "1000"))
+        self.worker_count = int(os.getenv("EMAIL_WORKERS", "2"))
+        self.max_attempts = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+        self.retry_base_seconds = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "5"))
+        self.poll_seconds = float(os.getenv("EMAIL_POLL_SECONDS", "30"))
+        # Email đã gửi/bỏ cuộc được giữ lại bấy nhiêu ngày rồi Mongo tự xóa (TTL trên expires_at)
+        self.retention = timedelta(days=float(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", "7")))
+
+        self.pool = SMTPConnectionPool(
+            self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password,
+            self.smtp_starttls, self.worker_count
+        )
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = []
+
+    async def start(self):
+        """Khởi động worker gửi mail và vòng lặp quét outbox (gọi từ lifespan)."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        self._tasks.append(asyncio.create_task(self._poll_outbox()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.pool.close()
+
+    @staticmethod
+    def _outbox_document(to_email: str, subject: str, body: str, now: datetime) -> dict:
+        return {
+            "to_email": to_email,
+            "subject": subject,
+            "body": body,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+
+    def _push(self, email_id, to_email: str) -> bool:
+        try:
+            self.queue.put_nowait(email_id)
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Email queue full, {to_email} will be sent from the outbox")
+            return False
+
+    async def enqueue(self, to_email: str, subject: str, body: str) -> bool:
+        """
+        Lưu email vào outbox rồi đẩy vào hàng đợi, không chờ SMTP.
+        Nếu hàng đợi đầy, email vẫn nằm trong outbox và sẽ được vòng quét gửi sau.
+        """
+        result = await get_outbox_collection().insert_one(
+            self._outbox_document(to_email, subject, body, datetime.utcnow())
+        )
+        self._push(result.inserted_id, to_email)
+        return True
+
+    async def enqueue_many(self, emails: List[Tuple[str, str, str]]) -> int:
+        """Như enqueue cho nhiều email (to_email, subject, body) với một lệnh insert_many."""
+        if not emails:
+            return 0
+        now = datetime.utcnow()
+        result = await get_outbox_collection().insert_many(
+            [self._outbox_document(to_email, subject, body, now) for to_email, subject, body in emails]
+        )
+        for email_id, (to_email, _, _) in zip(result.inserted_ids, emails):
+            if not self._push(email_id, to_email):
+                # Phần còn lại đã nằm trong outbox
+                break
+        return len(result.inserted_ids)
+
+    def verification_email(self, to_email: str, verification_token: str) -> Tuple[str, str, str]:
+        verification_url = f"{self.base_url}/users/verify-email?token={verification_token}"
+        body = f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
+            <p>Hello {to_email.split('@')[0]},</p>
+
+            <p>Thank you for signing up for VeXeKhach. To complete your registration, please verify your email address by clicking the button below:</p>
+
+            <p style="text-align: center;">
+                <a href="{verification_url}" style="display: inline-block; padding: 10px 20px; font-size: 16px; color: #fff; background-color: #007bff; text-decoration: none; border-radius: 5px;">
+                    Verify Email
+                </a>
+            </p>
+
+            <p>Or copy and paste the following link into your browser:</p>
+            <p><a href="{verification_url}">{verification_url}</a></p>
+
+            <p>This link will expire in 24 hours.</p>
+
+            <p>If you did not request this, please ignore this email.</p>
+
+            <p>Best regards,</p>
+            <p><strong>VeXeKhach Team</strong></p>
+        </body>
+        </html>
+        """
+        return to_email, "Verify Your VeXeKhach Account", body
+
     async def send_verification_email(self, to_email: str, verification_token: str) -> bool:
         try:
-            msg = MIMEMultipart()
-            msg['From'] = f"VeXeKhach <{self.from_email}>"
-            msg['To'] = to_email
-            msg['Subject'] = "Verify Your VeXeKhach Account"
-
-            # Create email content using base_url
-            verification_url = f"{self.base_url}/users/verify-email?token={verification_token}"
-            body = f"""
-            <html>
-            <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
-                <p>Hello {to_email.split('@')[0]},</p>
-                
-                <p>Thank you for signing up for VeXeKhach. To complete your registration, please verify your email address by clicking the button below:</p>
-                
-                <p style="text-align: center;">
-                    <a href="{verification_url}" style="display: inline-block; padding: 10px 20px; font-size: 16px; color: #fff; background-color: #007bff; text-decoration: none; border-radius: 5px;">
-                        Verify Email
-                    </a>
-                </p>
-
-                <p>Or copy and paste the following link into your browser:</p>
-                <p><a href="{verification_url}">{verification_url}</a></p>
-                
-                <p>This link will expire in 24 hours.</p>
-                
-                <p>If you did not request this, please ignore this email.</p>
-                
-                <p>Best regards,</p>
-                <p><strong>VeXeKhach Team</strong></p>
-            </body>
-            </html>
-            """
-            
-            msg.attach(MIMEText(body, 'html'))
-
-            # Connect and send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
-
-            logger.info(f"Verification email successfully sent to {to_email}")
+            await self.enqueue(*self.verification_email(to_email, verification_token))
+            logger.info(f"Verification email queued for {to_email}")
             return True
         except Exception as e:
-            logger.error(f"Error sending email to {to_email}: {str(e)}")
+            logger.error(f"Error queueing email to {to_email}: {str(e)}")
             return False
 
+    def _build_message(self, email: dict) -> MIMEMultipart:
+        msg = MIMEMultipart()
+        msg['From'] = f"VeXeKhach <{self.from_email}>"
+        msg['To'] = email["to_email"]
+        msg['Subject'] = email["subject"]
+        msg.attach(MIMEText(email["body"], 'html'))
+        return msg
+
+    async def _deliver(self, email: dict):
+        start = time.perf_counter()
+        try:
+            await self._send(email)
+        except Exception:
+            registry.observe("smtp_send_duration_seconds", {"result": "error"}, time.perf_counter() - start)
+            raise
+        registry.observe("smtp_send_duration_seconds", {"result": "ok"}, time.perf_counter() - start)
+
+    async def _send(self, email: dict):
+        msg = self._build_message(email)
+        connection = await self.pool.acquire()
+        try:
+            await asyncio.to_thread(connection.send_message, msg)
+        except smtplib.SMTPServerDisconnected:
+            # Kết nối trong pool đã bị server đóng, mở kết nối mới và thử lại một lần
+            self.pool.discard(connection)
+            connection = await self.pool.acquire()
+            try:
+                await asyncio.to_thread(connection.send_message, msg)
+            except Exception:
+                self.pool.discard(connection)
+                raise
+        except Exception:
+            self.pool.discard(connection)
+            raise
+        self.pool.release(connection)
+
+    async def _process(self, email_id):
+        outbox = get_outbox_collection()
+        # Claim email để không worker/tiến trình nào khác gửi trùng
+        email = await outbox.find_one_and_update(
+            {"_id": email_id, "status": PENDING},
+            {"$set": {"status": SENDING, "claimed_at": datetime.utcnow()}}
+        )
+        if not email:
+            return
+
+        try:
+            await self._deliver(email)
+        except Exception as e:
+            attempts = email["attempts"] + 1
+            if attempts >= self.max_attempts:
+                status = FAILED
+                logger.error(f"Giving up on email to {email['to_email']} after {attempts} attempts: {str(e)}")
+            else:
+                status = PENDING
+                logger.warning(f"Error sending email to {email['to_email']} (attempt {attempts}): {str(e)}")
+            delay = self.retry_base_seconds * 2 ** (attempts - 1)
+            now = datetime.utcnow()
+            update = {
+                "status": status,
+                "attempts": attempts,
+                "last_error": str(e),
+                "next_attempt_at": now + timedelta(seconds=delay),
+            }
+            if status == FAILED:
+                update.update({"finished_at": now, "expires_at": now + self.retention})
+            await outbox.update_one({"_id": email_id}, {"$set": update})
+            return
+
+        now = datetime.utcnow()
+        await outbox.update_one(
+            {"_id": email_id},
+            {"$set": {"status": SENT, "sent_at": now, "finished_at": now, "expires_at": now + self.retention},
+             "$inc": {"attempts": 1}}
+        )
+        logger.info(f"Email successfully sent to {email['to_email']}")
+
+    async def backfill_expiry(self):
+        """Gắn expires_at cho email đã gửi/bỏ cuộc từ trước khi có TTL, để index TTL dọn cả các bản ghi cũ."""
+        outbox = get_outbox_collection()
+        count = 0
+        async for email in outbox.find(
+            {"status": {"$in": [SENT, FAILED]}, "expires_at": {"$exists": False}},
+            {"sent_at": 1, "next_attempt_at": 1, "created_at": 1},
+        ):
+            finished_at = email.get("sent_at") or email.get("next_attempt_at") or email.get("created_at")
+            finished_at = finished_at or datetime.utcnow()
+            await outbox.update_one(
+                {"_id": email["_id"]},
+                {"$set": {"finished_at": finished_at, "expires_at": finished_at + self.retention}},
+            )
+            count += 1
+        if count:
+            logger.info(f"Set outbox expiry on {count} finished emails")
+
+    async def _worker(self):
+        while True:
+            email_id = await self.queue.get()
+            try:
+                await self._process(email_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Email worker error: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    async def _poll_outbox(self):
+        """Nạp lại email còn chờ (sau khi khởi động lại, khi hàng đợi đầy, hoặc đến lượt retry)."""
+        outbox = get_outbox_collection()
+        while True:
+            try:
+                now = datetime.utcnow()
+                # Email kẹt ở trạng thái sending quá lâu (tiến trình bị tắt giữa chừng) được đưa về pending
+                await outbox.update_many(
+                    {"status": SENDING, "claimed_at": {"$lt": now - timedelta(minutes=10)}},
+                    {"$set": {"status": PENDING}}
+                )
+                free_slots = self.queue.maxsize - self.queue.qsize()
+                if free_slots > 0:
+                    cursor = outbox.find(
+                        {"status": PENDING, "next_attempt_at": {"$lte": now}}, {"_id": 1}
+                    ).sort("next_attempt_at", 1).limit(free_slots)
+                    async for email in cursor:
+                        self.queue.put_nowait(email["_id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error polling email outbox: {str(e)}")
+            await asyncio.sleep(self.poll_seconds)
+
 
 # Khởi tạo service
-email_service = EmailService() 
\ No newline at end of file
+email_service = EmailService()
@@ -0,0 +1,62 @@
+import csv
+import io
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, List
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+# Số document lấy mỗi lần từ Mongo và cũng là số dòng ghi ra mỗi chunk của response
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_rows(rows: List[dict], columns: List[str], fmt: str) -> bytes:
+    if fmt == "ndjson":
+        return b"".join(
+            orjson.dumps({column: row.get(column) for column in columns}, default=str) + b"\n" for row in rows
+        )
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([[_csv_value(row.get(column)) for column in columns] for row in rows])
+    return buffer.getvalue().encode()
+
+
+async def stream_rows(cursor, columns: List[str], fmt: str,
+                      transform: Callable[[List[dict]], Awaitable[List[dict]]]):
+    """
+    Đọc cursor theo từng lô EXPORT_BATCH_SIZE, biến đổi và mã hóa cả lô thành một chunk.
+    Bộ nhớ chỉ giữ một lô tại một thời điểm, bất kể kết quả lớn tới đâu.
+    """
+    if fmt == "csv":
+        # Header đi ra ngay, trước khi Mongo trả lô đầu tiên
+        yield encode_rows([{column: column for column in columns}], columns, fmt)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) == EXPORT_BATCH_SIZE:
+            yield encode_rows(await transform(batch), columns, fmt)
+            batch = []
+    if batch:
+        yield encode_rows(await transform(batch), columns, fmt)
+
+
+def export_response(cursor, columns: List[str], fmt: str, filename: str,
+                    transform: Callable[[List[dict]], Awaitable[List[dict]]]) -> StreamingResponse:
+    return StreamingResponse(
+        stream_rows(cursor, columns, fmt, transform),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
@@ -0,0 +1,281 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+from starlette.responses import JSONResponse
+
+from app.cache import MemoryBackend
+from app.database import collection
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Response của một key được giữ lại trong thời gian này (client thường retry trong vài phút)
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# Request trùng key với một request đang chạy ở worker khác chờ tối đa chừng này rồi nhận 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# Key đang chạy quá lâu (worker chết giữa chừng) thì request sau được chạy lại
+IDEMPOTENCY_PENDING_SECONDS = int(os.getenv("IDEMPOTENCY_PENDING_SECONDS", "60"))
+POLL_SECONDS = 0.05
+MAX_KEY_LENGTH = 255
+
+HEADER = b"idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+
+# Các endpoint tạo dữ liệu mà client di động hay gửi lại khi mạng chập chờn
+IDEMPOTENT_ROUTES = [
+    ("POST", re.compile(r"^/routes$")),
+    ("POST", re.compile(r"^/buses$")),
+    ("POST", re.compile(r"^/buses/seats/batch$")),
+    ("POST", re.compile(r"^/buses/[^/]+/seats$")),
+]
+
+
+def get_idempotency_collection():
+    return collection("idempotency_keys")
+
+
+def is_idempotent_route(method: str, path: str) -> bool:
+    return any(method == route_method and pattern.match(path) for route_method, pattern in IDEMPOTENT_ROUTES)
+
+
+def request_key(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == HEADER:
+            return value.decode("latin-1").strip()
+    return None
+
+
+def fingerprint(scope, body: bytes) -> str:
+    """Hash của method, path, query và body: cùng key nhưng khác nội dung là lỗi của client."""
+    digest = hashlib.sha256()
+    for part in (scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1")):
+        digest.update(part.encode() + b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _stored(response: dict) -> bool:
+    # Lỗi server và 429 là tạm thời: không lưu để lần retry sau được chạy thật
+    return response["status"] < 500 and response["status"] != 429
+
+
+class IdempotencyStore:
+    """
+    Kết quả của các request có Idempotency-Key: bản ghi trong collection idempotency_keys (TTL) làm chuẩn
+    giữa các worker, thêm cache LRU trong tiến trình phía trước để replay không cần đọc Mongo.
+    Request đầu tiên của một key ghi bản ghi "pending" (insert với _id là key, nên chỉ một worker thắng);
+    các request trùng trong cùng worker chờ chung một future, ở worker khác thì chờ bản ghi chuyển sang "completed".
+    """
+    def __init__(self, cache_size: int):
+        self.cache = MemoryBackend(cache_size)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def _cached(self, key: str) -> Optional[dict]:
+        entry = await self.cache.get(key)
+        if entry is None:
+            entry = await get_idempotency_collection().find_one({"_id": key, "state": "completed"})
+            if entry is None:
+                return None
+            await self.cache.set(key, entry, IDEMPOTENCY_TTL_SECONDS)
+        return entry
+
+    async def _claim(self, key: str, digest: str) -> Optional[dict]:
+        """Ghi bản ghi pending; trả về None nếu request này được chạy, ngược lại bản ghi đang có của key."""
+        now = datetime.utcnow()
+        pending = {
+            "_id": key,
+            "state": "pending",
+            "fingerprint": digest,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=IDEMPOTENCY_PENDING_SECONDS),
+        }
+        try:
+            await get_idempotency_collection().insert_one(pending)
+            return None
+        except DuplicateKeyError:
+            pass
+        entry = await get_idempotency_collection().find_one({"_id": key})
+        if entry is None:
+            # Bản ghi vừa bị xóa (request trước lỗi 5xx): thử lại một lần
+            try:
+                await get_idempotency_collection().insert_one(pending)
+                return None
+            except DuplicateKeyError:
+                return await get_idempotency_collection().find_one({"_id": key}) or pending
+        if entry["state"] == "pending" and entry["expires_at"] <= now:
+            # Worker giữ key đã chết giữa chừng: nhận lại key
+            result = await get_idempotency_collection().replace_one(
+                {"_id": key, "state": "pending", "expires_at": entry["expires_at"]}, pending
+            )
+            if result.modified_count:
+                return None
+        return entry
+
+    async def _wait_completed(self, key: str) -> Optional[dict]:
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(POLL_SECONDS)
+            entry = await get_idempotency_collection().find_one({"_id": key})
+            if entry is None or entry["state"] == "completed":
+                return entry
+        return None
+
+    async def _save(self, key: str, digest: str, response: dict):
+        if not _stored(response):
+            await get_idempotency_collection().delete_one({"_id": key, "state": "pending"})
+            return
+        now = datetime.utcnow()
+        entry = {
+            "_id": key,
+            "state": "completed",
+            "fingerprint": digest,
+            **response,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        }
+        await get_idempotency_collection().replace_one({"_id": key}, entry, upsert=True)
+        await self.cache.set(key, entry, IDEMPOTENCY_TTL_SECONDS)
+
+    async def execute(self, key: str, digest: str, run) -> tuple:
+        """
+        Trả về (kết quả, response) cho một request có key: run() chỉ được gọi khi chưa có response nào
+        của key này và không có request trùng nào đang chạy. kết quả: executed, replayed, collapsed, mismatch, conflict.
+        """
+        entry = await self._cached(key)
+        if entry is not None:
+            return ("mismatch", None) if entry["fingerprint"] != digest else ("replayed", entry)
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            # Request trùng trong cùng worker: chờ kết quả của request đang chạy thay vì đọc Mongo
+            entry = await asyncio.shield(future)
+            if entry is None:
+                return "conflict", None
+            return ("mismatch", None) if entry["fingerprint"] != digest else ("collapsed", entry)
+
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            entry = await self._claim(key, digest)
+            if entry is not None:
+                if entry["fingerprint"] == digest and entry["state"] == "pending":
+                    entry = await self._wait_completed(key)
+                if entry is None or entry["state"] != "completed":
+                    outcome = "conflict", None
+                elif entry["fingerprint"] != digest:
+                    outcome = "mismatch", None
+                else:
+                    await self.cache.set(key, entry, IDEMPOTENCY_TTL_SECONDS)
+                    outcome = "replayed", entry
+                future.set_result(entry)
+                return outcome
+
+            response = await run()
+            response["fingerprint"] = digest
+            try:
+                await self._save(key, digest, response)
+            except Exception as e:
+                # Response đã có, chỉ mất khả năng replay ở worker khác
+                logger.error(f"Error saving idempotent response for {key}: {str(e)}")
+            future.set_result(response)
+            return "executed", response
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Tránh cảnh báo "exception was never retrieved" khi không có request trùng nào chờ
+                future.exception()
+            try:
+                await asyncio.shield(get_idempotency_collection().delete_one({"_id": key, "state": "pending"}))
+            except Exception as cleanup_error:
+                logger.error(f"Error releasing idempotency key {key}: {str(cleanup_error)}")
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_CACHE_SIZE)
+
+
+async def _send(send, response: dict, replayed: bool):
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in response["headers"]]
+    headers.append((b"content-length", str(len(response["body"])).encode()))
+    if replayed:
+        headers.append(REPLAYED_HEADER)
+    await send({"type": "http.response.start", "status": response["status"], "headers": headers})
+    await send({"type": "http.response.body", "body": response["body"]})
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware cho các route trong IDEMPOTENT_ROUTES có header Idempotency-Key:
+    chạy request một lần, lưu response (status, header, body) và trả lại đúng response đó cho mọi lần gửi lại
+    cùng key mà không chạy lại handler. Cùng key khác nội dung -> 422, request trùng đang chạy quá lâu -> 409.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not is_idempotent_route(scope["method"], scope["path"]):
+            return await self.app(scope, receive, send)
+        key = request_key(scope)
+        if key is None:
+            return await self.app(scope, receive, send)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return await JSONResponse({"detail": "Invalid Idempotency-Key"}, status_code=400)(scope, receive, send)
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+
+        async def run() -> dict:
+            delivered = False
+
+            async def replay_body():
+                nonlocal delivered
+                if not delivered:
+                    delivered = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+
+            response = {"status": 500, "headers": [], "body": b""}
+            parts = []
+
+            async def capture(message):
+                if message["type"] == "http.response.start":
+                    response["status"] = message["status"]
+                    response["headers"] = [
+                        (name.decode("latin-1"), value.decode("latin-1")) for name, value in message.get("headers", [])
+                        if name.lower() != b"content-length"
+                    ]
+                elif message["type"] == "http.response.body":
+                    parts.append(message.get("body", b""))
+
+            await self.app(scope, replay_body, capture)
+            response["body"] = b"".join(parts)
+            return response
+
+        scoped_key = f"{scope['method']} {scope['path']} {key}"
+        outcome, response = await idempotency_store.execute(scoped_key, fingerprint(scope, body), run)
+        registry.inc("idempotent_requests_total", {"result": outcome})
+        if outcome == "mismatch":
+            return await JSONResponse(
+                {"detail": "Idempotency-Key was already used with a different request"}, status_code=422
+            )(scope, receive, send)
+        if outcome == "conflict":
+            return await JSONResponse(
+                {"detail": "A request with this Idempotency-Key is still in progress"}, status_code=409,
+                headers={"Retry-After": "1"},
+            )(scope, receive, send)
+        await _send(send, response, replayed=outcome != "executed")
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+# Khai báo index cho từng collection, theo đúng các kiểu truy vấn mà router đang dùng
+INDEXES = {
+    "buses": [
+        # get_buses: lọc theo route_id + khoảng departure_time, phân trang theo (departure_time, _id)
+        IndexModel([("route_id", ASCENDING), ("departure_time", ASCENDING), ("_id", ASCENDING)],
+                   name="route_id_departure_time_id"),
+        # get_buses: chỉ lọc theo ngày khởi hành
+        IndexModel([("departure_time", ASCENDING), ("_id", ASCENDING)], name="departure_time_id"),
+        # Khóa upsert của timetable import: hai lần import cùng file chạy song song không tạo chuyến trùng
+        IndexModel([("route_id", ASCENDING), ("departure_time", ASCENDING), ("bus_number", ASCENDING)],
+                   name="route_id_departure_time_bus_number", unique=True),
+    ],
+    "routes": [
+        # tìm route theo cặp địa điểm không dấu
+        IndexModel([("departure_key", ASCENDING), ("destination_key", ASCENDING)], name="departure_key_destination_key"),
+    ],
+    "seats": [
+        # get_bus_seats / create_bus_seats: lọc theo bus_id, mỗi xe không trùng số ghế
+        IndexModel([("bus_id", ASCENDING), ("seat_number", ASCENDING)], name="bus_id_seat_number", unique=True),
+    ],
+    "seat_holds": [
+        # Hold hết hạn được Mongo tự xóa (TTL)
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "idempotency_keys": [
+        # Response đã lưu của Idempotency-Key tự xóa sau IDEMPOTENCY_TTL_SECONDS (TTL)
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "email_outbox": [
+        # Vòng quét outbox: email pending đã đến lượt gửi
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt_at"),
+        # Email đã gửi/bỏ cuộc tự xóa sau EMAIL_OUTBOX_RETENTION_DAYS (TTL); email pending không có expires_at
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "revoked_tokens": [
+        # Đồng bộ định kỳ các bản ghi thu hồi mới; bản ghi tự xóa khi token liên quan đã hết hạn
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "users": [
+        # login; register_user dựa vào hai index unique để phát hiện trùng ngay khi insert
+        IndexModel([("email", ASCENDING)], name="email", unique=True),
+        IndexModel([("username", ASCENDING)], name="username", unique=True),
+        # verify_email: hash của token còn hạn; hash bị xóa sau khi xác thực nên chỉ index user chưa xác thực
+        IndexModel(
+            [("verification_token_hash", ASCENDING), ("verification_token_expires", ASCENDING)],
+            name="verification_token_hash_expires",
+            partialFilterExpression={"verification_token_hash": {"$type": "string"}},
+        ),
+        # Job purge_unverified_users: token đã hết hạn lâu, cùng điều kiện partial
+        IndexModel(
+            [("verification_token_expires", ASCENDING)],
+            name="verification_token_expires",
+            partialFilterExpression={"verification_token_hash": {"$type": "string"}},
+        ),
+    ],
+    "buses_archive": [
+        # Tra cứu chuyến cũ theo route và ngày sau khi job archive_departed_buses đã chuyển đi
+        IndexModel([("route_id", ASCENDING), ("departure_time", ASCENDING)], name="route_id_departure_time"),
+    ],
+    "seats_archive": [
+        IndexModel([("bus_id", ASCENDING), ("seat_number", ASCENDING)], name="bus_id_seat_number"),
+    ],
+}
+
+# Các truy vấn mẫu dùng cho chế độ kiểm tra (explain), không được phép COLLSCAN
+CANONICAL_QUERIES = [
+    # get_routes: trang tiếp theo theo cursor _id
+    ("routes", {"_id": {"$gt": ObjectId("000000000000000000000000")}}),
+    ("buses", {"route_id": "000000000000000000000000",
+               "departure_time": {"$gte": datetime(2025, 1, 1), "$lte": datetime(2025, 1, 1, 23, 59, 59)}}),
+    ("buses", {"departure_time": {"$gte": datetime(2025, 1, 1), "$lte": datetime(2025, 1, 1, 23, 59, 59)}}),
+    ("seats", {"bus_id": "000000000000000000000000"}),
+    # get_route_calendar: khoảng _id "<route_id>:<ngày>" của route_availability
+    ("route_availability", {"_id": {"$gte": "000000000000000000000000:2025-01-01",
+                                    "$lt": "000000000000000000000000:2025-04-01"}}),
+    ("users", {"email": "check@example.com"}),
+    ("users", {"verification_token_hash": "check", "verification_token_expires": {"$gt": datetime(2025, 1, 1)}}),
+    # Job purge_unverified_users
+    ("users", {"verification_token_hash": {"$type": "string"},
+               "verification_token_expires": {"$lt": datetime(2025, 1, 1)}, "is_email_verified": False}),
+]
+
+
+async def ensure_indexes(database=None) -> List[str]:
+    """
+    Tạo các index đã khai báo. create_indexes là idempotent nên gọi lại mỗi lần khởi động vẫn an toàn.
+    Mỗi index được tạo riêng: một index lỗi (vd. unique trên dữ liệu cũ bị trùng) không chặn các index còn lại.
+    Trả về tên các index tạo lỗi, dạng "<collection>.<index>".
+    """
+    database = database if database is not None else db
+    failures = []
+    for collection_name, models in INDEXES.items():
+        names = []
+        for model in models:
+            name = model.document["name"]
+            try:
+                await database[collection_name].create_indexes([model])
+                names.append(name)
+            except Exception as e:
+                logger.error(f"Cannot create index {name} on {collection_name}: {e}")
+                failures.append(f"{collection_name}.{name}")
+        logger.info(f"Indexes ready on {collection_name}: {', '.join(names)}")
+    return failures
+
+
+def _plan_stages(plan):
+    if not plan:
+        return
+    yield plan.get("stage")
+    # Server dùng SBE bọc plan trong "queryPlan"
+    if "queryPlan" in plan:
+        yield from _plan_stages(plan["queryPlan"])
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for stage in plan.get("inputStages", []):
+        yield from _plan_stages(stage)
+
+
+async def check_indexes(database=None):
+    """Chạy explain() cho từng truy vấn mẫu, trả về danh sách truy vấn vẫn còn COLLSCAN."""
+    database = database if database is not None else db
+    failures = []
+    for collection_name, query in CANONICAL_QUERIES:
+        explain = await database[collection_name].find(query).explain()
+        stages = set(_plan_stages(explain["queryPlanner"]["winningPlan"]))
+        if "COLLSCAN" in stages:
+            logger.error(f"COLLSCAN on {collection_name}: {query}")
+            failures.append((collection_name, query))
+    return failures
+
+
+async def _main(check: bool):
+    if await ensure_indexes():
+        return 1
+    if check:
+        failures = await check_indexes()
+        if failures:
+            return 1
+        logger.info("All canonical queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    # python -m app.indexes          -> tạo index
+    # python -m app.indexes --check  -> tạo index rồi explain, exit code 1 nếu còn COLLSCAN
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main("--check" in sys.argv[1:])))
@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from app import database
+from app.availability import availability_view
+from app.cache import cache
+from app.database import collection, get_user_collection
+from app.metrics import registry
+from app.rate_limit import load_shedder
+from app.reservations import release_expired_holds
+from app.seat_counters import get_bus_collection, reconcile_counters
+from app.seat_store import move_to_archive, seat_store
+
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "1") == "1"
+# Mỗi worker xem job nào đến hạn sau mỗi JOB_TICK_SECONDS; chỉ worker giữ lease của job mới chạy nó
+JOB_TICK_SECONDS = float(os.getenv("JOB_TICK_SECONDS", "30"))
+# Worker chết giữa chừng thì worker khác nhận job sau tối đa chừng này; lease được gia hạn sau mỗi lô
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "500"))
+# Phần thời gian tối đa một job được chạy liên tục: sau lô mất t giây thì nghỉ t * (1 - duty) / duty
+JOB_DUTY_CYCLE = float(os.getenv("JOB_DUTY_CYCLE", "0.25"))
+# Foreground bận (nhóm load shedding đầy quá nửa) thì job nhường, chờ tối đa JOB_BUSY_MAX_WAIT_SECONDS mỗi lô
+JOB_BUSY_PAUSE_SECONDS = 1.0
+JOB_BUSY_MAX_WAIT_SECONDS = float(os.getenv("JOB_BUSY_MAX_WAIT_SECONDS", "30"))
+
+# User chưa xác thực bị xóa khi token xác thực đã hết hạn quá số ngày này
+UNVERIFIED_RETENTION_DAYS = int(os.getenv("UNVERIFIED_RETENTION_DAYS", "7"))
+# Chuyến xe (và ghế) khởi hành quá số ngày này được chuyển sang buses_archive / <seats>_archive
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "7"))
+
+registry.describe("job_duration_seconds", "Background job run time")
+registry.describe("job_rows_total", "Rows processed by background jobs")
+registry.describe("job_runs_total", "Background job runs by result")
+
+
+def get_lease_collection():
+    return collection("job_leases")
+
+
+class LeaseLost(Exception):
+    """Lease của job đã bị worker khác nhận (worker này bị treo lâu hơn JOB_LEASE_SECONDS)."""
+
+
+def foreground_busy() -> bool:
+    return any(load_shedder.in_flight[group] * 2 >= limit for group, limit in load_shedder.limits.items())
+
+
+class Throttle:
+    """
+    Gọi sau mỗi lô của một job: cộng số dòng đã xử lý, nghỉ để job chỉ chiếm JOB_DUTY_CYCLE thời gian,
+    nghỉ thêm khi request foreground đang dồn, và gia hạn lease của job.
+    """
+    def __init__(self, renew: Callable[[], Awaitable[None]]):
+        self.rows = 0
+        self._renew = renew
+        self._batch_started = time.perf_counter()
+
+    async def __call__(self, rows: int):
+        self.rows += rows
+        elapsed = time.perf_counter() - self._batch_started
+        await asyncio.sleep(elapsed * (1 - JOB_DUTY_CYCLE) / JOB_DUTY_CYCLE)
+        waited = 0.0
+        while foreground_busy() and waited < JOB_BUSY_MAX_WAIT_SECONDS:
+            await asyncio.sleep(JOB_BUSY_PAUSE_SECONDS)
+            waited += JOB_BUSY_PAUSE_SECONDS
+        await self._renew()
+        self._batch_started = time.perf_counter()
+
+
+async def purge_unverified_users(throttle: Throttle):
+    """Xóa tài khoản chưa xác thực có token xác thực đã hết hạn quá UNVERIFIED_RETENTION_DAYS."""
+    cutoff = datetime.utcnow() - timedelta(days=UNVERIFIED_RETENTION_DAYS)
+    # Khớp index partial verification_token_expires
+    query = {
+        "verification_token_hash": {"$type": "string"},
+        "verification_token_expires": {"$lt": cutoff},
+        "is_email_verified": False,
+    }
+    users = get_user_collection()
+    while True:
+        page = await users.find(query, {"_id": 1}).limit(JOB_BATCH_SIZE).to_list(length=None)
+        ids = [user["_id"] for user in page]
+        if not ids:
+            return
+        # Lặp lại điều kiện: user xác thực giữa lúc đọc và xóa thì được giữ lại
+        result = await users.delete_many({"_id": {"$in": ids}, **query})
+        await throttle(result.deleted_count)
+        if len(ids) < JOB_BATCH_SIZE:
+            return
+
+
+async def sweep_expired_holds(throttle: Throttle):
+    """
+    Trả về trạng thái trống các ghế có hold đã hết hạn mà chưa ai giữ lại (hold_seats chỉ giải phóng khi có
+    người giữ cùng xe), để bộ đếm, lịch chuyến và tìm kiếm thấy đúng số ghế trống. Chỉ xét xe còn held_seats > 0,
+    duyệt theo khoảng (departure_time, _id) trên index departure_time_id.
+    """
+    buses = get_bus_collection()
+    query = {"departure_time": {"$gte": datetime.utcnow() - timedelta(days=1)}, "held_seats": {"$gt": 0}}
+    after = None
+    while True:
+        page_query = query if after is None else {**query, "$or": [
+            {"departure_time": {"$gt": after["departure_time"]}},
+            {"departure_time": after["departure_time"], "_id": {"$gt": after["_id"]}},
+        ]}
+        page = await buses.find(page_query, {"departure_time": 1}).sort(
+            [("departure_time", 1), ("_id", 1)]
+        ).limit(JOB_BATCH_SIZE).to_list(length=None)
+        if not page:
+            return
+        released = 0
+        for bus in page:
+            released += await release_expired_holds(str(bus["_id"]))
+        await throttle(released)
+        if len(page) < JOB_BATCH_SIZE:
+            return
+        after = page[-1]
+
+
+async def archive_departed_buses(throttle: Throttle):
+    """
+    Chuyển các chuyến khởi hành trước ARCHIVE_AFTER_DAYS ngày sang buses_archive, ghế của chúng sang collection
+    archive của seat store (seats_archive hoặc seat_maps_archive), từng lô JOB_BATCH_SIZE xe theo departure_time.
+    Ghế được chuyển trước xe: bị ngắt giữa chừng thì lần sau chuyển tiếp đúng những xe còn lại.
+    """
+    buses = get_bus_collection()
+    query = {"departure_time": {"$lt": datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)}}
+    archived = False
+    while True:
+        batch = await buses.find(query, {"route_id": 1, "departure_time": 1}).sort(
+            [("departure_time", 1), ("_id", 1)]
+        ).limit(JOB_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            break
+        bus_ids = [str(bus["_id"]) for bus in batch]
+        seats = await seat_store.archive(bus_ids)
+        moved = await move_to_archive(buses, {"_id": {"$in": [bus["_id"] for bus in batch]}})
+        for bus in batch:
+            await cache.delete(f"buses:id:{bus['_id']}")
+            availability_view.mark_day(bus["route_id"], bus["departure_time"])
+        archived = True
+        await throttle(moved + seats)
+        if len(batch) < JOB_BATCH_SIZE:
+            break
+    if archived:
+        await cache.invalidate("buses:")
+
+
+async def reconcile_seat_counters(throttle: Throttle):
+    """Tính lại bộ đếm ghế của mọi xe (seat_counters.reconcile_counters) và sửa các xe bị lệch."""
+    await reconcile_counters(fix=True, throttle=throttle)
+
+
+async def compact_collections(throttle: Throttle):
+    """
+    Chạy lệnh compact (dồn lại dữ liệu và index, trả dung lượng sau khi xóa/archive nhiều) trên các collection
+    ghi nhiều, lần lượt từng collection. Server không cho compact (vd. phiên bản cũ trên primary) thì bỏ qua.
+    """
+    names = ["buses", seat_store.collection_name, "seat_holds", "users", "email_outbox", "revoked_tokens",
+             "idempotency_keys", "route_availability"]
+    for name in names:
+        try:
+            result = await database.db.command({"compact": name})
+        except (OperationFailure, NotImplementedError) as e:
+            logger.warning(f"compact {name} skipped: {str(e)}")
+            continue
+        logger.info(f"Compacted {name}, {result.get('bytesFreed', 0)} bytes freed")
+        await throttle(1)
+
+
+@dataclass(frozen=True)
+class Job:
+    """
+    Một job nền: chạy mỗi interval giây trên đúng một worker (worker giữ lease).
+    run_on_start=False: lần chạy đầu tiên là một interval sau lần deploy đầu, không chạy ngay lúc app nhận traffic.
+    """
+    name: str
+    interval: float
+    run: Callable[[Throttle], Awaitable[None]]
+    run_on_start: bool = False
+
+
+def job_interval(name: str, default: float) -> float:
+    return float(os.getenv(f"JOB_{name.upper()}_SECONDS", str(default)))
+
+
+JOBS = [
+    Job("sweep_expired_holds", job_interval("sweep_expired_holds", 60), sweep_expired_holds, run_on_start=True),
+    Job("purge_unverified_users", job_interval("purge_unverified_users", 3600), purge_unverified_users,
+        run_on_start=True),
+    Job("archive_departed_buses", job_interval("archive_departed_buses", 3600), archive_departed_buses),
+    Job("reconcile_seat_counters", job_interval("reconcile_seat_counters", 24 * 3600), reconcile_seat_counters),
+    Job("compact_collections", job_interval("compact_collections", 7 * 24 * 3600), compact_collections),
+]
+
+
+class JobScheduler:
+    """
+    Chạy các job nền trong mỗi worker, bầu leader theo từng job bằng một document lease trong job_leases:
+        {_id: tên job, owner, expires_at, next_run_at, last_run: {started_at, seconds, rows, result}}
+    Document được tạo một lần với next_run_at = lúc deploy (run_on_start) hoặc sau một interval. Worker nhận job
+    bằng một find_one_and_update chỉ khớp khi lease đã hết hạn và job đã đến hạn, nên chỉ một worker thắng.
+    Xong việc thì trả lease và đặt next_run_at, nên mỗi job chạy một lần mỗi interval trên toàn bộ các worker.
+    """
+    def __init__(self, jobs: List[Job], tick_seconds: float, lease_seconds: int, enabled: bool = True):
+        self.jobs = {job.name: job for job in jobs}
+        self.tick_seconds = tick_seconds
+        self.lease_seconds = lease_seconds
+        self.enabled = enabled
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.last_runs: Dict[str, dict] = {}
+        self._scheduled = set()
+        self._task = None
+
+    async def _schedule(self, job: Job, now: datetime):
+        """Tạo document lease cho job chưa từng chạy, next_run_at theo run_on_start."""
+        if job.name in self._scheduled:
+            return
+        next_run_at = now if job.run_on_start else now + timedelta(seconds=job.interval)
+        try:
+            await get_lease_collection().insert_one(
+                {"_id": job.name, "owner": None, "expires_at": now, "next_run_at": next_run_at}
+            )
+        except DuplicateKeyError:
+            # Đã có lịch (worker khác hoặc lần deploy trước)
+            pass
+        self._scheduled.add(job.name)
+
+    async def _acquire(self, job: Job, force: bool = False) -> bool:
+        now = datetime.utcnow()
+        await self._schedule(job, now)
+        query = {"_id": job.name, "expires_at": {"$lte": now}}
+        if not force:
+            query["next_run_at"] = {"$lte": now}
+        # Chỉ một worker khớp được: lease còn hạn hoặc job chưa đến hạn thì không khớp
+        lease = await get_lease_collection().find_one_and_update(
+            query,
+            {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return lease is not None
+
+    async def _renew(self, name: str):
+        now = datetime.utcnow()
+        result = await get_lease_collection().update_one(
+            {"_id": name, "owner": self.owner},
+            {"$set": {"expires_at": now + timedelta(seconds=self.lease_seconds)}},
+        )
+        if not result.matched_count:
+            raise LeaseLost(name)
+
+    async def _release(self, name: str, next_run_at: datetime, last_run: dict):
+        now = datetime.utcnow()
+        await get_lease_collection().update_one(
+            {"_id": name, "owner": self.owner},
+            {"$set": {"expires_at": now, "next_run_at": next_run_at, "last_run": last_run}},
+        )
+
+    async def run_job(self, name: str, force: bool = False) -> Optional[dict]:
+        """Chạy job nếu worker này nhận được lease; trả về kết quả lần chạy, None nếu worker khác đang/đã chạy."""
+        job = self.jobs[name]
+        if not await self._acquire(job, force):
+            return None
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        throttle = Throttle(lambda: self._renew(name))
+        result = "ok"
+        try:
+            await job.run(throttle)
+        except asyncio.CancelledError:
+            # Worker đang tắt: trả lease để worker khác chạy lại ngay ở lần kiểm tra tới
+            await asyncio.shield(self._release(name, started_at, self.last_runs.get(name, {})))
+            raise
+        except LeaseLost:
+            result = "lease_lost"
+            logger.warning(f"Job {name} lost its lease after {throttle.rows} rows")
+        except Exception as e:
+            result = "error"
+            logger.error(f"Job {name} failed: {str(e)}")
+        seconds = time.perf_counter() - start
+        last_run = {"started_at": started_at, "seconds": round(seconds, 3), "rows": throttle.rows, "result": result}
+        self.last_runs[name] = last_run
+        registry.observe("job_duration_seconds", {"job": name}, seconds)
+        registry.inc("job_rows_total", {"job": name}, throttle.rows)
+        registry.inc("job_runs_total", {"job": name, "result": result})
+        if result != "lease_lost":
+            await self._release(name, datetime.utcnow() + timedelta(seconds=job.interval), last_run)
+        logger.info(f"Job {name}: {result}, {throttle.rows} rows in {seconds:.1f}s")
+        return last_run
+
+    async def _loop(self):
+        while True:
+            # Lần lượt từng job: job nền không chạy song song với nhau trong một worker
+            for name in self.jobs:
+                try:
+                    await self.run_job(name)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error scheduling job {name}: {str(e)}")
+            await asyncio.sleep(self.tick_seconds)
+
+    async def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+scheduler = JobScheduler(JOBS, JOB_TICK_SECONDS, JOB_LEASE_SECONDS, JOBS_ENABLED)
+
+
+async def run_now(names: List[str]):
+    for name in names:
+        if await scheduler.run_job(name, force=True) is None:
+            logger.warning(f"Job {name} is running on another worker")
+    await availability_view.flush()
+
+
+if __name__ == "__main__":
+    # python -m app.jobs archive_departed_buses   -> chạy ngay một job (vẫn lấy lease nên không chạy trùng với worker)
+    # python -m app.jobs                          -> chạy ngay mọi job
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("jobs", nargs="*", help=", ".join(scheduler.jobs))
+    args = parser.parse_args()
+    unknown = [name for name in args.jobs if name not in scheduler.jobs]
+    if unknown:
+        parser.error(f"unknown jobs: {', '.join(unknown)}")
+    asyncio.run(run_now(args.jobs or list(scheduler.jobs)))
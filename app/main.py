@@ -1,12 +1,64 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from app.routes import user_routes, route_routes
+from fastapi.responses import FileResponse, PlainTextResponse
+from app.routes import user_routes, route_routes, search_routes, export_routes, import_routes, pricing_routes
+from app import database
+from app.indexes import ensure_indexes
+from app.email_service import email_service
+from app.auth import password_hasher, token_cache, token_revocations
+from app.cache import cache
+from app.search import backfill_place_keys
+from app.accounts import backfill_verification_tokens
+from app.availability import availability_view
+from app.metrics import MetricsMiddleware, registry
+from app.seat_events import seat_events
+from app.rate_limit import RateLimitMiddleware, load_shedder
+from app.idempotency import IdempotencyMiddleware
+from app.jobs import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await database.connect()
+    # Không chặn khởi động nếu tạo index lỗi (vd. index cũ xung đột); ensure_indexes ghi log từng index lỗi,
+    # sửa dữ liệu rồi chạy lại bằng `python -m app.indexes`
+    failed_indexes = await ensure_indexes()
+    if failed_indexes:
+        logger.error(f"Index bootstrap incomplete, missing: {', '.join(failed_indexes)}")
+    # Mỗi backfill chạy độc lập: một backfill lỗi không bỏ qua backfill còn lại
+    for backfill in (backfill_place_keys, backfill_verification_tokens, email_service.backfill_expiry):
+        try:
+            await backfill()
+        except Exception as e:
+            logger.error(f"{backfill.__name__} failed: {e}")
+    await email_service.start()
+    await token_revocations.start()
+    await seat_events.start()
+    await availability_view.start()
+    await scheduler.start()
+    yield
+    await scheduler.stop()
+    await availability_view.stop()
+    await seat_events.stop()
+    await token_revocations.stop()
+    await email_service.stop()
+    password_hasher.shutdown()
+    database.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 from fastapi.middleware.cors import CORSMiddleware
 
+# Trong cùng: request bị rate limit (429) không chiếm Idempotency-Key, response được lưu không có header CORS
+app.add_middleware(IdempotencyMiddleware)
+# Thêm trước CORS để response 429/503 vẫn có header CORS
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -14,5 +66,49 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 app.include_router(user_routes.router)
 app.include_router(route_routes.router)
+app.include_router(search_routes.router)
+app.include_router(export_routes.router)
+app.include_router(import_routes.router)
+app.include_router(pricing_routes.router)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return cache.stats()
+
+
+def collect_runtime_metrics():
+    hasher = password_hasher.stats()
+    cache_stats = cache.stats()
+    return [
+        ("password_hash_in_flight", "gauge", {}, hasher["in_flight"]),
+        ("password_hash_queue_depth", "gauge", {}, hasher["queue_depth"]),
+        ("email_queue_depth", "gauge", {}, email_service.queue.qsize()),
+        ("cache_requests_total", "counter", {"result": "hit"}, cache_stats["hits"]),
+        ("cache_requests_total", "counter", {"result": "miss"}, cache_stats["misses"]),
+        ("cache_requests_total", "counter", {"result": "coalesced"}, cache_stats["coalesced"]),
+        ("auth_token_cache_requests_total", "counter", {"result": "hit"}, token_cache.hits),
+        ("auth_token_cache_requests_total", "counter", {"result": "miss"}, token_cache.misses),
+        ("seat_event_subscribers", "gauge", {}, seat_events.subscriber_count()),
+        ("seat_event_deltas_total", "counter", {}, seat_events.deltas),
+        ("seat_event_dropped_subscribers_total", "counter", {}, seat_events.dropped),
+        ("availability_pending_changes", "gauge", {}, availability_view.pending()),
+        ("availability_flushes_total", "counter", {}, availability_view.flushes),
+        ("availability_days_refreshed_total", "counter", {}, availability_view.days_refreshed),
+        *(("job_last_duration_seconds", "gauge", {"job": name}, run["seconds"])
+          for name, run in scheduler.last_runs.items()),
+        *(("job_last_rows", "gauge", {"job": name}, run["rows"]) for name, run in scheduler.last_runs.items()),
+        *(("shed_group_in_flight", "gauge", {"group": group}, count)
+          for group, count in load_shedder.in_flight.items()),
+    ]
+
+
+registry.register_collector(collect_runtime_metrics)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,226 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Lưu histogram/counter theo (tên, nhãn) trong bộ nhớ và xuất ra định dạng text của Prometheus.
+    Listener của pymongo chạy trên thread của driver nên mọi thao tác ghi đều giữ lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self.counters: Dict[str, Dict[Tuple, float]] = {}
+        self.help: Dict[str, str] = {}
+        self.collectors: List[Callable[[], List[Tuple[str, str, dict, float]]]] = []
+
+    def observe(self, name: str, labels: dict, value: float):
+        key = tuple(labels.items())
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        key = tuple(labels.items())
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def register_collector(self, collector):
+        """collector() trả về danh sách (tên, kiểu gauge/counter, nhãn, giá trị) đọc tại thời điểm scrape."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+
+        def header(name, kind):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self.histograms.items()):
+                header(name, "histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(key + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+            for name, series in sorted(self.counters.items()):
+                header(name, "counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_labels(key)} {value}")
+
+        collected = {}
+        for collector in self.collectors:
+            for name, kind, labels, value in collector():
+                collected.setdefault((name, kind), []).append((tuple(labels.items()), value))
+        for (name, kind), series in collected.items():
+            header(name, kind)
+            for key, value in series:
+                lines.append(f"{name}{_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: Tuple) -> str:
+    if not key:
+        return ""
+    parts = []
+    for name, value in key:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+registry = Registry()
+registry.describe("http_request_duration_seconds", "HTTP request latency by route template")
+registry.describe("mongo_command_duration_seconds", "MongoDB command latency by collection")
+registry.describe("mongo_documents_returned_total", "Documents returned by MongoDB commands")
+registry.describe("mongo_slow_commands_total", "MongoDB commands slower than MONGO_SLOW_QUERY_MS")
+registry.describe("password_hash_duration_seconds", "bcrypt hash/verify latency including pool wait")
+registry.describe("smtp_send_duration_seconds", "SMTP delivery latency")
+
+
+class MetricsMiddleware:
+    """ASGI middleware đo thời gian mỗi request, gắn nhãn theo route template (/buses/{bus_id}) thay vì path thật."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            registry.observe(
+                "http_request_duration_seconds",
+                {"method": scope["method"], "route": route.path if route else "unmatched", "status": status},
+                time.perf_counter() - start,
+            )
+
+
+def query_shape(value):
+    """Giữ cấu trúc filter (tên trường, toán tử) và thay giá trị bằng "?" để log không lộ dữ liệu."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ["?"]
+    return "?"
+
+
+# Các lệnh mà tên collection nằm ngay trong giá trị của lệnh
+_COLLECTION_COMMANDS = {"find", "aggregate", "insert", "update", "delete", "findAndModify", "count", "distinct",
+                        "createIndexes"}
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Đo thời gian và số document trả về của mọi lệnh Mongo, log các lệnh chậm kèm hình dạng filter."""
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        command = event.command
+        name = event.command_name
+        if name in _COLLECTION_COMMANDS:
+            collection = command.get(name)
+        elif name == "getMore":
+            collection = command.get("collection")
+        else:
+            return
+        if name == "find":
+            shape = command.get("filter")
+        elif name == "aggregate":
+            shape = command.get("pipeline", [{}])[0] if command.get("pipeline") else None
+        elif name in ("update", "delete"):
+            statements = command.get("updates") or command.get("deletes") or [{}]
+            shape = statements[0].get("q")
+        elif name in ("findAndModify", "count", "distinct"):
+            shape = command.get("query")
+        else:
+            shape = None
+        self._pending[(event.connection_id, event.request_id)] = (collection, shape)
+
+    def succeeded(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        collection, shape = pending
+        labels = {"collection": collection, "command": event.command_name}
+        seconds = event.duration_micros / 1e6
+        registry.observe("mongo_command_duration_seconds", labels, seconds)
+
+        reply = event.reply
+        cursor = reply.get("cursor")
+        if cursor is not None:
+            returned = len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+        elif event.command_name == "findAndModify":
+            returned = 1 if reply.get("value") else 0
+        else:
+            returned = 0
+        if returned:
+            registry.inc("mongo_documents_returned_total", labels, returned)
+
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            registry.inc("mongo_slow_commands_total", labels)
+            logger.warning(
+                f"Slow Mongo {event.command_name} on {collection}: {seconds * 1000:.1f}ms, "
+                f"{returned} docs, filter {query_shape(shape) if shape is not None else '-'}"
+            )
+
+    def failed(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is not None:
+            registry.observe(
+                "mongo_command_duration_seconds",
+                {"collection": pending[0], "command": event.command_name},
+                event.duration_micros / 1e6,
+            )
+
+
+command_listener = CommandMetricsListener()
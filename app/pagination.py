@@ -0,0 +1,44 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+
+# skip chỉ còn dùng cho offset nhỏ; trang sâu hơn dùng cursor
+MAX_SKIP = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(doc: dict, sort_field: str = None) -> str:
+    """Mã hóa vị trí (sort_field, _id) của bản ghi cuối trang thành chuỗi opaque."""
+    payload = {"id": str(doc["_id"])}
+    if sort_field:
+        payload["v"] = doc[sort_field].isoformat()
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def keyset_filter(cursor: str, sort_field: str = None) -> dict:
+    """Filter lấy các bản ghi đứng sau cursor theo thứ tự (sort_field, _id). Cursor lỗi -> ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        last_id = ObjectId(payload["id"])
+        last_value = datetime.fromisoformat(payload["v"]) if sort_field else None
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+    if not sort_field:
+        return {"_id": {"$gt": last_id}}
+    return {
+        "$or": [
+            {sort_field: {"$gt": last_value}},
+            {sort_field: last_value, "_id": {"$gt": last_id}},
+        ]
+    }
+
+
+def sort_spec(sort_field: str = None) -> list:
+    if not sort_field:
+        return [("_id", 1)]
+    return [(sort_field, 1), ("_id", 1)]
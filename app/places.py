@@ -0,0 +1,18 @@
+import re
+import unicodedata
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Tiền tố hành chính không dùng để so khớp: "TP. Hồ Chí Minh" == "Hồ Chí Minh"
+_ADMIN_PREFIX = re.compile(r"^(thanh-pho|tp|tinh|thi-xa|tx|huyen)-")
+
+
+def place_key(name: str) -> str:
+    """
+    Chuẩn hóa tên địa danh thành key không dấu để tìm kiếm bằng index:
+    "Hà Nội" -> "ha-noi", "TP. Hồ Chí Minh" -> "ho-chi-minh", "Đà Nẵng" -> "da-nang".
+    """
+    text = name.strip().lower().replace("đ", "d")
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _NON_ALNUM.sub("-", text).strip("-")
+    return _ADMIN_PREFIX.sub("", text)
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.database import CATALOG, collection
+from app.seat_layouts import SEAT_LAYOUTS
+
+# Worker khác có thể đã sửa bảng giá, nên rule cũng được nạp lại định kỳ
+FARE_RULES_TTL_SECONDS = int(os.getenv("FARE_RULES_TTL_SECONDS", "60"))
+# Giá được làm tròn tới bội số này (VND); 0 thì chỉ làm tròn 2 chữ số thập phân
+PRICE_ROUNDING = float(os.getenv("PRICE_ROUNDING", "1000"))
+# Độ lấp đầy được chia thành các bậc 5%: giá chỉ tính lại khi xe chuyển sang bậc khác
+OCCUPANCY_STEPS = 20
+MAX_DAYS = 365
+MAX_CACHED_FARES = 100000
+
+# Các yếu tố ảnh hưởng giá và miền giá trị min_value/max_value của chúng
+FACTORS = {
+    "seat_class": None,                  # khớp theo seat_type/deck
+    "departure_hour": (0, 24),           # giờ khởi hành; min_value > max_value nghĩa là qua nửa đêm (22 -> 5)
+    "occupancy": (0, 1),                 # tỉ lệ ghế đã bán
+    "days_to_departure": (0, MAX_DAYS),  # số ngày từ lúc xem tới lúc khởi hành
+}
+
+# (seat_type, deck) của mọi loại ghế trong các mẫu sơ đồ, cộng với ghế cũ không có hai trường này
+SEAT_CLASSES: List[Tuple[Optional[str], Optional[str]]] = sorted(
+    {(template["seat_type"], deck["deck"]) for template in SEAT_LAYOUTS.values() for deck in template["decks"]}
+) + [(None, None)]
+
+
+def get_fare_rule_collection(workload: str = CATALOG):
+    return collection("fare_rules", workload)
+
+
+def validate_rule(rule: dict):
+    """Kiểm tra một rule trước khi lưu; rule không hợp lệ -> ValueError."""
+    factor = rule.get("factor")
+    if factor not in FACTORS:
+        raise ValueError(f"Unknown factor {factor}, expected one of {', '.join(FACTORS)}")
+    if rule.get("multiplier") is None or rule["multiplier"] <= 0:
+        raise ValueError("multiplier must be greater than 0")
+    if factor == "seat_class":
+        if rule.get("seat_type") is None and rule.get("deck") is None:
+            raise ValueError("seat_class rules need seat_type or deck")
+        return
+    low, high = FACTORS[factor]
+    for name in ("min_value", "max_value"):
+        value = rule.get(name)
+        if value is not None and not low <= value <= high:
+            raise ValueError(f"{name} of a {factor} rule must be between {low} and {high}")
+    if rule.get("min_value") is None and rule.get("max_value") is None:
+        raise ValueError(f"{factor} rules need min_value or max_value")
+
+
+def _in_range(rule: dict, value: float, wraps: bool = False) -> bool:
+    low = rule.get("min_value")
+    high = rule.get("max_value")
+    if wraps and low is not None and high is not None and low > high:
+        return value >= low or value < high
+    return (low is None or value >= low) and (high is None or value < high)
+
+
+def _table(rules: List[dict], values, wraps: bool = False) -> List[float]:
+    """Hệ số tại mỗi giá trị = tích multiplier của các rule có khoảng chứa giá trị đó."""
+    table = []
+    for value in values:
+        multiplier = 1.0
+        for rule in rules:
+            if _in_range(rule, value, wraps):
+                multiplier *= rule["multiplier"]
+        table.append(multiplier)
+    return table
+
+
+class FareTable:
+    """
+    Hệ số giá đã biên dịch của một route (hoặc của bảng giá chung): một mảng cho mỗi yếu tố,
+    tra theo chỉ số (giờ khởi hành, bậc lấp đầy, số ngày) thay vì duyệt rule.
+    """
+    __slots__ = ("classes", "hours", "occupancy", "days")
+
+    def __init__(self, rules: List[dict]):
+        by_factor = defaultdict(list)
+        for rule in rules:
+            by_factor[rule["factor"]].append(rule)
+        self.classes = {}
+        for seat_type, deck in SEAT_CLASSES:
+            multiplier = 1.0
+            for rule in by_factor["seat_class"]:
+                if rule.get("seat_type") in (None, seat_type) and rule.get("deck") in (None, deck):
+                    multiplier *= rule["multiplier"]
+            self.classes[(seat_type, deck)] = multiplier
+        self.hours = _table(by_factor["departure_hour"], range(24), wraps=True)
+        self.occupancy = _table(by_factor["occupancy"], [step / OCCUPANCY_STEPS for step in range(OCCUPANCY_STEPS + 1)])
+        self.days = _table(by_factor["days_to_departure"], range(MAX_DAYS + 1))
+
+
+def round_price(price: float) -> float:
+    if PRICE_ROUNDING:
+        return round(price / PRICE_ROUNDING) * PRICE_ROUNDING
+    return round(price, 2)
+
+
+class FareEngine:
+    """
+    Tính giá vé từ các rule trong collection fare_rules. Rule được biên dịch thành FareTable cho từng route
+    (rule riêng của route thay thế rule chung của cùng yếu tố); giá theo hạng ghế của một chuyến được nhớ lại
+    theo (route, giá gốc, giờ, số ngày, bậc lấp đầy), nên khi bộ đếm ghế thay đổi chỉ bậc mới cần tính.
+    Được nạp lại khi rule thay đổi (mark_stale) hoặc sau FARE_RULES_TTL_SECONDS.
+    """
+    def __init__(self):
+        self.default = FareTable([])
+        self.routes: Dict[str, FareTable] = {}
+        self._fares: Dict[tuple, Dict[tuple, float]] = {}
+        self._stale = True
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def mark_stale(self):
+        self._stale = True
+
+    def load(self, rules: List[dict]):
+        common = [rule for rule in rules if not rule.get("route_id")]
+        by_route = defaultdict(list)
+        for rule in rules:
+            if rule.get("route_id"):
+                by_route[rule["route_id"]].append(rule)
+        self.default = FareTable(common)
+        self.routes = {}
+        for route_id, route_rules in by_route.items():
+            overridden = {rule["factor"] for rule in route_rules}
+            self.routes[route_id] = FareTable(route_rules + [rule for rule in common if rule["factor"] not in overridden])
+        self._fares = {}
+        self._stale = False
+        self._loaded_at = time.monotonic()
+
+    def _needs_refresh(self) -> bool:
+        return self._stale or time.monotonic() - self._loaded_at > FARE_RULES_TTL_SECONDS
+
+    async def refresh(self):
+        if not self._needs_refresh():
+            return
+        async with self._lock:
+            if self._needs_refresh():
+                self.load(await get_fare_rule_collection().find({}).to_list(length=None))
+
+    def class_fares(self, route_id: str, base_price: float, departure_time: datetime, occupancy: float,
+                    now: Optional[datetime] = None) -> Dict[tuple, float]:
+        """Giá của mọi hạng ghế (seat_type, deck) cho một chuyến, kèm khóa None là giá chưa tính hạng ghế."""
+        now = now or datetime.utcnow()
+        days = min(MAX_DAYS, max(0, (departure_time - now).days))
+        step = min(OCCUPANCY_STEPS, max(0, int(occupancy * OCCUPANCY_STEPS)))
+        key = (route_id, base_price, departure_time.hour, days, step)
+        fares = self._fares.get(key)
+        if fares is None:
+            table = self.routes.get(route_id, self.default)
+            fare = base_price * table.hours[departure_time.hour] * table.days[days] * table.occupancy[step]
+            fares = {seat_class: round_price(fare * multiplier) for seat_class, multiplier in table.classes.items()}
+            fares[None] = round_price(fare)
+            if len(self._fares) >= MAX_CACHED_FARES:
+                self._fares.clear()
+            self._fares[key] = fares
+        return fares
+
+    def bus_fare(self, route_id: str, base_price: float, bus: dict, now: Optional[datetime] = None) -> float:
+        """
+        Giá "từ" của một chuyến trong kết quả tìm kiếm (chưa tính hệ số hạng ghế), độ lấp đầy lấy từ bộ đếm:
+        sold / (available + held + sold). Xe chưa có ghế nào (tổng bằng 0) tính theo giá gốc, độ lấp đầy 0.
+        """
+        available = bus.get("available_seats") or 0
+        held = bus.get("held_seats") or 0
+        sold = bus.get("sold_seats") or 0
+        total = available + held + sold
+        occupancy = sold / total if total else 0
+        return self.class_fares(route_id, base_price, bus["departure_time"], occupancy, now)[None]
+
+    def price_seats(self, bus: dict, seats: List[dict], now: Optional[datetime] = None) -> List[float]:
+        """
+        Giá của cả sơ đồ ghế trong một lần: độ lấp đầy (ghế đã bán / tổng ghế, như bus_fare)
+        đếm từ chính danh sách ghế, giá theo hạng được tính (hoặc lấy từ bộ nhớ) một lần rồi tra cho từng ghế.
+        Giá gốc là giá đã lưu trên ghế (giá route lúc tạo ghế).
+        """
+        if not seats:
+            return []
+        now = now or datetime.utcnow()
+        sold = sum(1 for seat in seats if not seat.get("is_available", True))
+        occupancy = sold / len(seats)
+        route_id = bus["route_id"]
+        departure_time = bus["departure_time"]
+        bases = {seat["price"] for seat in seats}
+        if len(bases) == 1:
+            # Trường hợp thường gặp: mọi ghế cùng giá gốc, chỉ cần một bảng giá theo hạng
+            fares = self.class_fares(route_id, bases.pop(), departure_time, occupancy, now)
+            default = fares[None]
+            return [fares.get((seat.get("seat_type"), seat.get("deck")), default) for seat in seats]
+        fares_by_base = {base: self.class_fares(route_id, base, departure_time, occupancy, now) for base in bases}
+        return [
+            fares_by_base[seat["price"]].get((seat.get("seat_type"), seat.get("deck")), fares_by_base[seat["price"]][None])
+            for seat in seats
+        ]
+
+
+fare_engine = FareEngine()
@@ -0,0 +1,37 @@
+from typing import List, Type
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+from app import schemas
+
+
+class Projection:
+    """
+    Chiếu document Mongo sang dict đúng hình dạng của một response model mà không dựng model Pydantic.
+    - mongo: projection truyền cho find() để chỉ lấy các trường cần trả về
+    - apply(): đổi _id -> id (chuỗi) và điền giá trị mặc định cho trường thiếu, giữ thứ tự trường như model
+    Kết quả được trả thẳng qua ORJSONResponse, nên response_model trên route chỉ còn dùng cho tài liệu OpenAPI.
+    """
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.fields = [
+            (name, None if field.is_required() else field.get_default())
+            for name, field in model.model_fields.items()
+        ]
+        self.mongo = {name: 1 for name, _ in self.fields if name != "id"}
+
+    def apply(self, docs: List[dict]) -> List[dict]:
+        fields = self.fields
+        return [
+            {name: str(doc["_id"]) if name == "id" else doc.get(name, default) for name, default in fields}
+            for doc in docs
+        ]
+
+    def response(self, docs: List[dict], headers: dict = None) -> ORJSONResponse:
+        return ORJSONResponse(self.apply(docs), headers=headers)
+
+
+route_projection = Projection(schemas.RouteResponse)
+bus_projection = Projection(schemas.BusResponse)
+seat_projection = Projection(schemas.SeatResponse)
@@ -0,0 +1,233 @@
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from app import auth
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | redis
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+@dataclass(frozen=True)
+class Budget:
+    """Token bucket: tối đa capacity request, hồi lại capacity token sau mỗi period giây."""
+    capacity: float
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+def parse_budget(text: str) -> Budget:
+    """"10/60" -> 10 request mỗi 60 giây."""
+    capacity, period = text.split("/")
+    return Budget(float(capacity), float(period))
+
+
+# Ngân sách theo client (user đã đăng nhập, nếu không thì IP) và theo email cho các endpoint chạy bcrypt
+BUDGETS: Dict[str, Budget] = {
+    "login": parse_budget(os.getenv("RATE_LIMIT_LOGIN", "20/60")),
+    "login_email": parse_budget(os.getenv("RATE_LIMIT_LOGIN_EMAIL", "10/300")),
+    "register": parse_budget(os.getenv("RATE_LIMIT_REGISTER", "5/600")),
+    "register_email": parse_budget(os.getenv("RATE_LIMIT_REGISTER_EMAIL", "3/3600")),
+    "search": parse_budget(os.getenv("RATE_LIMIT_SEARCH", "120/60")),
+}
+
+ROUTE_BUDGETS = {
+    ("POST", "/users/login"): "login",
+    ("POST", "/users/register"): "register",
+    ("GET", "/search/trips"): "search",
+}
+
+# Số request đồng thời tối đa của mỗi nhóm trong một worker; vượt quá thì trả 503 ngay thay vì xếp hàng.
+# Mặc định nhóm password gấp 4 lần số worker bcrypt: nhiều hơn chỉ làm dài hàng đợi của PasswordHasher.
+SHED_LIMITS = {
+    "password": int(os.getenv("SHED_MAX_IN_FLIGHT_PASSWORD", str(auth.password_hasher.workers * 4))),
+    "search": int(os.getenv("SHED_MAX_IN_FLIGHT_SEARCH", "64")),
+}
+SHED_GROUPS = {"login": "password", "register": "password", "search": "search"}
+SHED_RETRY_AFTER_SECONDS = float(os.getenv("SHED_RETRY_AFTER_SECONDS", "1"))
+
+
+class MemoryBucketBackend:
+    """Bucket trong tiến trình (mỗi worker đếm riêng), giữ tối đa max_keys key gần nhất."""
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, budget: Budget, cost: float = 1) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (budget.capacity, now))
+        tokens = min(budget.capacity, tokens + (now - updated) * budget.rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / budget.rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 't', 'u')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'u', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisBucketBackend:
+    """Bucket dùng chung giữa các worker, cập nhật nguyên tử bằng một script Lua."""
+    def __init__(self, client, namespace: str = "vexekhach:ratelimit:"):
+        self.client = client
+        self.namespace = namespace
+        self._script = client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, budget: Budget, cost: float = 1) -> float:
+        wait = await self._script(keys=[self.namespace + key], args=[budget.capacity, budget.rate, time.time(), cost])
+        return float(wait)
+
+
+class RateLimiter:
+    def __init__(self, backend, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+
+    async def retry_after(self, budget_name: str, key: str) -> float:
+        """Lấy một token của key trong ngân sách budget_name; trả về 0 nếu được phép, ngược lại số giây phải chờ."""
+        if not self.enabled:
+            return 0.0
+        try:
+            wait = await self.backend.take(f"{budget_name}:{key}", BUDGETS[budget_name])
+        except Exception as e:
+            # Backend dùng chung lỗi thì cho qua, không chặn toàn bộ đăng nhập
+            logger.error(f"Rate limit backend error: {str(e)}")
+            return 0.0
+        if wait:
+            registry.inc("rate_limited_requests_total", {"budget": budget_name})
+        return wait
+
+    async def enforce(self, budget_name: str, key: str):
+        """Như retry_after nhưng báo 429 kèm Retry-After, dùng trong handler (vd. giới hạn theo email)."""
+        wait = await self.retry_after(budget_name, key)
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, please try again later",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+
+class LoadShedder:
+    """Đếm request đang chạy theo nhóm; nhóm đã đầy thì request mới bị từ chối ngay."""
+    def __init__(self, limits: Dict[str, int], enabled: bool = True):
+        self.limits = limits
+        self.enabled = enabled
+        self.in_flight = {group: 0 for group in limits}
+
+    def try_acquire(self, group: Optional[str]) -> bool:
+        if group is None:
+            return True
+        if self.enabled and self.in_flight[group] >= self.limits[group]:
+            registry.inc("shed_requests_total", {"group": group})
+            return False
+        self.in_flight[group] += 1
+        return True
+
+    def release(self, group: Optional[str]):
+        if group is not None:
+            self.in_flight[group] -= 1
+
+
+def build_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        return RedisBucketBackend(redis.from_url(REDIS_URL))
+    return MemoryBucketBackend(RATE_LIMIT_MAX_KEYS)
+
+
+rate_limiter = RateLimiter(build_backend(), RATE_LIMIT_ENABLED)
+load_shedder = LoadShedder(SHED_LIMITS, RATE_LIMIT_ENABLED)
+
+
+def client_key(scope) -> str:
+    """User id nếu request có token hợp lệ, ngược lại IP (đã qua --proxy-headers của uvicorn)."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    return "user:" + auth.decode_token(token).id
+                except HTTPException:
+                    pass
+            break
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail}, status_code=status_code, headers={"Retry-After": str(math.ceil(retry_after))}
+    )
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware cho các route trong ROUTE_BUDGETS: kiểm tra token bucket của client (429 khi hết),
+    rồi giới hạn số request đồng thời của nhóm (503 khi quá tải). Cả hai đều trả Retry-After.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        budget_name = ROUTE_BUDGETS.get((scope["method"], scope["path"]))
+        if budget_name is None:
+            return await self.app(scope, receive, send)
+
+        wait = await rate_limiter.retry_after(budget_name, client_key(scope))
+        if wait:
+            return await _reject(429, "Too many requests, please try again later", wait)(scope, receive, send)
+
+        group = SHED_GROUPS.get(budget_name)
+        if not load_shedder.try_acquire(group):
+            return await _reject(503, "Server is busy, please try again later", SHED_RETRY_AFTER_SECONDS)(
+                scope, receive, send
+            )
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            load_shedder.release(group)
@@ -0,0 +1,79 @@
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from bson import ObjectId
+
+from app.database import collection
+from app.seat_counters import adjust_counters
+from app.seat_store import seat_store
+
+HOLD_MINUTES = int(os.getenv("SEAT_HOLD_MINUTES", "10"))
+
+
+def get_hold_collection():
+    return collection("seat_holds")
+
+
+class SeatsUnavailable(Exception):
+    pass
+
+
+async def hold_seats(bus_id: str, seat_numbers: List[str], user_id: str) -> dict:
+    """
+    Giữ một nhóm ghế bằng một lệnh update có điều kiện (seat_store.try_hold).
+    Nếu không giữ được đủ số ghế thì giải phóng các hold đã hết hạn
+    của xe và thử lại một lần; vẫn không đủ thì báo SeatsUnavailable.
+    """
+    now = datetime.utcnow()
+    hold_id = ObjectId()
+    expires_at = now + timedelta(minutes=HOLD_MINUTES)
+    seat_numbers = sorted(set(seat_numbers))
+
+    if not await seat_store.try_hold(bus_id, seat_numbers, user_id, hold_id, expires_at):
+        if not await release_expired_holds(bus_id):
+            raise SeatsUnavailable()
+        if not await seat_store.try_hold(bus_id, seat_numbers, user_id, hold_id, expires_at):
+            raise SeatsUnavailable()
+    await adjust_counters(bus_id, available=-len(seat_numbers), held=len(seat_numbers))
+
+    hold = {
+        "_id": hold_id,
+        "bus_id": bus_id,
+        "seat_numbers": seat_numbers,
+        "user_id": user_id,
+        "created_at": now,
+        "expires_at": expires_at,
+    }
+    await get_hold_collection().insert_one(hold)
+    return hold
+
+
+async def release_expired_holds(bus_id: str) -> int:
+    """Trả các ghế có hold đã hết hạn của một xe về trạng thái trống, trả về số ghế được giải phóng."""
+    released = await seat_store.release_expired(bus_id, datetime.utcnow())
+    if released:
+        await adjust_counters(bus_id, available=released, held=-released)
+    return released
+
+
+async def confirm_hold(bus_id: str, hold_id: ObjectId, user_id: str) -> Optional[dict]:
+    """
+    Xác nhận một hold còn hạn: xóa hold (find_one_and_delete) rồi chuyển các ghế sang đã bán.
+    Trả về None nếu hold không tồn tại, đã hết hạn hoặc không thuộc về user.
+    """
+    now = datetime.utcnow()
+    hold = await get_hold_collection().find_one_and_delete(
+        {"_id": hold_id, "bus_id": bus_id, "user_id": user_id, "expires_at": {"$gt": now}}
+    )
+    if not hold:
+        return None
+
+    booked = await seat_store.confirm(bus_id, hold["seat_numbers"], hold_id, user_id, now)
+    if booked:
+        await adjust_counters(bus_id, held=-booked, sold=booked)
+    if booked != len(hold["seat_numbers"]):
+        # Không thể xảy ra khi hold còn hạn, nhưng không để ghế ở trạng thái nửa vời
+        raise SeatsUnavailable()
+    hold["booked_at"] = now
+    return hold
@@ -0,0 +1,125 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from datetime import date, datetime, timedelta
+from typing import List
+from bson import ObjectId
+
+from app.database import CATALOG, PRIMARY, collection
+from app import auth, exports, projections
+from app.seat_store import seat_store
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+FORMAT_PATTERN = "^(ndjson|csv)$"
+
+ROUTE_COLUMNS = [name for name, _ in projections.route_projection.fields]
+BUS_COLUMNS = [name for name, _ in projections.bus_projection.fields] + ["route_code", "departure", "destination"]
+MANIFEST_COLUMNS = [
+    "seat_number", "deck", "seat_type", "price", "status", "booked_at",
+    "passenger_id", "passenger_username", "passenger_email", "passenger_name", "passenger_phone",
+]
+
+
+@router.get("/routes")
+async def export_routes(format: str = Query(default="ndjson", pattern=FORMAT_PATTERN)):
+    cursor = collection("routes", CATALOG).find({}, projections.route_projection.mongo).sort("_id", 1) \
+        .batch_size(exports.EXPORT_BATCH_SIZE)
+
+    async def transform(batch: List[dict]) -> List[dict]:
+        return projections.route_projection.apply(batch)
+
+    return exports.export_response(cursor, ROUTE_COLUMNS, format, "routes", transform)
+
+
+@router.get("/buses")
+async def export_buses(
+    date: date,
+    days: int = Query(default=1, ge=1, le=31),
+    route_id: str = None,
+    format: str = Query(default="ndjson", pattern=FORMAT_PATTERN)
+):
+    # Lịch chạy của các ngày [date, date + days), sắp theo giờ khởi hành
+    start = datetime(date.year, date.month, date.day)
+    query = {"departure_time": {"$gte": start, "$lt": start + timedelta(days=days)}}
+    if route_id:
+        query["route_id"] = route_id
+    cursor = collection("buses", CATALOG).find(query, projections.bus_projection.mongo).sort(
+        [("departure_time", 1), ("_id", 1)]
+    ).batch_size(exports.EXPORT_BATCH_SIZE)
+
+    # Thông tin route được nạp theo lô và giữ lại cho các lô sau (số route nhỏ hơn nhiều so với số chuyến)
+    routes = {}
+
+    async def transform(batch: List[dict]) -> List[dict]:
+        missing = {bus["route_id"] for bus in batch if bus.get("route_id") not in routes}
+        object_ids = [ObjectId(route_id) for route_id in missing if ObjectId.is_valid(route_id)]
+        async for route in collection("routes", CATALOG).find(
+            {"_id": {"$in": object_ids}}, {"route_code": 1, "departure": 1, "destination": 1}
+        ):
+            routes[str(route["_id"])] = route
+        rows = projections.bus_projection.apply(batch)
+        for row in rows:
+            route = routes.get(row["route_id"], {})
+            row["route_code"] = route.get("route_code")
+            row["departure"] = route.get("departure")
+            row["destination"] = route.get("destination")
+        return rows
+
+    return exports.export_response(cursor, BUS_COLUMNS, format, f"buses-{date.isoformat()}", transform)
+
+
+def _seat_status(seat: dict, now: datetime) -> str:
+    if not seat.get("is_available", True):
+        return "sold"
+    if seat.get("hold_id") is not None and seat.get("hold_expires_at") and seat["hold_expires_at"] > now:
+        return "held"
+    return "available"
+
+
+@router.get("/buses/{bus_id}/manifest")
+async def export_manifest(
+    bus_id: str,
+    format: str = Query(default="csv", pattern=FORMAT_PATTERN),
+    context: auth.UserContext = Depends(auth.require_role("admin", "staff"))
+):
+    # Danh sách hành khách có thông tin cá nhân nên chỉ dành cho nhân viên; đọc từ primary để không sót vé vừa bán
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus ID format")
+    if not await collection("buses", PRIMARY).find_one({"_id": ObjectId(bus_id)}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Bus not found")
+
+    cursor = seat_store.scan(
+        bus_id,
+        {"seat_number": 1, "deck": 1, "seat_type": 1, "price": 1, "is_available": 1, "booked_by": 1,
+         "booked_at": 1, "hold_id": 1, "hold_expires_at": 1},
+        exports.EXPORT_BATCH_SIZE,
+    )
+    now = datetime.utcnow()
+
+    async def transform(batch: List[dict]) -> List[dict]:
+        passenger_ids = [ObjectId(seat["booked_by"]) for seat in batch
+                         if not seat.get("is_available", True) and ObjectId.is_valid(seat.get("booked_by") or "")]
+        passengers = {}
+        async for user in collection("users").find(
+            {"_id": {"$in": passenger_ids}}, {"username": 1, "email": 1, "full_name": 1, "phone_number": 1}
+        ):
+            passengers[str(user["_id"])] = user
+        rows = []
+        for seat in batch:
+            status = _seat_status(seat, now)
+            passenger = passengers.get(seat.get("booked_by")) if status == "sold" else None
+            rows.append({
+                "seat_number": seat["seat_number"],
+                "deck": seat.get("deck"),
+                "seat_type": seat.get("seat_type"),
+                "price": seat.get("price"),
+                "status": status,
+                "booked_at": seat.get("booked_at") if status == "sold" else None,
+                "passenger_id": seat.get("booked_by") if status == "sold" else None,
+                "passenger_username": passenger and passenger.get("username"),
+                "passenger_email": passenger and passenger.get("email"),
+                "passenger_name": passenger and passenger.get("full_name"),
+                "passenger_phone": passenger and passenger.get("phone_number"),
+            })
+        return rows
+
+    return exports.export_response(cursor, MANIFEST_COLUMNS, format, f"manifest-{bus_id}", transform)
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+
+from app import auth, schemas, timetable_import
+
+router = APIRouter(prefix="/imports", tags=["imports"])
+
+
+@router.post("/timetable", response_model=schemas.TimetableImportResponse)
+async def import_timetable(
+    request: Request,
+    format: str = Query(pattern="^(csv|ndjson|rules)$"),
+    generate_seats: bool = False,
+    layout: str = "default",
+    dry_run: bool = False,
+    context: auth.UserContext = Depends(auth.require_role("admin", "staff"))
+):
+    # Body là nội dung file (CSV có header, NDJSON, hoặc JSON rule lịch chạy), không phải multipart
+    try:
+        text = (await request.body()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8")
+    try:
+        importer = timetable_import.TimetableImport(generate_seats, layout, dry_run)
+        report = await importer.run(timetable_import.read_records(text, format))
+    except ValueError as e:
+        # File không đọc được (ImportFormatError) hoặc layout không tồn tại
+        raise HTTPException(status_code=400, detail=str(e))
+    return schemas.TimetableImportResponse(**report)
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Depends
+from datetime import datetime
+from typing import List
+from bson import ObjectId
+
+from app.database import PRIMARY
+from app import auth, pricing, projections, schemas
+
+router = APIRouter(prefix="/pricing", tags=["pricing"])
+
+fare_rule_projection = projections.Projection(schemas.FareRuleResponse)
+
+
+@router.get("/rules", response_model=List[schemas.FareRuleResponse])
+async def get_fare_rules(context: auth.UserContext = Depends(auth.require_role("admin", "staff"))):
+    rules = await pricing.get_fare_rule_collection(PRIMARY).find(
+        {}, fare_rule_projection.mongo
+    ).sort("_id", 1).to_list(length=None)
+    return fare_rule_projection.response(rules)
+
+
+@router.post("/rules", response_model=schemas.FareRuleResponse)
+async def create_fare_rule(
+    rule: schemas.FareRuleCreate,
+    context: auth.UserContext = Depends(auth.require_role("admin"))
+):
+    rule_data = rule.model_dump()
+    try:
+        pricing.validate_rule(rule_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if rule_data["route_id"] and not ObjectId.is_valid(rule_data["route_id"]):
+        raise HTTPException(status_code=400, detail="Invalid route ID format")
+    rule_data["created_at"] = datetime.utcnow()
+    result = await pricing.get_fare_rule_collection(PRIMARY).insert_one(rule_data)
+    # Worker này dùng bảng giá mới ngay, các worker khác sau tối đa FARE_RULES_TTL_SECONDS
+    pricing.fare_engine.mark_stale()
+    rule_data["id"] = str(result.inserted_id)
+    return schemas.FareRuleResponse(**rule_data)
+
+
+@router.delete("/rules/{rule_id}")
+async def delete_fare_rule(rule_id: str, context: auth.UserContext = Depends(auth.require_role("admin"))):
+    if not ObjectId.is_valid(rule_id):
+        raise HTTPException(status_code=400, detail="Invalid rule ID format")
+    result = await pricing.get_fare_rule_collection(PRIMARY).delete_one({"_id": ObjectId(rule_id)})
+    if not result.deleted_count:
+        raise HTTPException(status_code=404, detail="Fare rule not found")
+    pricing.fare_engine.mark_stale()
+    return {"detail": "Fare rule deleted"}
@@ -1,21 +1,51 @@
-from fastapi import APIRouter, HTTPException, Query
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from collections import Counter
+from datetime import date, datetime
 from typing import List
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
-from app.database import db
-from app import schemas
+from app.database import CATALOG, PRIMARY, collection
+from app.cache import cache
+from app.availability import CALENDAR_MAX_DAYS, availability_view
+from app import auth, pagination, projections, reservations, schemas, seat_counters, seat_layouts
+from app.places import place_key
+from app.pricing import fare_engine
+from app.search import route_graph
+from app.seat_events import seat_events
+from app.seat_store import seat_store
 
 router = APIRouter()
 
-def get_route_collection():
-    return db["routes"]
+def get_route_collection(workload: str = PRIMARY):
+    return collection("routes", workload)
 
-def get_bus_collection():
-    return db["buses"]
+def get_bus_collection(workload: str = PRIMARY):
+    return collection("buses", workload)
 
-def get_seat_collection():
-    return db["seats"]
+async def get_cached_route(route_id: str):
+    # ObjectId sai định dạng -> InvalidId, giống find_one trực tiếp
+    object_id = ObjectId(route_id)
+    return await cache.get_or_load(f"routes:id:{route_id}", lambda: get_route_collection().find_one({"_id": object_id}))
+
+async def get_bus_with_counters(object_id: ObjectId):
+    """
+    Bus cho trang chi tiết/giá ghế: phần tĩnh từ cache (bỏ bộ đếm ghế), bộ đếm đọc lại từ primary mỗi lần.
+    Bộ đếm đổi theo từng lần giữ/bán ghế mà cache của worker khác không được xóa, nên không được cache.
+    """
+    static_fields = {field: 0 for field in seat_counters.COUNTER_FIELDS}
+    bus = await cache.get_or_load(
+        f"buses:id:{object_id}", lambda: get_bus_collection().find_one({"_id": object_id}, static_fields)
+    )
+    if not bus:
+        return None
+    counters = await get_bus_collection().find_one(
+        {"_id": object_id}, {field: 1 for field in seat_counters.COUNTER_FIELDS}
+    )
+    if not counters:
+        return None
+    return {**bus, **{field: counters.get(field) for field in seat_counters.COUNTER_FIELDS}}
 
 @router.post("/routes", response_model=schemas.RouteResponse)
 async def create_route(route: schemas.RouteCreate):
@@ -23,8 +53,13 @@ async def create_route(route: schemas.RouteCreate):
     
     route_dict = route.dict()
     route_dict["created_at"] = datetime.utcnow()
+    # Key không dấu cho tìm kiếm chuyến
+    route_dict["departure_key"] = place_key(route.departure)
+    route_dict["destination_key"] = place_key(route.destination)
     
     result = await route_collection.insert_one(route_dict)
+    await cache.invalidate("routes:list:")
+    route_graph.mark_stale()
     created_route = await route_collection.find_one({"_id": result.inserted_id})
     created_route["id"] = str(created_route["_id"])
     del created_route["_id"]
@@ -33,17 +68,24 @@ async def create_route(route: schemas.RouteCreate):
 @router.post("/buses", response_model=schemas.BusResponse)
 async def create_bus(bus: schemas.BusCreate):
     bus_collection = get_bus_collection()
-    route_collection = get_route_collection()
     
     try:
-        route = await route_collection.find_one({"_id": ObjectId(bus.route_id)})
+        route = await get_cached_route(bus.route_id)
         if not route:
             raise HTTPException(status_code=404, detail="Route not found")
     except:
         raise HTTPException(status_code=400, detail="Invalid route ID format")
     bus_dict = bus.dict()
     bus_dict["created_at"] = datetime.utcnow()
-    result = await bus_collection.insert_one(bus_dict)
+    # Bộ đếm ghế, được cập nhật mỗi khi ghế đổi trạng thái
+    for field in seat_counters.COUNTER_FIELDS:
+        bus_dict[field] = 0
+    try:
+        result = await bus_collection.insert_one(bus_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Bus already exists for this route and departure time")
+    await cache.invalidate("buses:")
+    availability_view.mark_day(bus.route_id, bus.departure_time)
     
     created_bus = await bus_collection.find_one({"_id": result.inserted_id})
     created_bus["id"] = str(created_bus["_id"])
@@ -52,12 +94,13 @@ async def create_bus(bus: schemas.BusCreate):
 
 @router.get("/routes", response_model=List[schemas.RouteResponse])
 async def get_routes(
-    skip: int = Query(default=0, ge=0),
+    skip: int = Query(default=0, ge=0, le=pagination.MAX_SKIP),
     limit: int = Query(default=10, ge=1, le=100),
+    cursor: str = None,
     departure: str = None,
     destination: str = None
 ):
-    route_collection = get_route_collection()
+    route_collection = get_route_collection(CATALOG)
     
     # Xây dựng query filter
     query = {}
@@ -65,24 +108,64 @@ async def get_routes(
         query["departure"] = {"$regex": departure, "$options": "i"}
     if destination:
         query["destination"] = {"$regex": destination, "$options": "i"}
+    if cursor:
+        try:
+            query.update(pagination.keyset_filter(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    # Thực hiện truy vấn với phân trang
-    routes = await route_collection.find(query).skip(skip).limit(limit).to_list(length=limit)
-    formatted_routes = []
-    for route in routes:
-        route["id"] = str(route["_id"])
-        del route["_id"]
-        formatted_routes.append(schemas.RouteResponse(**route))
-    return formatted_routes
+    # Phân trang theo _id (keyset), skip chỉ dùng cho offset nhỏ
+    cache_key = f"routes:list:{departure}:{destination}:{cursor}:{skip}:{limit}"
+    routes = await cache.get_or_load(
+        cache_key,
+        lambda: route_collection.find(query, projections.route_projection.mongo)
+        .sort(pagination.sort_spec()).skip(skip).limit(limit).to_list(length=limit)
+    )
+    headers = {}
+    if len(routes) == limit:
+        headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(routes[-1])
+    return projections.route_projection.response(routes, headers)
+
+@router.get("/routes/{route_id}/calendar", response_model=List[schemas.CalendarDay])
+async def get_route_calendar(
+    route_id: str,
+    start: date = None,
+    days: int = Query(default=CALENDAR_MAX_DAYS, ge=1, le=CALENDAR_MAX_DAYS),
+    min_seats: int = Query(default=1, ge=1)
+):
+    # Các ngày có chuyến của route, đọc từ bảng tổng hợp route_availability thay vì từng chuyến xe
+    if not ObjectId.is_valid(route_id):
+        raise HTTPException(status_code=400, detail="Invalid route ID format")
+    route = await get_cached_route(route_id)
+    if not route:
+        raise HTTPException(status_code=404, detail="Route not found")
+    rows = await availability_view.calendar(route_id, start or datetime.utcnow().date(), days)
+
+    # Giá "từ" của một ngày: chuyến rẻ nhất còn đủ min_seats ghế, theo bảng giá động
+    await fare_engine.refresh()
+    now = datetime.utcnow()
+    calendar = []
+    for row in rows:
+        fares = [fare_engine.bus_fare(route_id, route["price"], trip, now)
+                 for trip in row["trips"] if trip["available_seats"] >= min_seats]
+        calendar.append({
+            "date": row["date"],
+            "departures": row["departures"],
+            "available_seats": row["available_seats"],
+            "first_departure": row["first_departure"],
+            "min_price": min(fares) if fares else None,
+        })
+    return ORJSONResponse(calendar)
 
 @router.get("/buses", response_model=List[schemas.BusResponse])
 async def get_buses(
     route_id: str = None,
     date: datetime = None,
-    skip: int = Query(default=0, ge=0),
-    limit: int = Query(default=10, ge=1, le=100)
+    skip: int = Query(default=0, ge=0, le=pagination.MAX_SKIP),
+    limit: int = Query(default=10, ge=1, le=100),
+    cursor: str = None
 ):
-    bus_collection = get_bus_collection()
+    bus_collection = get_bus_collection(CATALOG)
     
     # Xây dựng query filter
     query = {}
@@ -93,23 +176,27 @@ async def get_buses(
         start_of_day = datetime(date.year, date.month, date.day)
         end_of_day = datetime(date.year, date.month, date.day, 23, 59, 59)
         query["departure_time"] = {"$gte": start_of_day, "$lte": end_of_day}
-    # Thực hiện truy vấn với phân trang
-    buses = await bus_collection.find(query).skip(skip).limit(limit).to_list(length=limit)
-    formatted_buses = []
-    for bus in buses:
-        bus["id"] = str(bus["_id"])
-        del bus["_id"]
-        formatted_buses.append(schemas.BusResponse(**bus))
-    return formatted_buses
+    if cursor:
+        try:
+            query.update(pagination.keyset_filter(cursor, "departure_time"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Phân trang theo (departure_time, _id), skip chỉ dùng cho offset nhỏ
+    buses = await bus_collection.find(query, projections.bus_projection.mongo).sort(
+        pagination.sort_spec("departure_time")
+    ).skip(skip).limit(limit).to_list(length=limit)
+    headers = {}
+    if len(buses) == limit:
+        headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(buses[-1], "departure_time")
+    return projections.bus_projection.response(buses, headers)
 
 @router.get("/buses/{bus_id}", response_model=schemas.BusResponse)
 async def get_bus_detail(bus_id: str):
-    bus_collection = get_bus_collection()
-    
     try:
-        bus = await bus_collection.find_one({"_id": ObjectId(bus_id)})
+        object_id = ObjectId(bus_id)
     except:
         raise HTTPException(status_code=400, detail="Invalid bus ID format")
+    bus = await get_bus_with_counters(object_id)
         
     if not bus:
         raise HTTPException(status_code=404, detail="Bus not found")
@@ -118,12 +205,70 @@ async def get_bus_detail(bus_id: str):
     del bus["_id"]
     return schemas.BusResponse(**bus)
 
-@router.post("/buses/{bus_id}/seats", response_model=List[schemas.SeatResponse])
-async def create_bus_seats(bus_id: str):
+async def insert_seat_documents(buses: List[dict]) -> List[dict]:
+    """
+    Tạo ghế cho các xe qua seat_store; xe đã có ghế bị bỏ qua.
+    Trả về các ghế thực sự được tạo (đã có _id) mà không cần đọc lại.
+    """
+    created_seats = await seat_store.create(buses)
+    await seat_counters.add_available_seats(Counter(seat["bus_id"] for seat in created_seats))
+    return created_seats
+
+def format_seats(seats: List[dict]) -> List[schemas.SeatResponse]:
+    formatted_seats = []
+    for seat in seats:
+        seat["id"] = str(seat["_id"])
+        del seat["_id"]
+        formatted_seats.append(schemas.SeatResponse(**seat))
+    return formatted_seats
+
+@router.post("/buses/seats/batch", response_model=schemas.SeatBatchResponse)
+async def create_fleet_seats(batch: schemas.SeatBatchCreate):
     bus_collection = get_bus_collection()
-    seat_collection = get_seat_collection()
     route_collection = get_route_collection()
+
+    if batch.layout not in seat_layouts.SEAT_LAYOUTS:
+        raise HTTPException(status_code=400, detail="Unknown seat layout")
+    try:
+        bus_object_ids = [ObjectId(bus_id) for bus_id in batch.bus_ids]
+    except:
+        raise HTTPException(status_code=400, detail="Invalid bus ID format")
+
+    buses = await bus_collection.find({"_id": {"$in": bus_object_ids}}).to_list(length=None)
+    route_ids = {ObjectId(bus["route_id"]) for bus in buses if ObjectId.is_valid(bus["route_id"])}
+    routes = await route_collection.find({"_id": {"$in": list(route_ids)}}, {"price": 1}).to_list(length=None)
+    prices = {str(route["_id"]): route["price"] for route in routes}
+
+    found = {str(bus["_id"]) for bus in buses}
+    errors = {bus_id: "Bus not found" for bus_id in batch.bus_ids if bus_id not in found}
+    seats_to_create = []
+    for bus in buses:
+        bus_id = str(bus["_id"])
+        if bus["route_id"] not in prices:
+            errors[bus_id] = "Route not found"
+            continue
+        try:
+            seat_layouts.generate_seats(bus["capacity"], batch.layout)
+        except ValueError as e:
+            errors[bus_id] = str(e)
+            continue
+        seats_to_create.append(
+            {"bus_id": bus_id, "capacity": bus["capacity"], "price": prices[bus["route_id"]], "layout": batch.layout}
+        )
+
+    created_seats = await insert_seat_documents(seats_to_create)
+    created_bus_ids = {seat["bus_id"] for seat in created_seats}
+    for bus_id in found - created_bus_ids:
+        errors.setdefault(bus_id, "Seats already created for this bus")
+
+    return schemas.SeatBatchResponse(seats=format_seats(created_seats), errors=errors)
+
+@router.post("/buses/{bus_id}/seats", response_model=List[schemas.SeatResponse])
+async def create_bus_seats(bus_id: str, layout: str = "default"):
+    bus_collection = get_bus_collection()
     
+    if layout not in seat_layouts.SEAT_LAYOUTS:
+        raise HTTPException(status_code=400, detail="Unknown seat layout")
     try:
         bus = await bus_collection.find_one({"_id": ObjectId(bus_id)})
         if not bus:
@@ -131,52 +276,94 @@ async def create_bus_seats(bus_id: str):
     except:
         raise HTTPException(status_code=400, detail="Invalid bus ID format")
     
-    # Kiểm tra xem đã có ghế nào được tạo chưa
-    existing_seats = await seat_collection.find({"bus_id": bus_id}).to_list(length=100)
-    if existing_seats:
-        raise HTTPException(status_code=400, detail="Seats already created for this bus")
-    
     # Lấy thông tin route để lấy giá vé
-    route = await route_collection.find_one({"_id": ObjectId(bus["route_id"])})
+    route = await get_cached_route(bus["route_id"])
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
     
-    # Tạo danh sách ghế dựa trên capacity của xe
-    seats_to_create = []
-    for i in range(1, bus["capacity"] + 1):
-        seat_dict = {
-            "seat_number": f"A{i:02d}",  # Format: A01, A02, ...
-            "bus_id": bus_id,
-            "is_available": True,
-            "price": route["price"],  # Lấy giá từ route
-            "created_at": datetime.utcnow()
-        }
-        seats_to_create.append(seat_dict)
-    result = await seat_collection.insert_many(seats_to_create)
-    created_seats = await seat_collection.find({"bus_id": bus_id}).to_list(length=100)
-
-    formatted_seats = []
-    for seat in created_seats:
-        seat["id"] = str(seat["_id"])
-        del seat["_id"]
-        formatted_seats.append(schemas.SeatResponse(**seat))
-    return formatted_seats
+    # Tạo danh sách ghế dựa trên capacity của xe và mẫu sơ đồ ghế
+    try:
+        seat_layouts.generate_seats(bus["capacity"], layout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    created_seats = await insert_seat_documents(
+        [{"bus_id": bus_id, "capacity": bus["capacity"], "price": route["price"], "layout": layout}]
+    )
+    if not created_seats:
+        raise HTTPException(status_code=400, detail="Seats already created for this bus")
+    return format_seats(created_seats)
 
 @router.get("/buses/{bus_id}/seats", response_model=List[schemas.SeatResponse])
 async def get_bus_seats(bus_id: str):
-    seat_collection = get_seat_collection()
-    try:
-        seats = await seat_collection.find({"bus_id": bus_id}).to_list(length=100)
-    except:
+    if not ObjectId.is_valid(bus_id):
         raise HTTPException(status_code=400, detail="Invalid bus ID format")
+    object_id = ObjectId(bus_id)
+    seats = await seat_store.find(bus_id, {**projections.seat_projection.mongo, "hold_id": 1, "hold_expires_at": 1})
     
     if not seats:
         raise HTTPException(status_code=404, detail="No seats found for this bus")
-    
-    formatted_seats = []
-    for seat in seats:
-        seat["id"] = str(seat["_id"])
-        del seat["_id"]
-        formatted_seats.append(schemas.SeatResponse(**seat))
-    
-    return formatted_seats
\ No newline at end of file
+
+    # Giá trả về là giá động theo bảng giá; giá lưu trên ghế là giá gốc
+    items = projections.seat_projection.apply(seats)
+    bus = await get_bus_with_counters(object_id)
+    if bus:
+        await fare_engine.refresh()
+        for item, price in zip(items, fare_engine.price_seats(bus, seats)):
+            item["price"] = price
+    return ORJSONResponse(items)
+
+@router.get("/buses/{bus_id}/seats/stream")
+async def stream_bus_seats(bus_id: str):
+    # Server-sent events thay cho việc poll GET /buses/{bus_id}/seats: snapshot một lần, sau đó chỉ gửi delta
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus ID format")
+    return StreamingResponse(
+        seat_events.sse(bus_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/buses/{bus_id}/seats/hold", response_model=schemas.SeatHoldResponse)
+async def hold_bus_seats(
+    bus_id: str,
+    hold_request: schemas.SeatHoldRequest,
+    current_user_id: str = Depends(auth.get_current_user)
+):
+    if not hold_request.seat_numbers:
+        raise HTTPException(status_code=400, detail="No seats selected")
+    try:
+        hold = await reservations.hold_seats(bus_id, hold_request.seat_numbers, current_user_id)
+    except reservations.SeatsUnavailable:
+        raise HTTPException(status_code=409, detail="One or more seats are not available")
+
+    return schemas.SeatHoldResponse(
+        hold_id=str(hold["_id"]),
+        bus_id=hold["bus_id"],
+        seat_numbers=hold["seat_numbers"],
+        expires_at=hold["expires_at"]
+    )
+
+@router.post("/buses/{bus_id}/seats/confirm", response_model=schemas.SeatBookingResponse)
+async def confirm_bus_seats(
+    bus_id: str,
+    confirm_request: schemas.SeatConfirmRequest,
+    current_user_id: str = Depends(auth.get_current_user)
+):
+    try:
+        hold_id = ObjectId(confirm_request.hold_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid hold ID format")
+
+    try:
+        booking = await reservations.confirm_hold(bus_id, hold_id, current_user_id)
+    except reservations.SeatsUnavailable:
+        raise HTTPException(status_code=409, detail="Seats could not be confirmed")
+    if not booking:
+        raise HTTPException(status_code=404, detail="Hold not found or expired")
+
+    return schemas.SeatBookingResponse(
+        hold_id=str(booking["_id"]),
+        bus_id=booking["bus_id"],
+        seat_numbers=booking["seat_numbers"],
+        booked_at=booking["booked_at"]
+    )
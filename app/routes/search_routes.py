@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Query
+from datetime import date
+from typing import List
+
+from app import schemas, search
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+@router.get("/trips", response_model=List[schemas.TripItinerary])
+async def search_trips(
+    departure: str,
+    destination: str,
+    date: date,
+    max_transfers: int = Query(default=2, ge=0, le=2),
+    min_seats: int = Query(default=1, ge=1),
+    limit: int = Query(default=20, ge=1, le=100)
+):
+    # Địa danh được so khớp không dấu: "ha noi", "Hà Nội", "HÀ NỘI" đều như nhau
+    itineraries = await search.search_trips(departure, destination, date, max_transfers, min_seats, limit)
+    return [schemas.TripItinerary(**itinerary) for itinerary in itineraries]
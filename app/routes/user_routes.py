@@ -1,12 +1,13 @@
 from fastapi import APIRouter, HTTPException, Request, Depends
 from app.database import get_user_collection
-from app import auth, schemas
+from app import accounts, auth, schemas
+from pymongo import ReturnDocument
 from pymongo.errors import DuplicateKeyError
 from datetime import timedelta, datetime
-from app.auth import verify_password, create_access_token
-from app.validators import validate_password, validate_username
+from app.auth import create_access_token
+from app.validators import validate_password
 from app.email_service import email_service
-import secrets
+from app.rate_limit import rate_limiter
 from fastapi.responses import HTMLResponse
 from app.schemas import LoginResponse, UserLogin
 from bson import ObjectId
@@ -15,72 +16,49 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 @router.post("/register", response_model=schemas.UserResponse)
 async def register_user(user: schemas.UserCreate, request: Request):
-    # Validate username
-    is_valid_username, username_message = validate_username(user.username)
-    if not is_valid_username:
-        raise HTTPException(status_code=400, detail=username_message)
+    await rate_limiter.enforce("register_email", user.email.lower())
+    # Validate username + password
+    error = accounts.validate_account(user.username, user.password)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
 
-    # Validate password
-    is_valid_password, password_message = validate_password(user.password)
-    if not is_valid_password:
-        raise HTTPException(status_code=400, detail=password_message)
+    hashed_password = await auth.password_hasher.hash(user.password)
+    verification_token, user_data = accounts.user_document(
+        user.username, user.email, hashed_password, datetime.utcnow()
+    )
+    # Không kiểm tra trước: index unique trên email/username chặn tài khoản trùng ngay trong lệnh insert
+    try:
+        result = await get_user_collection().insert_one(user_data)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=accounts.duplicate_message(e.details or {}))
 
-    user_collection = get_user_collection()
-    # check email
-    existing_user = await user_collection.find_one({
-        "$or": [
-            {"username": user.username},
-            {"email": user.email}
-        ]
-    })
-    
-    if existing_user:
-        if existing_user["email"] == user.email:
-            raise HTTPException(status_code=400, detail="Email has been registered")
-        if existing_user["username"] == user.username:
-            raise HTTPException(status_code=400, detail="Username already in use")
-
-    # Tạo verification token
-    verification_token = secrets.token_urlsafe(32)
-    current_time = datetime.utcnow()
-    hashed_password = auth.hash_password(user.password)
-    user_data = {
-        "username": user.username,
-        "email": user.email,
-        "hashed_password": hashed_password,
-        "is_email_verified": False,
-        "verification_token": verification_token,
-        "verification_token_expires": current_time + timedelta(hours=24),
-        "created_at": current_time,
-        "email_verified_at": None
-    }
+    # Đưa email xác thực vào hàng đợi, không chờ SMTP
+    await email_service.send_verification_email(user.email, verification_token)
 
-    try:
-        result = await user_collection.insert_one(user_data)
-        user_data["_id"] = str(result.inserted_id)
-        
-        # Gửi email xác thực
-        await email_service.send_verification_email(user.email, verification_token)
-        
-        return schemas.UserResponse(
-            id=user_data["_id"], 
-            username=user_data["username"], 
-            email=user_data["email"],
-            created_at=user_data["created_at"],
-            email_verified_at=user_data["email_verified_at"],
-            is_email_verified=user_data["is_email_verified"]
-        )
-    except DuplicateKeyError:
-        raise HTTPException(status_code=400, detail="Email or username already exists!")
+    return schemas.UserResponse(
+        id=str(result.inserted_id),
+        username=user_data["username"],
+        email=user_data["email"],
+        created_at=user_data["created_at"],
+        email_verified_at=user_data["email_verified_at"],
+        is_email_verified=user_data["is_email_verified"]
+    )
+
+@router.post("/import", response_model=schemas.UserImportResponse)
+async def import_users(
+    user_import: schemas.UserImportRequest,
+    context: auth.UserContext = Depends(auth.require_role("admin"))
+):
+    # Onboard tài khoản doanh nghiệp hàng loạt; verified=true bỏ qua bước xác thực email
+    report = await accounts.import_users(
+        [account.model_dump() for account in user_import.users], user_import.verified
+    )
+    return schemas.UserImportResponse(**report)
 
 @router.get("/verify-email", response_class=HTMLResponse)
 async def verify_email(token: str):
 
-    user_collection = get_user_collection()
-    user = await user_collection.find_one({
-        "verification_token": token,
-        "verification_token_expires": {"$gt": datetime.utcnow()}
-    })
+    user = await accounts.verify_email_token(token)
 
     if not user:
         return HTMLResponse(
@@ -104,19 +82,6 @@ async def verify_email(token: str):
             """, 
             status_code=400
         )
-    current_time = datetime.utcnow()
-    await user_collection.update_one(
-        {"_id": user["_id"]},
-        {
-            "$set": {
-                "is_email_verified": True,
-                "verification_token": None,
-                "verification_token_expires": None,
-                "email_verified_at": current_time
-            }
-        }
-    )
-
     return HTMLResponse(
         content=f"""
         <html>
@@ -176,14 +141,16 @@ async def update_profile(profile_update: schemas.UserProfileUpdate, current_user
     allowed_fields = ['user_name','full_name', 'age', 'phone_number', 'address']
     update_data = {k: v for k, v in profile_update.dict().items() if v is not None and k in allowed_fields}
     if update_data:
-        result = await users.update_one(
+        # Một round trip: cập nhật và lấy lại document sau khi cập nhật
+        user_data = await users.find_one_and_update(
             {"_id": ObjectId(current_user_id)},
-            {"$set": update_data}
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER
         )
-        if result.modified_count == 0:
-            raise HTTPException(status_code=404, detail="User not found")
-    
-    user_data = await users.find_one({"_id": ObjectId(current_user_id)})
+    else:
+        user_data = await users.find_one({"_id": ObjectId(current_user_id)})
+    if not user_data:
+        raise HTTPException(status_code=404, detail="User not found")
     return schemas.UserProfileResponse(
         id=str(user_data["_id"]),
         username=user_data["username"],
@@ -199,6 +166,8 @@ async def update_profile(profile_update: schemas.UserProfileUpdate, current_user
 
 @router.post("/login", response_model=LoginResponse)
 async def login(user: UserLogin):
+    # Giới hạn theo email chặn dò mật khẩu của một tài khoản từ nhiều IP
+    await rate_limiter.enforce("login_email", user.email.lower())
     users = get_user_collection()
     user_data = await users.find_one({"email": user.email})
     if not user_data:
@@ -206,15 +175,19 @@ async def login(user: UserLogin):
 
     if "hashed_password" not in user_data:
         raise HTTPException(status_code=500, detail="User data error: missing password!")
-    if not verify_password(user.password, user_data["hashed_password"]):
+    is_valid, new_hash = await auth.password_hasher.verify_and_update(user.password, user_data["hashed_password"])
+    if not is_valid:
         raise HTTPException(status_code=400, detail="Incorrect email or password!")
+    if new_hash:
+        # Tham số bcrypt đã thay đổi, lưu lại hash mới
+        await users.update_one({"_id": user_data["_id"]}, {"$set": {"hashed_password": new_hash}})
     if not user_data.get("is_email_verified", False):
         raise HTTPException(
             status_code=403, 
             detail="Please verify your email before logging in. Check your inbox for verification."
         )
 
-    access_token = create_access_token(data={"sub": str(user_data["_id"])}, expires_delta=timedelta(minutes=60))
+    access_token = create_access_token(data=auth.user_claims(user_data), expires_delta=timedelta(minutes=60))
     return LoginResponse(
         access_token=access_token,
         token_type="bearer",
@@ -227,3 +200,31 @@ async def login(user: UserLogin):
             is_email_verified=user_data.get("is_email_verified", False)
         )
     )
+
+@router.post("/logout")
+async def logout(context: auth.UserContext = Depends(auth.get_current_user_context)):
+    await auth.token_revocations.revoke_token(context)
+    return {"detail": "Logged out"}
+
+@router.put("/password", response_model=schemas.TokenResponse)
+async def change_password(password_change: schemas.PasswordChange, current_user_id: str = Depends(auth.get_current_user)):
+    is_valid_password, password_message = validate_password(password_change.new_password)
+    if not is_valid_password:
+        raise HTTPException(status_code=400, detail=password_message)
+
+    users = get_user_collection()
+    user_data = await users.find_one({"_id": ObjectId(current_user_id)})
+    if not user_data:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not await auth.password_hasher.verify(password_change.current_password, user_data["hashed_password"]):
+        raise HTTPException(status_code=400, detail="Incorrect password!")
+
+    hashed_password = await auth.password_hasher.hash(password_change.new_password)
+    await users.update_one({"_id": user_data["_id"]}, {"$set": {"hashed_password": hashed_password}})
+
+    # Mọi token cũ (kể cả token đang dùng) hết hiệu lực, trả token mới cho phiên hiện tại
+    user_data = await auth.token_revocations.revoke_user(current_user_id)
+    if not user_data:
+        raise HTTPException(status_code=404, detail="User not found")
+    access_token = create_access_token(data=auth.user_claims(user_data), expires_delta=timedelta(minutes=60))
+    return schemas.TokenResponse(access_token=access_token, token_type="bearer")
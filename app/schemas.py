@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Dict
+from datetime import date, datetime
 
 class UserCreate(BaseModel):
     username: str
@@ -24,6 +24,14 @@ class LoginResponse(BaseModel):
     token_type: str
     user: UserResponse
 
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str
+
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
 class UserProfileUpdate(BaseModel):
     username: Optional[str] = None
     full_name: Optional[str] = None
@@ -76,14 +84,118 @@ class BusResponse(BusBase):
     id: str
     created_at: datetime
     updated_at: Optional[datetime] = None
+    available_seats: Optional[int] = None
+    held_seats: Optional[int] = None
+    sold_seats: Optional[int] = None
 
 class SeatBase(BaseModel):
     seat_number: str
     bus_id: str
     is_available: bool = True
     price: float
+    deck: Optional[str] = None  # lower, upper
+    seat_type: Optional[str] = None  # seat, sleeper, limousine
 
 class SeatResponse(SeatBase):
     id: str
     created_at: datetime
     updated_at: Optional[datetime] = None
+
+class SeatBatchCreate(BaseModel):
+    bus_ids: List[str]
+    layout: str = "default"
+
+class SeatBatchResponse(BaseModel):
+    seats: List[SeatResponse]
+    errors: Dict[str, str]  # bus_id -> lý do không tạo được ghế
+
+class SeatHoldRequest(BaseModel):
+    seat_numbers: List[str]
+
+class SeatHoldResponse(BaseModel):
+    hold_id: str
+    bus_id: str
+    seat_numbers: List[str]
+    expires_at: datetime
+
+class SeatConfirmRequest(BaseModel):
+    hold_id: str
+
+class SeatBookingResponse(BaseModel):
+    hold_id: str
+    bus_id: str
+    seat_numbers: List[str]
+    booked_at: datetime
+
+class TripLeg(BaseModel):
+    bus_id: str
+    bus_number: str
+    route_id: str
+    route_code: str
+    departure: str
+    destination: str
+    departure_time: datetime
+    arrival_time: datetime
+    available_seats: int
+    price: float
+
+class TripItinerary(BaseModel):
+    legs: List[TripLeg]
+    transfers: int
+    departure_time: datetime
+    arrival_time: datetime
+    total_price: float
+    available_seats: int  # số ghế trống ít nhất trong các chặng
+
+class CalendarDay(BaseModel):
+    date: date
+    departures: int
+    available_seats: int
+    first_departure: datetime
+    min_price: Optional[float] = None  # None nếu không chuyến nào còn đủ min_seats ghế
+
+class FareRuleBase(BaseModel):
+    factor: str  # seat_class, departure_hour, occupancy, days_to_departure
+    multiplier: float
+    route_id: Optional[str] = None  # None: áp dụng cho mọi route
+    seat_type: Optional[str] = None  # seat_class: seat, sleeper, limousine
+    deck: Optional[str] = None  # seat_class: lower, upper
+    min_value: Optional[float] = None  # các yếu tố còn lại: khoảng [min_value, max_value)
+    max_value: Optional[float] = None
+    description: Optional[str] = None
+
+class FareRuleCreate(FareRuleBase):
+    pass
+
+class FareRuleResponse(FareRuleBase):
+    id: str
+    created_at: datetime
+
+class ImportRowError(BaseModel):
+    row: int  # số dòng trong file (CSV/NDJSON), số thứ tự rule hoặc tài khoản (từ 1)
+    error: str
+
+class UserImportItem(UserCreate):
+    full_name: Optional[str] = None
+    phone_number: Optional[str] = None
+    address: Optional[str] = None
+
+class UserImportRequest(BaseModel):
+    users: List[UserImportItem]
+    verified: bool = False  # True: tài khoản được xác thực sẵn, không gửi email xác thực
+
+class UserImportResponse(BaseModel):
+    created: int
+    errors: List[ImportRowError]
+
+class TimetableImportResponse(BaseModel):
+    rows: int
+    routes_created: int
+    buses_created: int
+    buses_skipped: int  # chuyến đã tồn tại (cùng route, giờ khởi hành, biển số)
+    seats_created: int
+    errors: List[ImportRowError]
+    errors_truncated: bool
+    seconds: float
+    rows_per_second: float
+    dry_run: bool
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import List
+
+from app.database import CATALOG, PRIMARY, collection
+from app.places import place_key
+from app.pricing import fare_engine
+
+logger = logging.getLogger(__name__)
+
+# Thời gian chuyển xe tối thiểu/tối đa giữa hai chặng
+MIN_TRANSFER_MINUTES = int(os.getenv("SEARCH_MIN_TRANSFER_MINUTES", "30"))
+MAX_TRANSFER_HOURS = int(os.getenv("SEARCH_MAX_TRANSFER_HOURS", "12"))
+# Khoảng thời gian tối đa của cả hành trình, dùng để giới hạn truy vấn các chặng sau
+MAX_TRIP_HOURS = int(os.getenv("SEARCH_MAX_TRIP_HOURS", "48"))
+# Với mỗi chặng trước, chỉ ghép với vài chuyến nối sớm nhất để số tổ hợp không bùng nổ
+CONNECTIONS_PER_LEG = int(os.getenv("SEARCH_CONNECTIONS_PER_LEG", "3"))
+# Worker khác có thể đã tạo route mới, nên đồ thị cũng được dựng lại định kỳ
+ROUTE_GRAPH_TTL_SECONDS = int(os.getenv("ROUTE_GRAPH_TTL_SECONDS", "60"))
+
+
+def get_route_collection(workload: str = CATALOG):
+    return collection("routes", workload)
+
+
+def get_bus_collection():
+    return collection("buses", CATALOG)
+
+
+async def backfill_place_keys():
+    """Bổ sung departure_key/destination_key cho các route tạo trước khi có tìm kiếm."""
+    routes = get_route_collection(PRIMARY)
+    count = 0
+    async for route in routes.find({"departure_key": {"$exists": False}}, {"departure": 1, "destination": 1}):
+        await routes.update_one(
+            {"_id": route["_id"]},
+            {"$set": {
+                "departure_key": place_key(route["departure"]),
+                "destination_key": place_key(route["destination"]),
+            }}
+        )
+        count += 1
+    if count:
+        logger.info(f"Backfilled place keys on {count} routes")
+
+
+class RouteGraph:
+    """
+    Đồ thị tuyến đường trong bộ nhớ: đỉnh là place key, cạnh là các route nối hai địa điểm.
+    Được dựng lại từ collection routes khi có route mới (mark_stale) hoặc sau ROUTE_GRAPH_TTL_SECONDS.
+    """
+    def __init__(self):
+        self.routes = {}
+        self.edges = defaultdict(list)      # (from_key, to_key) -> [route_id]
+        self.route_edge = {}                # route_id -> (from_key, to_key)
+        self.outgoing = defaultdict(set)    # from_key -> {to_key}
+        self.incoming = defaultdict(set)    # to_key -> {from_key}
+        self._stale = True
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def mark_stale(self):
+        self._stale = True
+
+    def load(self, routes: List[dict]):
+        self.routes = {}
+        self.edges = defaultdict(list)
+        self.route_edge = {}
+        self.outgoing = defaultdict(set)
+        self.incoming = defaultdict(set)
+        for route in routes:
+            route_id = str(route["_id"])
+            origin = route.get("departure_key") or place_key(route["departure"])
+            destination = route.get("destination_key") or place_key(route["destination"])
+            self.routes[route_id] = route
+            self.edges[(origin, destination)].append(route_id)
+            self.route_edge[route_id] = (origin, destination)
+            self.outgoing[origin].add(destination)
+            self.incoming[destination].add(origin)
+        self._stale = False
+        self._loaded_at = time.monotonic()
+
+    def _needs_refresh(self) -> bool:
+        return self._stale or time.monotonic() - self._loaded_at > ROUTE_GRAPH_TTL_SECONDS
+
+    async def refresh(self):
+        if not self._needs_refresh():
+            return
+        async with self._lock:
+            if self._needs_refresh():
+                routes = await get_route_collection().find(
+                    {},
+                    {"route_code": 1, "departure": 1, "destination": 1, "departure_key": 1,
+                     "destination_key": 1, "price": 1, "duration": 1}
+                ).to_list(length=None)
+                self.load(routes)
+
+    def paths(self, origin: str, destination: str, max_transfers: int = 2) -> List[List[str]]:
+        """
+        Liệt kê các chuỗi place key từ origin tới destination với tối đa max_transfers lần chuyển xe.
+        Chỉ giữ các đường đi có nhiều hơn đường đi ít chặng nhất tối đa một lần chuyển xe,
+        để tuyến có xe đi thẳng không kéo theo hàng nghìn đường vòng hai lần chuyển.
+        """
+        paths = []
+        if (origin, destination) in self.edges:
+            paths.append([origin, destination])
+            max_transfers = min(max_transfers, 1)
+        if max_transfers >= 1:
+            for stop in self.outgoing[origin] & self.incoming[destination]:
+                if stop not in (origin, destination):
+                    paths.append([origin, stop, destination])
+        if max_transfers >= 2:
+            for first_stop in self.outgoing[origin]:
+                if first_stop in (origin, destination):
+                    continue
+                for second_stop in self.outgoing[first_stop] & self.incoming[destination]:
+                    if second_stop not in (origin, destination, first_stop):
+                        paths.append([origin, first_stop, second_stop, destination])
+        return paths
+
+
+route_graph = RouteGraph()
+
+
+async def fetch_departures(route_ids: List[str], start: datetime, end: datetime) -> List[dict]:
+    """
+    Một aggregation lấy các chuyến xe của các route trong khoảng thời gian,
+    số ghế còn trống (và held/sold để tính độ lấp đầy) lấy từ bộ đếm trên document bus.
+    """
+    pipeline = [
+        {"$match": {"route_id": {"$in": route_ids}, "departure_time": {"$gte": start, "$lt": end}}},
+        {"$project": {
+            "route_id": 1,
+            "bus_number": 1,
+            "departure_time": 1,
+            "arrival_time": 1,
+            "capacity": 1,
+            "available_seats": {"$ifNull": ["$available_seats", 0]},
+            "held_seats": {"$ifNull": ["$held_seats", 0]},
+            "sold_seats": {"$ifNull": ["$sold_seats", 0]},
+        }},
+        {"$sort": {"departure_time": 1}},
+    ]
+    return await get_bus_collection().aggregate(pipeline).to_list(length=None)
+
+
+def build_itineraries(place_paths: List[List[str]], graph: RouteGraph, departures: List[dict],
+                      day_start: datetime, day_end: datetime, min_seats: int) -> List[dict]:
+    """Ghép các chuyến xe theo từng đường đi, chặng sau khởi hành sau khi chặng trước đến nơi."""
+    by_edge = defaultdict(list)
+    for bus in departures:
+        if bus["available_seats"] >= min_seats:
+            by_edge[graph.route_edge[bus["route_id"]]].append(bus)
+
+    min_transfer = timedelta(minutes=MIN_TRANSFER_MINUTES)
+    max_transfer = timedelta(hours=MAX_TRANSFER_HOURS)
+    itineraries = []
+
+    def extend(path_edges, legs):
+        if len(legs) == len(path_edges):
+            itineraries.append(list(legs))
+            return
+        candidates = by_edge[path_edges[len(legs)]]
+        connections = 0
+        for bus in candidates:
+            if not legs:
+                if not (day_start <= bus["departure_time"] < day_end):
+                    continue
+            else:
+                wait = bus["departure_time"] - legs[-1]["arrival_time"]
+                if wait < min_transfer:
+                    continue
+                # candidates đã sắp xếp theo giờ khởi hành
+                if wait > max_transfer or connections == CONNECTIONS_PER_LEG:
+                    break
+                connections += 1
+            legs.append(bus)
+            extend(path_edges, legs)
+            legs.pop()
+
+    for path in place_paths:
+        extend(list(zip(path, path[1:])), [])
+    return itineraries
+
+
+async def search_trips(departure: str, destination: str, date: date,
+                       max_transfers: int = 2, min_seats: int = 1, limit: int = 20) -> List[dict]:
+    await route_graph.refresh()
+    place_paths = route_graph.paths(place_key(departure), place_key(destination), max_transfers)
+    if not place_paths:
+        return []
+
+    route_ids = sorted({
+        route_id
+        for path in place_paths
+        for edge in zip(path, path[1:])
+        for route_id in route_graph.edges[edge]
+    })
+    day_start = datetime(date.year, date.month, date.day)
+    day_end = day_start + timedelta(days=1)
+    end = day_end if max_transfers == 0 else day_start + timedelta(hours=MAX_TRIP_HOURS)
+    departures = await fetch_departures(route_ids, day_start, end)
+    await fare_engine.refresh()
+
+    itineraries = build_itineraries(place_paths, route_graph, departures, day_start, day_end, min_seats)
+    itineraries.sort(key=lambda legs: (legs[-1]["arrival_time"], len(legs)))
+    return [format_itinerary(legs, route_graph) for legs in itineraries[:limit]]
+
+
+def format_itinerary(legs: List[dict], graph: RouteGraph) -> dict:
+    formatted_legs = []
+    now = datetime.utcnow()
+    for bus in legs:
+        route = graph.routes[bus["route_id"]]
+        formatted_legs.append({
+            "bus_id": str(bus["_id"]),
+            "bus_number": bus["bus_number"],
+            "route_id": bus["route_id"],
+            "route_code": route["route_code"],
+            "departure": route["departure"],
+            "destination": route["destination"],
+            "departure_time": bus["departure_time"],
+            "arrival_time": bus["arrival_time"],
+            "available_seats": bus["available_seats"],
+            "price": fare_engine.bus_fare(bus["route_id"], route["price"], bus, now),
+        })
+    return {
+        "legs": formatted_legs,
+        "transfers": len(legs) - 1,
+        "departure_time": legs[0]["departure_time"],
+        "arrival_time": legs[-1]["arrival_time"],
+        "total_price": sum(leg["price"] for leg in formatted_legs),
+        "available_seats": min(leg["available_seats"] for leg in formatted_legs),
+    }
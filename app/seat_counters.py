@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import sys
+from typing import Dict, List
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.availability import availability_view
+from app.database import collection
+from app.seat_store import COUNTER_FIELDS, seat_store
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def get_bus_collection():
+    return collection("buses")
+
+
+async def adjust_counters(bus_id: str, available: int = 0, held: int = 0, sold: int = 0):
+    """Cộng dồn thay đổi của một lần chuyển trạng thái ghế vào document bus ($inc là atomic)."""
+    changes = {"available_seats": available, "held_seats": held, "sold_seats": sold}
+    changes = {field: value for field, value in changes.items() if value}
+    if not changes:
+        return
+    # Không xóa cache: bus trong cache không chứa bộ đếm (route_routes.get_bus_with_counters)
+    await get_bus_collection().update_one({"_id": ObjectId(bus_id)}, {"$inc": changes})
+    availability_view.mark_bus(bus_id)
+
+
+async def add_available_seats(created_per_bus: Dict[str, int]):
+    """Tăng available_seats cho nhiều xe sau khi tạo ghế, trong một bulk_write."""
+    if not created_per_bus:
+        return
+    await get_bus_collection().bulk_write(
+        [UpdateOne({"_id": ObjectId(bus_id)}, {"$inc": {"available_seats": count}})
+         for bus_id, count in created_per_bus.items()],
+        ordered=False,
+    )
+    for bus_id in created_per_bus:
+        availability_view.mark_bus(bus_id)
+
+
+async def count_seats(bus_ids: List[str]) -> Dict[str, dict]:
+    """Đếm lại trạng thái ghế từ nơi lưu ghế (seats hoặc seat_maps) cho một nhóm xe."""
+    return await seat_store.count(bus_ids)
+
+
+async def reconcile_counters(fix: bool = True, throttle=None) -> List[dict]:
+    """
+    Tính lại bộ đếm của mọi xe từ dữ liệu ghế theo từng lô, ghi đè nếu fix=True.
+    Trả về danh sách các xe bị lệch (bus_id, giá trị đang lưu, giá trị đúng).
+    throttle (jobs.Throttle) được gọi sau mỗi lô khi chạy như job nền.
+    """
+    buses = get_bus_collection()
+    drift = []
+    batch = []
+
+    async def flush():
+        counts = await count_seats([str(bus["_id"]) for bus in batch])
+        updates = []
+        drifted_ids = []
+        for bus in batch:
+            bus_id = str(bus["_id"])
+            expected = counts.get(bus_id, {field: 0 for field in COUNTER_FIELDS})
+            stored = {field: bus.get(field) for field in COUNTER_FIELDS}
+            if stored != expected:
+                drift.append({"bus_id": bus_id, "stored": stored, "expected": expected})
+                updates.append(UpdateOne({"_id": bus["_id"]}, {"$set": expected}))
+                drifted_ids.append(bus_id)
+        if fix and updates:
+            await buses.bulk_write(updates, ordered=False)
+            for bus_id in drifted_ids:
+                availability_view.mark_bus(bus_id)
+        if throttle is not None:
+            await throttle(len(batch))
+        batch.clear()
+
+    async for bus in buses.find({}, {field: 1 for field in COUNTER_FIELDS}).batch_size(RECONCILE_BATCH_SIZE):
+        batch.append(bus)
+        if len(batch) == RECONCILE_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    await availability_view.flush()
+    for item in drift:
+        logger.warning(f"Counter drift on bus {item['bus_id']}: stored {item['stored']}, expected {item['expected']}")
+    logger.info(f"Reconciled seat counters, {len(drift)} buses drifted")
+    return drift
+
+
+if __name__ == "__main__":
+    # python -m app.seat_counters           -> sửa bộ đếm bị lệch
+    # python -m app.seat_counters --dry-run -> chỉ báo cáo, exit code 1 nếu có lệch
+    logging.basicConfig(level=logging.INFO)
+    dry_run = "--dry-run" in sys.argv[1:]
+    drifted = asyncio.run(reconcile_counters(fix=not dry_run))
+    sys.exit(1 if dry_run and drifted else 0)
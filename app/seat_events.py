@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import orjson
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.seat_store import STATES, seat_store
+
+logger = logging.getLogger(__name__)
+
+# Số delta tối đa chờ gửi cho một subscriber; vượt quá thì subscriber bị ngắt (client kết nối lại và nhận snapshot mới)
+QUEUE_SIZE = int(os.getenv("SEAT_EVENTS_QUEUE_SIZE", "256"))
+KEEPALIVE_SECONDS = float(os.getenv("SEAT_EVENTS_KEEPALIVE_SECONDS", "15"))
+# Server đơn lẻ không có change stream: đọc lại ghế của các xe đang được theo dõi theo chu kỳ này
+POLL_SECONDS = float(os.getenv("SEAT_EVENTS_POLL_SECONDS", "1"))
+
+_SEAT_FIELDS = {"seat_number": 1, "is_available": 1, "hold_id": 1, "hold_expires_at": 1}
+
+
+def seat_state(seat: dict, now: datetime) -> str:
+    if not seat.get("is_available", True):
+        return "sold"
+    if seat.get("hold_id") is not None and (seat.get("hold_expires_at") is None or seat["hold_expires_at"] > now):
+        return "held"
+    return "available"
+
+
+def state_from_update(fields: dict) -> Optional[str]:
+    """Trạng thái mới của ghế từ updatedFields của change stream; None nếu update không đổi trạng thái."""
+    if fields.get("is_available") is False:
+        return "sold"
+    if fields.get("hold_id") is not None:
+        return "held"
+    if "hold_id" in fields or fields.get("is_available") is True:
+        return "available"
+    return None
+
+
+class Subscriber:
+    def __init__(self, bus_id: str):
+        self.bus_id = bus_id
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = False
+
+    def push(self, delta: dict) -> bool:
+        try:
+            self.queue.put_nowait(delta)
+            return True
+        except asyncio.QueueFull:
+            # Client đọc không kịp: bỏ các delta đang chờ và báo cho vòng gửi kết thúc stream
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+
+class BusChannel:
+    """Trạng thái ghế hiện tại của một xe và các subscriber của nó."""
+    def __init__(self):
+        self.subscribers = set()
+        self.states: Dict[str, str] = {}            # seat_number -> trạng thái
+        self.seat_numbers: Dict[object, str] = {}   # _id của ghế -> seat_number
+        self.positions: List[str] = []              # seat_number theo vị trí trong seat map (SEAT_STORAGE=compact)
+        self.loaded: Optional[asyncio.Task] = None
+
+
+class SeatEventHub:
+    """
+    Đẩy thay đổi trạng thái ghế tới mọi client đang xem một xe.
+    Mỗi tiến trình mở một change stream trên collection seats (không updateLookup: event chỉ mang _id và
+    các trường đã đổi, _id được tra sang xe/seat_number qua bảng của các xe đang được theo dõi),
+    rồi chia delta (seat_number + trạng thái mới) vào hàng đợi của từng subscriber.
+    Với SEAT_STORAGE=compact, stream mở trên seat_maps: _id là bus_id, vị trí trong status.<i> được tra sang seat_number.
+    Trạng thái ghế của mỗi xe được đọc một lần khi có subscriber đầu tiên; subscriber sau nhận snapshot từ bộ nhớ.
+    Trên server không hỗ trợ change stream, hub đọc lại ghế của các xe đang theo dõi mỗi POLL_SECONDS
+    bằng một query chung, thay vì mỗi client tự poll.
+    """
+    def __init__(self):
+        self.channels: Dict[str, BusChannel] = {}
+        self.seat_buses: Dict[object, str] = {}     # _id của ghế -> bus_id, chỉ cho các xe đang được theo dõi
+        self.mode = None
+        self.reads = 0
+        self.deltas = 0
+        self.dropped = 0
+        self._loading = 0
+        self._recent: Dict[object, str] = {}        # thay đổi của ghế chưa biết thuộc xe nào, trong lúc có xe đang nạp
+        self._resume_token = None
+        self._task = None
+
+    def subscriber_count(self) -> int:
+        return sum(len(channel.subscribers) for channel in self.channels.values())
+
+    async def _load(self, bus_id: str, channel: BusChannel):
+        self._loading += 1
+        try:
+            seats = await seat_store.find(bus_id, _SEAT_FIELDS)
+            self.reads += 1
+            if self.channels.get(bus_id) is not channel:
+                # Mọi subscriber đã rời đi trong lúc đọc
+                return
+            now = datetime.utcnow()
+            for seat in seats:
+                channel.states[seat["seat_number"]] = seat_state(seat, now)
+            if seat_store.compact:
+                # Ghế của seat map được trả về theo vị trí, event chỉ mang vị trí (status.i)
+                channel.positions = [seat["seat_number"] for seat in seats]
+                for (seat_bus_id, position), state in list(self._recent.items()):
+                    if seat_bus_id == bus_id and position < len(channel.positions):
+                        self.publish(bus_id, channel.positions[position], state)
+                return
+            for seat in seats:
+                channel.seat_numbers[seat["_id"]] = seat["seat_number"]
+                self.seat_buses[seat["_id"]] = bus_id
+            # Thay đổi đến trong lúc đang đọc có thể chưa nằm trong kết quả đọc
+            for seat_id, state in list(self._recent.items()):
+                if seat_id in channel.seat_numbers:
+                    self.publish(bus_id, channel.seat_numbers[seat_id], state)
+        except BaseException:
+            self._close(bus_id)
+            raise
+        finally:
+            self._loading -= 1
+            if not self._loading:
+                self._recent.clear()
+
+    async def subscribe(self, bus_id: str):
+        """Đăng ký nhận delta của một xe, trả về (subscriber, snapshot trạng thái mọi ghế)."""
+        subscriber = Subscriber(bus_id)
+        channel = self.channels.get(bus_id)
+        if channel is None:
+            channel = self.channels[bus_id] = BusChannel()
+            channel.loaded = asyncio.create_task(self._load(bus_id, channel))
+        channel.subscribers.add(subscriber)
+        try:
+            await asyncio.shield(channel.loaded)
+        except BaseException:
+            self.unsubscribe(subscriber)
+            raise
+        snapshot = [{"seat_number": number, "state": state} for number, state in sorted(channel.states.items())]
+        return subscriber, snapshot
+
+    def _close(self, bus_id: str):
+        channel = self.channels.pop(bus_id, None)
+        if channel is not None:
+            for seat_id in channel.seat_numbers:
+                self.seat_buses.pop(seat_id, None)
+
+    def unsubscribe(self, subscriber: Subscriber):
+        channel = self.channels.get(subscriber.bus_id)
+        if channel is None:
+            return
+        channel.subscribers.discard(subscriber)
+        if not channel.subscribers:
+            self._close(subscriber.bus_id)
+
+    def publish(self, bus_id: str, seat_number: str, state: str):
+        channel = self.channels.get(bus_id)
+        if channel is None or channel.states.get(seat_number) == state:
+            return
+        channel.states[seat_number] = state
+        delta = {"seat_number": seat_number, "state": state}
+        self.deltas += 1
+        for subscriber in list(channel.subscribers):
+            if not subscriber.push(delta):
+                self.dropped += 1
+                channel.subscribers.discard(subscriber)
+        if not channel.subscribers:
+            self._close(bus_id)
+
+    def _handle_change(self, change: dict):
+        operation = change["operationType"]
+        if operation == "insert":
+            seat = change["fullDocument"]
+            channel = self.channels.get(seat.get("bus_id"))
+            if channel is not None:
+                channel.seat_numbers[seat["_id"]] = seat["seat_number"]
+                self.seat_buses[seat["_id"]] = seat["bus_id"]
+                self.publish(seat["bus_id"], seat["seat_number"], seat_state(seat, datetime.utcnow()))
+            return
+        state = state_from_update(change.get("updateDescription", {}).get("updatedFields", {}))
+        if state is None:
+            return
+        seat_id = change["documentKey"]["_id"]
+        bus_id = self.seat_buses.get(seat_id)
+        if bus_id is not None:
+            self.publish(bus_id, self.channels[bus_id].seat_numbers[seat_id], state)
+        elif self._loading:
+            self._recent[seat_id] = state
+
+    def _handle_map_change(self, change: dict):
+        """Change event của seat_maps: _id là bus_id, trạng thái nằm ở status (insert) hoặc status.<vị trí> (update)."""
+        bus_id = change["documentKey"]["_id"]
+        channel = self.channels.get(bus_id)
+        if channel is None:
+            return
+        if change["operationType"] == "insert":
+            fields = {"status": change["fullDocument"]["status"]}
+        else:
+            fields = change.get("updateDescription", {}).get("updatedFields", {})
+        for path, value in fields.items():
+            if path == "status":
+                changes = enumerate(value)
+            elif path.startswith("status."):
+                changes = [(int(path[len("status."):]), value)]
+            else:
+                continue
+            for position, status in changes:
+                if position < len(channel.positions):
+                    self.publish(bus_id, channel.positions[position], STATES[status])
+                elif self._loading:
+                    self._recent[(bus_id, position)] = STATES[status]
+
+    async def _watch(self):
+        if seat_store.compact:
+            fields = {"fullDocument.status": 1, "updateDescription.updatedFields": 1}
+            handle = self._handle_map_change
+        else:
+            fields = {
+                "fullDocument": 1,
+                "updateDescription.updatedFields.is_available": 1,
+                "updateDescription.updatedFields.hold_id": 1,
+            }
+            handle = self._handle_change
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["insert", "update"]}}},
+            {"$project": {"operationType": 1, "documentKey": 1, **fields}},
+        ]
+        async with seat_store.get_collection().watch(pipeline, resume_after=self._resume_token) as stream:
+            self.mode = "change_stream"
+            async for change in stream:
+                self._resume_token = stream.resume_token
+                handle(change)
+
+    async def poll_once(self):
+        # Xe đang nạp snapshot sẽ được đọc ở lượt sau
+        bus_ids = [bus_id for bus_id, channel in self.channels.items() if channel.loaded.done()]
+        if not bus_ids:
+            return
+        seats = await seat_store.find_many(bus_ids, _SEAT_FIELDS)
+        self.reads += 1
+        now = datetime.utcnow()
+        for seat in seats:
+            self.publish(seat["bus_id"], seat["seat_number"], seat_state(seat, now))
+
+    async def _poll(self):
+        self.mode = "poll"
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error polling seat states: {str(e)}")
+            await asyncio.sleep(POLL_SECONDS)
+
+    async def _run(self):
+        while True:
+            try:
+                await self._watch()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                # Server đơn lẻ không hỗ trợ change stream
+                logger.warning(f"Seat change stream unavailable ({e}), polling every {POLL_SECONDS}s")
+                await self._poll()
+            except PyMongoError as e:
+                logger.error(f"Seat change stream error, resuming: {str(e)}")
+                await asyncio.sleep(1)
+            except Exception as e:
+                # Driver không có watch (vd. mongomock khi chạy benchmark)
+                logger.warning(f"Seat change stream not supported ({e}), polling every {POLL_SECONDS}s")
+                await self._poll()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def sse(self, bus_id: str):
+        """Luồng text/event-stream: một event snapshot, sau đó các event seats chứa danh sách delta."""
+        subscriber, snapshot = await self.subscribe(bus_id)
+        try:
+            yield b"event: snapshot\ndata: " + orjson.dumps(snapshot) + b"\n\n"
+            while True:
+                try:
+                    delta = await asyncio.wait_for(subscriber.queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if delta is None:
+                    yield b"event: dropped\ndata: {}\n\n"
+                    return
+                # Gộp các delta đang chờ vào một event
+                deltas: List[dict] = [delta]
+                while not subscriber.queue.empty():
+                    delta = subscriber.queue.get_nowait()
+                    if delta is None:
+                        yield b"event: dropped\ndata: {}\n\n"
+                        return
+                    deltas.append(delta)
+                yield b"event: seats\ndata: " + orjson.dumps(deltas) + b"\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+seat_events = SeatEventHub()
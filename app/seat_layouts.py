@@ -0,0 +1,52 @@
+from typing import List
+
+# Mẫu sơ đồ ghế. Mỗi tầng (deck) có tiền tố riêng cho số ghế: A01, A02, ... / B01, B02, ...
+# Ghế được đánh số theo từng hàng, từ tầng dưới lên tầng trên, cho đến khi đủ capacity.
+SEAT_LAYOUTS = {
+    # Mặc định giữ nguyên cách đánh số cũ: A01..Axx trên một tầng
+    "default": {"seat_type": "seat", "decks": [{"deck": "lower", "prefix": "A", "rows": None, "columns": None}]},
+    "seat_45": {"seat_type": "seat", "decks": [{"deck": "lower", "prefix": "A", "rows": 12, "columns": 4}]},
+    "sleeper_40": {
+        "seat_type": "sleeper",
+        "decks": [
+            {"deck": "lower", "prefix": "A", "rows": 7, "columns": 3},
+            {"deck": "upper", "prefix": "B", "rows": 7, "columns": 3},
+        ],
+    },
+    "limousine_22": {
+        "seat_type": "limousine",
+        "decks": [
+            {"deck": "lower", "prefix": "A", "rows": 6, "columns": 2},
+            {"deck": "upper", "prefix": "B", "rows": 5, "columns": 2},
+        ],
+    },
+}
+
+
+def generate_seats(capacity: int, layout: str = "default") -> List[dict]:
+    """Sinh danh sách ghế (seat_number, deck, seat_type) theo mẫu. Mẫu không đủ chỗ -> ValueError."""
+    template = SEAT_LAYOUTS[layout]
+    seats = []
+    for deck in template["decks"]:
+        deck_size = capacity if deck["rows"] is None else deck["rows"] * deck["columns"]
+        for i in range(1, deck_size + 1):
+            if len(seats) == capacity:
+                return seats
+            seats.append({
+                "seat_number": f"{deck['prefix']}{i:02d}",
+                "deck": deck["deck"],
+                "seat_type": template["seat_type"],
+            })
+    if len(seats) < capacity:
+        raise ValueError(f"Layout {layout} has only {len(seats)} seats, bus capacity is {capacity}")
+    return seats
+
+
+def seat_order(seat_number: str) -> tuple:
+    """
+    Khóa sắp xếp ghế theo vị trí trong sơ đồ: tiền tố tầng (theo thứ tự tầng của mẫu) rồi số ghế dạng số,
+    để A100 đứng sau A99 chứ không nằm giữa A10 và A11 như khi so chuỗi.
+    """
+    prefix = seat_number.rstrip("0123456789")
+    digits = seat_number[len(prefix):]
+    return prefix, int(digits) if digits else 0, seat_number
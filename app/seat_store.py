@@ -0,0 +1,516 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.database import PRIMARY, collection
+from app.seat_layouts import SEAT_LAYOUTS, generate_seats, seat_order
+
+logger = logging.getLogger(__name__)
+
+# Cách lưu sơ đồ ghế:
+# documents: mỗi ghế một document trong collection seats (cách cũ)
+# compact: mỗi xe một document trong collection seat_maps (mảng trạng thái + thông tin riêng của từng ghế)
+SEAT_STORAGE = os.getenv("SEAT_STORAGE", "documents")
+MIGRATION_BATCH_SIZE = int(os.getenv("SEAT_MIGRATION_BATCH_SIZE", "500"))
+MAX_CACHED_LAYOUTS = 100000
+
+# Trạng thái trong mảng status của seat_maps
+AVAILABLE, HELD, SOLD = 0, 1, 2
+STATES = {AVAILABLE: "available", HELD: "held", SOLD: "sold"}
+
+# Bộ đếm trên mỗi document bus (seat_counters):
+# available_seats: ghế trống, chưa ai giữ
+# held_seats: ghế đang được giữ (kể cả hold đã hết hạn nhưng chưa được giải phóng)
+# sold_seats: ghế đã bán
+COUNTER_FIELDS = ("available_seats", "held_seats", "sold_seats")
+
+
+@lru_cache(maxsize=256)
+def layout_seats(layout: str, capacity: int) -> Tuple[dict, ...]:
+    """Ghế của một mẫu sơ đồ theo thứ tự vị trí; dùng chung, không được sửa."""
+    return tuple(generate_seats(capacity, layout))
+
+
+@lru_cache(maxsize=256)
+def layout_positions(layout: str, capacity: int) -> Dict[str, int]:
+    return {seat["seat_number"]: i for i, seat in enumerate(layout_seats(layout, capacity))}
+
+
+def _inserted(docs: List[dict], error: BulkWriteError) -> List[dict]:
+    """Các document đã được insert_many(ordered=False) ghi; chỉ bỏ qua lỗi trùng khóa."""
+    errors = error.details["writeErrors"]
+    if any(item["code"] != 11000 for item in errors):
+        raise error
+    failed = {item["index"] for item in errors}
+    return [doc for i, doc in enumerate(docs) if i not in failed]
+
+
+async def move_to_archive(source, query: dict, size=lambda doc: 1) -> int:
+    """
+    Chép các document khớp query sang collection <tên>_archive rồi xóa khỏi collection gốc.
+    Document đã có trong archive (lần chạy trước bị ngắt giữa chép và xóa) được bỏ qua.
+    """
+    docs = await source.find(query).to_list(length=None)
+    if not docs:
+        return 0
+    archive = collection(f"{source.name}_archive")
+    try:
+        await archive.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        _inserted(docs, e)
+    await source.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+    return sum(size(doc) for doc in docs)
+
+
+class DocumentSeatStore:
+    """Mỗi ghế một document trong collection seats, index unique (bus_id, seat_number)."""
+    compact = False
+
+    def __init__(self, collection_name: str = "seats"):
+        self.collection_name = collection_name
+
+    def get_collection(self, workload: str = PRIMARY):
+        return collection(self.collection_name, workload)
+
+    async def create(self, buses: List[dict], created_at: Optional[datetime] = None) -> List[dict]:
+        """
+        Tạo ghế cho nhiều xe ({"bus_id", "capacity", "price", "layout"}, mẫu đã được kiểm tra) bằng một
+        insert_many không theo thứ tự; xe đã có ghế bị index unique chặn lại. Trả về các ghế thực sự được tạo,
+        bộ đếm trên bus do nơi gọi cập nhật (seat_counters.add_available_seats).
+        """
+        created_at = created_at or datetime.utcnow()
+        seats = [
+            {**seat, "bus_id": bus["bus_id"], "is_available": True, "price": bus["price"], "created_at": created_at}
+            for bus in buses for seat in layout_seats(bus["layout"], bus["capacity"])
+        ]
+        if not seats:
+            return []
+        try:
+            await self.get_collection().insert_many(seats, ordered=False)
+            created_seats = seats
+        except BulkWriteError as e:
+            created_seats = _inserted(seats, e)
+        return created_seats
+
+    async def find(self, bus_id: str, fields: Optional[dict] = None, workload: str = PRIMARY) -> List[dict]:
+        # Sắp xếp theo vị trí trong sơ đồ (seat_order) như CompactSeatStore; sort("seat_number") của Mongo so chuỗi
+        seats = await self.get_collection(workload).find({"bus_id": bus_id}, fields).to_list(length=None)
+        return sorted(seats, key=lambda seat: seat_order(seat["seat_number"]))
+
+    async def find_many(self, bus_ids: List[str], fields: Optional[dict] = None) -> List[dict]:
+        if fields is not None:
+            fields = {**fields, "bus_id": 1}
+        return await self.get_collection().find({"bus_id": {"$in": bus_ids}}, fields).to_list(length=None)
+
+    async def scan(self, bus_id: str, fields: Optional[dict] = None, batch_size: int = 1000):
+        """Duyệt ghế của một xe theo vị trí trong sơ đồ; một xe chỉ vài chục ghế nên sắp xếp trong bộ nhớ."""
+        cursor = self.get_collection().find({"bus_id": bus_id}, fields).batch_size(batch_size)
+        for seat in sorted(await cursor.to_list(length=None), key=lambda seat: seat_order(seat["seat_number"])):
+            yield seat
+
+    async def try_hold(self, bus_id: str, seat_numbers: List[str], user_id: str, hold_id: ObjectId,
+                       expires_at: datetime) -> bool:
+        # Chỉ giữ ghế còn trống và không có hold nào; hold hết hạn phải được giải phóng trước
+        # để bộ đếm held_seats/available_seats không bị tính hai lần
+        result = await self.get_collection().update_many(
+            {"bus_id": bus_id, "seat_number": {"$in": seat_numbers}, "is_available": True, "hold_id": None},
+            {"$set": {"hold_id": hold_id, "held_by": user_id, "hold_expires_at": expires_at}},
+        )
+        if result.modified_count != len(seat_numbers):
+            await self.release_hold(bus_id, hold_id)
+            return False
+        return True
+
+    async def release_hold(self, bus_id: str, hold_id: ObjectId):
+        await self.get_collection().update_many(
+            {"bus_id": bus_id, "hold_id": hold_id},
+            {"$set": {"hold_id": None, "held_by": None, "hold_expires_at": None}},
+        )
+
+    async def release_expired(self, bus_id: str, now: datetime) -> int:
+        result = await self.get_collection().update_many(
+            {"bus_id": bus_id, "is_available": True, "hold_id": {"$ne": None}, "hold_expires_at": {"$lte": now}},
+            {"$set": {"hold_id": None, "held_by": None, "hold_expires_at": None}},
+        )
+        return result.modified_count
+
+    async def confirm(self, bus_id: str, seat_numbers: List[str], hold_id: ObjectId, user_id: str,
+                      now: datetime) -> int:
+        result = await self.get_collection().update_many(
+            {
+                "bus_id": bus_id,
+                "seat_number": {"$in": seat_numbers},
+                "hold_id": hold_id,
+                "hold_expires_at": {"$gt": now},
+            },
+            {
+                "$set": {
+                    "is_available": False,
+                    "booked_by": user_id,
+                    "booked_at": now,
+                    "updated_at": now,
+                    "hold_id": None,
+                    "held_by": None,
+                    "hold_expires_at": None,
+                }
+            },
+        )
+        return result.modified_count
+
+    async def archive(self, bus_ids: List[str]) -> int:
+        """Chuyển ghế của các xe sang collection <seats>_archive; chạy lại sau khi bị ngắt vẫn an toàn."""
+        return await move_to_archive(self.get_collection(), {"bus_id": {"$in": bus_ids}})
+
+    async def count(self, bus_ids: List[str]) -> Dict[str, dict]:
+        pipeline = [
+            {"$match": {"bus_id": {"$in": bus_ids}}},
+            {"$group": {
+                "_id": "$bus_id",
+                "available_seats": {"$sum": {"$cond": [
+                    {"$and": ["$is_available", {"$eq": [{"$ifNull": ["$hold_id", None]}, None]}]}, 1, 0
+                ]}},
+                "held_seats": {"$sum": {"$cond": [
+                    {"$and": ["$is_available", {"$ne": [{"$ifNull": ["$hold_id", None]}, None]}]}, 1, 0
+                ]}},
+                "sold_seats": {"$sum": {"$cond": ["$is_available", 0, 1]}},
+            }},
+        ]
+        counts = {}
+        async for row in self.get_collection().aggregate(pipeline):
+            counts[row["_id"]] = {field: row[field] for field in COUNTER_FIELDS}
+        return counts
+
+
+class CompactSeatStore:
+    """
+    Mỗi xe một document trong collection seat_maps, _id là bus_id:
+        {layout, capacity, price, created_at, updated_at,
+         status: [0|1|2, ...],                      # theo vị trí ghế trong mẫu sơ đồ: trống / đang giữ / đã bán
+         holds: {"<vị trí>": {id, by, exp}},        # chỉ ghế đang giữ
+         bookings: {"<vị trí>": {by, at}},          # chỉ ghế đã bán
+         overrides: {"<vị trí>": {price}}}          # ghế có giá gốc khác giá của xe (dữ liệu chuyển từ seats)
+    seat_number, deck, seat_type suy ra từ (layout, capacity) nên không lưu lặp lại. Giữ/bán/trả ghế là một
+    update_one có điều kiện trên các vị trí (status.i, holds.i) của đúng document đó: đủ ghế thì cả nhóm đổi
+    trạng thái, thiếu một ghế thì không ghế nào đổi, không cần hoàn tác.
+    Đọc trả về dict cùng dạng document của seats (_id là "<bus_id>:<seat_number>"), theo thứ tự vị trí.
+    """
+    compact = True
+
+    def __init__(self, collection_name: str = "seat_maps"):
+        self.collection_name = collection_name
+        self._layouts: Dict[str, Tuple[str, int]] = {}   # bus_id -> (layout, capacity), không đổi sau khi tạo
+
+    def get_collection(self, workload: str = PRIMARY):
+        return collection(self.collection_name, workload)
+
+    def _remember(self, seat_map: dict):
+        if len(self._layouts) >= MAX_CACHED_LAYOUTS:
+            self._layouts.clear()
+        self._layouts[seat_map["_id"]] = (seat_map["layout"], seat_map["capacity"])
+
+    async def _positions(self, bus_id: str) -> Optional[Dict[str, int]]:
+        layout = self._layouts.get(bus_id)
+        if layout is None:
+            seat_map = await self.get_collection().find_one({"_id": bus_id}, {"layout": 1, "capacity": 1})
+            if not seat_map:
+                return None
+            self._remember(seat_map)
+            layout = self._layouts[bus_id]
+        return layout_positions(*layout)
+
+    def expand(self, seat_map: dict) -> List[dict]:
+        """Đổi một seat map sang danh sách ghế cùng dạng document của collection seats."""
+        bus_id = seat_map["_id"]
+        price = seat_map["price"]
+        created_at = seat_map.get("created_at")
+        holds = seat_map.get("holds") or {}
+        bookings = seat_map.get("bookings") or {}
+        overrides = seat_map.get("overrides") or {}
+        seats = []
+        for i, (seat, status) in enumerate(zip(layout_seats(seat_map["layout"], seat_map["capacity"]),
+                                               seat_map["status"])):
+            key = str(i)
+            hold = holds.get(key) if status == HELD else None
+            booking = bookings.get(key) if status == SOLD else None
+            override = overrides.get(key)
+            seats.append({
+                "_id": f"{bus_id}:{seat['seat_number']}",
+                **seat,
+                "bus_id": bus_id,
+                "is_available": status != SOLD,
+                "price": override["price"] if override else price,
+                "created_at": created_at,
+                "updated_at": booking["at"] if booking else None,
+                "hold_id": hold and hold["id"],
+                "held_by": hold and hold["by"],
+                "hold_expires_at": hold and hold["exp"],
+                "booked_by": booking and booking["by"],
+                "booked_at": booking and booking["at"],
+            })
+        return seats
+
+    async def create(self, buses: List[dict], created_at: Optional[datetime] = None) -> List[dict]:
+        """Như DocumentSeatStore.create, nhưng mỗi xe là một document; xe đã có seat map bị _id chặn lại."""
+        created_at = created_at or datetime.utcnow()
+        seat_maps = [
+            {
+                "_id": bus["bus_id"],
+                "layout": bus["layout"],
+                "capacity": bus["capacity"],
+                "price": bus["price"],
+                "created_at": created_at,
+                "status": [AVAILABLE] * bus["capacity"],
+                "holds": {},
+                "bookings": {},
+                "overrides": {},
+            }
+            for bus in buses
+        ]
+        if not seat_maps:
+            return []
+        try:
+            await self.get_collection().insert_many(seat_maps, ordered=False)
+            created = seat_maps
+        except BulkWriteError as e:
+            created = _inserted(seat_maps, e)
+        seats = []
+        for seat_map in created:
+            self._remember(seat_map)
+            seats += self.expand(seat_map)
+        return seats
+
+    async def find(self, bus_id: str, fields: Optional[dict] = None, workload: str = PRIMARY) -> List[dict]:
+        # Cả sơ đồ nằm trong một document nên luôn đọc đủ; fields chỉ có nghĩa với DocumentSeatStore
+        seat_map = await self.get_collection(workload).find_one({"_id": bus_id})
+        return self.expand(seat_map) if seat_map else []
+
+    async def find_many(self, bus_ids: List[str], fields: Optional[dict] = None) -> List[dict]:
+        seats = []
+        async for seat_map in self.get_collection().find({"_id": {"$in": bus_ids}}):
+            seats += self.expand(seat_map)
+        return seats
+
+    async def scan(self, bus_id: str, fields: Optional[dict] = None, batch_size: int = 1000):
+        for seat in await self.find(bus_id):
+            yield seat
+
+    async def try_hold(self, bus_id: str, seat_numbers: List[str], user_id: str, hold_id: ObjectId,
+                       expires_at: datetime) -> bool:
+        positions = await self._positions(bus_id)
+        if positions is None or any(number not in positions for number in seat_numbers):
+            return False
+        indexes = [positions[number] for number in seat_numbers]
+        hold = {"id": hold_id, "by": user_id, "exp": expires_at}
+        result = await self.get_collection().update_one(
+            {"_id": bus_id, **{f"status.{i}": AVAILABLE for i in indexes}},
+            {"$set": {**{f"status.{i}": HELD for i in indexes}, **{f"holds.{i}": hold for i in indexes}}},
+        )
+        return result.modified_count == 1
+
+    async def _release(self, bus_id: str, holds: Dict[str, dict]) -> int:
+        # Mỗi vị trí chỉ được trả nếu vẫn còn đúng hold đã đọc
+        if not holds:
+            return 0
+        result = await self.get_collection().update_one(
+            {"_id": bus_id, **{f"holds.{i}.id": hold["id"] for i, hold in holds.items()}},
+            {
+                "$set": {f"status.{i}": AVAILABLE for i in holds},
+                "$unset": {f"holds.{i}": "" for i in holds},
+            },
+        )
+        return len(holds) if result.modified_count else 0
+
+    async def release_hold(self, bus_id: str, hold_id: ObjectId):
+        seat_map = await self.get_collection().find_one({"_id": bus_id}, {"holds": 1})
+        holds = (seat_map or {}).get("holds") or {}
+        await self._release(bus_id, {i: hold for i, hold in holds.items() if hold["id"] == hold_id})
+
+    async def release_expired(self, bus_id: str, now: datetime) -> int:
+        seat_map = await self.get_collection().find_one({"_id": bus_id}, {"holds": 1})
+        holds = (seat_map or {}).get("holds") or {}
+        return await self._release(bus_id, {i: hold for i, hold in holds.items() if hold["exp"] <= now})
+
+    async def confirm(self, bus_id: str, seat_numbers: List[str], hold_id: ObjectId, user_id: str,
+                      now: datetime) -> int:
+        positions = await self._positions(bus_id)
+        if positions is None or any(number not in positions for number in seat_numbers):
+            return 0
+        indexes = [positions[number] for number in seat_numbers]
+        conditions = {}
+        for i in indexes:
+            conditions[f"holds.{i}.id"] = hold_id
+            conditions[f"holds.{i}.exp"] = {"$gt": now}
+        result = await self.get_collection().update_one(
+            {"_id": bus_id, **conditions},
+            {
+                "$set": {
+                    **{f"status.{i}": SOLD for i in indexes},
+                    **{f"bookings.{i}": {"by": user_id, "at": now} for i in indexes},
+                    "updated_at": now,
+                },
+                "$unset": {f"holds.{i}": "" for i in indexes},
+            },
+        )
+        return len(indexes) if result.modified_count else 0
+
+    async def archive(self, bus_ids: List[str]) -> int:
+        """Chuyển seat map của các xe sang collection <seat_maps>_archive; trả về số ghế đã chuyển."""
+        for bus_id in bus_ids:
+            self._layouts.pop(bus_id, None)
+        return await move_to_archive(
+            self.get_collection(), {"_id": {"$in": bus_ids}}, lambda seat_map: seat_map["capacity"]
+        )
+
+    async def count(self, bus_ids: List[str]) -> Dict[str, dict]:
+        def count_status(status: int) -> dict:
+            return {"$size": {"$filter": {"input": "$status", "cond": {"$eq": ["$$this", status]}}}}
+
+        pipeline = [
+            {"$match": {"_id": {"$in": bus_ids}}},
+            {"$project": {
+                "available_seats": count_status(AVAILABLE),
+                "held_seats": count_status(HELD),
+                "sold_seats": count_status(SOLD),
+            }},
+        ]
+        counts = {}
+        async for row in self.get_collection().aggregate(pipeline):
+            counts[row["_id"]] = {field: row[field] for field in COUNTER_FIELDS}
+        return counts
+
+
+def infer_layout(seats: List[dict]) -> Optional[str]:
+    """Mẫu sơ đồ sinh ra đúng danh sách ghế (seat_number, deck, seat_type) của một xe; None nếu không mẫu nào khớp."""
+    actual = {(seat["seat_number"], seat.get("deck"), seat.get("seat_type")) for seat in seats}
+    for layout in SEAT_LAYOUTS:
+        try:
+            expected = layout_seats(layout, len(seats))
+        except ValueError:
+            continue
+        if {(seat["seat_number"], seat["deck"], seat["seat_type"]) for seat in expected} == actual:
+            return layout
+    # Ghế tạo trước khi có mẫu sơ đồ không có deck/seat_type
+    numbers = {seat["seat_number"] for seat in seats}
+    if all(seat.get("deck") is None for seat in seats) and \
+            {seat["seat_number"] for seat in layout_seats("default", len(seats))} == numbers:
+        return "default"
+    return None
+
+
+def seat_map_from_documents(bus_id: str, seats: List[dict]) -> Optional[dict]:
+    """Dựng seat map từ các document ghế của một xe; None nếu không suy ra được mẫu sơ đồ."""
+    layout = infer_layout(seats)
+    if layout is None:
+        return None
+    by_number = {seat["seat_number"]: seat for seat in seats}
+    prices = Counter(seat["price"] for seat in seats)
+    price = prices.most_common(1)[0][0]
+    seat_map = {
+        "_id": bus_id,
+        "layout": layout,
+        "capacity": len(seats),
+        "price": price,
+        "created_at": min((seat["created_at"] for seat in seats if seat.get("created_at")), default=None),
+        "updated_at": max((seat["updated_at"] for seat in seats if seat.get("updated_at")), default=None),
+        "status": [],
+        "holds": {},
+        "bookings": {},
+        "overrides": {},
+    }
+    for i, template in enumerate(layout_seats(layout, len(seats))):
+        seat = by_number[template["seat_number"]]
+        key = str(i)
+        if not seat.get("is_available", True):
+            seat_map["status"].append(SOLD)
+            seat_map["bookings"][key] = {"by": seat.get("booked_by"), "at": seat.get("booked_at")}
+        elif seat.get("hold_id") is not None:
+            seat_map["status"].append(HELD)
+            seat_map["holds"][key] = {"id": seat["hold_id"], "by": seat.get("held_by"),
+                                      "exp": seat.get("hold_expires_at") or datetime.min}
+        else:
+            seat_map["status"].append(AVAILABLE)
+        if seat["price"] != price:
+            seat_map["overrides"][key] = {"price": seat["price"]}
+    return seat_map
+
+
+async def migrate(delete: bool = False, batch_size: int = MIGRATION_BATCH_SIZE) -> dict:
+    """
+    Chuyển ghế từ collection seats sang seat_maps, theo từng lô xe. Xe đã có seat map được bỏ qua,
+    nên có thể chạy lại sau khi bị ngắt. delete=True xóa document ghế của các xe đã chuyển.
+    Nên chạy khi không có ai giữ/bán ghế (hoặc đặt SEAT_STORAGE=compact cho mọi worker trước đó).
+    """
+    seats_collection = collection("seats")
+    maps_collection = collection("seat_maps")
+    report = {"buses": 0, "seats": 0, "skipped": 0, "unknown_layout": []}
+    batch: List[dict] = []
+
+    async def flush():
+        if not batch:
+            return
+        try:
+            await maps_collection.insert_many(batch, ordered=False)
+            written = batch
+        except BulkWriteError as e:
+            written = _inserted(batch, e)
+        report["buses"] += len(written)
+        report["skipped"] += len(batch) - len(written)
+        report["seats"] += sum(seat_map["capacity"] for seat_map in written)
+        if delete:
+            # Cả xe đã có seat map từ trước cũng được dọn
+            await seats_collection.delete_many({"bus_id": {"$in": [seat_map["_id"] for seat_map in batch]}})
+        batch.clear()
+
+    async def add(bus_id: str, seats: List[dict]):
+        seat_map = seat_map_from_documents(bus_id, seats)
+        if seat_map is None:
+            logger.warning(f"Bus {bus_id}: seats match no layout, left in seats")
+            report["unknown_layout"].append(bus_id)
+            return
+        batch.append(seat_map)
+        if len(batch) >= batch_size:
+            await flush()
+
+    bus_id = None
+    seats: List[dict] = []
+    # Index (bus_id, seat_number) cho phép đọc tuần tự theo xe mà không cần sắp xếp trong bộ nhớ
+    async for seat in seats_collection.find({}).sort([("bus_id", 1), ("seat_number", 1)]):
+        if seat["bus_id"] != bus_id:
+            if seats:
+                await add(bus_id, seats)
+            bus_id, seats = seat["bus_id"], []
+        seats.append(seat)
+    if seats:
+        await add(bus_id, seats)
+    await flush()
+    logger.info(f"Migrated {report['buses']} buses ({report['seats']} seats) to seat_maps, "
+                f"{report['skipped']} already migrated, {len(report['unknown_layout'])} with unknown layout")
+    return report
+
+
+if SEAT_STORAGE not in ("documents", "compact"):
+    raise ValueError(f"Unknown SEAT_STORAGE {SEAT_STORAGE}, expected documents or compact")
+
+seat_store = CompactSeatStore() if SEAT_STORAGE == "compact" else DocumentSeatStore()
+
+
+if __name__ == "__main__":
+    # python -m app.seat_store migrate            -> chuyển seats sang seat_maps, giữ nguyên seats
+    # python -m app.seat_store migrate --delete   -> chuyển rồi xóa document ghế của các xe đã chuyển
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--delete", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    args = parser.parse_args()
+    result = asyncio.run(migrate(args.delete, args.batch_size))
+    sys.exit(1 if result["unknown_layout"] else 0)
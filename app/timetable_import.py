@@ -0,0 +1,375 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Iterable, Iterator, List, Tuple
+
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app import schemas, seat_counters, seat_layouts
+from app.availability import availability_view
+from app.cache import cache
+from app.database import collection
+from app.places import place_key
+from app.search import route_graph
+from app.seat_store import seat_store
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Một rule lịch chạy trải dài tối đa bấy nhiêu ngày, để một request không mở rộng thành hàng triệu chuyến
+MAX_SCHEDULE_DAYS = int(os.getenv("IMPORT_MAX_SCHEDULE_DAYS", "366"))
+MAX_REPORTED_ERRORS = 1000
+BUS_STATUSES = {"available", "in_transit", "maintenance"}
+ROUTE_FIELDS = ("departure", "destination", "price", "duration", "distance")
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# "daily 06:00,18:30 for 90 days" hoặc "mon,wed,fri 07:15 for 12 days"
+SCHEDULE_PATTERN = re.compile(r"^\s*(?P<days_of_week>daily|[a-z,]+)\s+(?P<times>[\d:,]+)\s+for\s+(?P<days>\d+)\s+days?\s*$")
+
+
+class ImportFormatError(ValueError):
+    """File import không đọc được (JSON sai, thiếu header...), khác với lỗi của từng dòng."""
+
+
+def parse_rows(text: str, fmt: str) -> Iterator[Tuple[int, dict]]:
+    """Đọc CSV (có header) hoặc NDJSON, trả về (số dòng, bản ghi). Ô rỗng được coi như không có."""
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise ImportFormatError("CSV file has no header")
+        for record in reader:
+            yield reader.line_num, {key: value for key, value in record.items() if key and value not in (None, "")}
+    else:
+        for line_number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, {"_error": f"Invalid JSON: {e.msg}"}
+                continue
+            yield line_number, record if isinstance(record, dict) else {"_error": "Expected a JSON object"}
+
+
+def _parse_schedule(schedule: str) -> dict:
+    match = SCHEDULE_PATTERN.match(schedule.lower())
+    if not match:
+        raise ValueError(f"Invalid schedule '{schedule}', expected e.g. 'daily 06:00 for 90 days'")
+    days_of_week = match["days_of_week"]
+    return {
+        "weekdays": list(range(7)) if days_of_week == "daily" else days_of_week.split(","),
+        "times": match["times"].split(","),
+        "days": int(match["days"]),
+    }
+
+
+def expand_rules(text: str) -> Iterator[Tuple[int, dict]]:
+    """
+    Mở rộng rule lịch chạy thành từng chuyến. Rule là JSON (một object, một mảng, hoặc NDJSON):
+        {"route_code": "HN-HUE", "start_date": "2026-11-01", "schedule": "daily 06:00,18:30 for 90 days",
+         "capacity": 40, "layout": "sleeper_40"}
+    hoặc ghi rõ "times", "days", "weekdays" thay cho "schedule". Số dòng trả về là số thứ tự rule.
+    """
+    try:
+        loaded = json.loads(text)
+        rules = loaded if isinstance(loaded, list) else [loaded]
+    except json.JSONDecodeError:
+        try:
+            rules = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise ImportFormatError(f"Invalid rules JSON: {e.msg}")
+
+    for number, rule in enumerate(rules, 1):
+        try:
+            if not isinstance(rule, dict):
+                raise ValueError("Expected a JSON object")
+            rule = {**rule, **_parse_schedule(rule["schedule"])} if "schedule" in rule else dict(rule)
+            start_date = date.fromisoformat(rule["start_date"])
+            times = [dt_time.fromisoformat(value) for value in rule["times"]]
+            weekdays = {WEEKDAYS.index(day) if isinstance(day, str) else int(day) for day in rule.get("weekdays", range(7))}
+            days = int(rule["days"])
+            if not 1 <= days <= MAX_SCHEDULE_DAYS:
+                raise ValueError(f"days must be between 1 and {MAX_SCHEDULE_DAYS}")
+            template = rule.get("bus_number", "{route_code}-{date:%Y%m%d}-{date:%H%M}")
+            # Thử format một lần để template sai báo lỗi theo rule thay vì giữa lúc mở rộng
+            try:
+                template.format(route_code=rule.get("route_code", ""), date=datetime.combine(start_date, dt_time()))
+            except (KeyError, IndexError) as e:
+                raise ValueError(f"Unknown field {e} in bus_number template")
+        except KeyError as e:
+            yield number, {"_error": f"Rule is missing {e.args[0]}"}
+            continue
+        except (ValueError, TypeError, AttributeError) as e:
+            # Kiểu dữ liệu sai (vd. "start_date": 20261101, "schedule": 5, "days": null)
+            yield number, {"_error": f"Invalid rule: {e}"}
+            continue
+
+        base = {key: value for key, value in rule.items()
+                if key not in ("schedule", "start_date", "times", "days", "weekdays", "bus_number")}
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            if day.weekday() not in weekdays:
+                continue
+            for departure_at in times:
+                departure_time = datetime.combine(day, departure_at)
+                yield number, {
+                    **base,
+                    "departure_time": departure_time,
+                    "bus_number": template.format(route_code=rule.get("route_code", ""), date=departure_time),
+                }
+
+
+class TimetableImport:
+    """
+    Nhập route và chuyến xe theo lô. route_code được đối chiếu với một index trong bộ nhớ
+    (nạp một lần từ collection routes, cộng các route tạo trong lần import) thay vì find_one từng dòng.
+    Chuyến xe được ghi bằng upsert theo (route_id, departure_time, bus_number) nên import lại cùng file không tạo trùng.
+    """
+    def __init__(self, generate_seats: bool = False, layout: str = "default", dry_run: bool = False):
+        if layout not in seat_layouts.SEAT_LAYOUTS:
+            raise ValueError(f"Unknown seat layout {layout}")
+        self.generate_seats = generate_seats
+        self.layout = layout
+        self.dry_run = dry_run
+        self.routes = {}            # route_code -> {"id", "price", "duration"}
+        self.layout_checks = {}     # (capacity, layout) -> lỗi hoặc None
+        self.report = {
+            "rows": 0, "routes_created": 0, "buses_created": 0, "buses_skipped": 0, "seats_created": 0,
+            "errors": [], "errors_truncated": False,
+        }
+
+    def _error(self, row: int, message: str):
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"row": row, "error": message})
+        else:
+            self.report["errors_truncated"] = True
+
+    async def load_route_index(self):
+        async for route in collection("routes").find({}, {"route_code": 1, "price": 1, "duration": 1}):
+            code = route.get("route_code")
+            if code and code not in self.routes:
+                self.routes[code] = {"id": str(route["_id"]), "price": route["price"], "duration": route["duration"]}
+
+    def _route_doc(self, record: dict, now: datetime) -> dict:
+        route = schemas.RouteCreate(**{key: record.get(key) for key in ("route_code", "description", *ROUTE_FIELDS)})
+        doc = route.model_dump()
+        doc.update({
+            "_id": ObjectId(),
+            "created_at": now,
+            "departure_key": place_key(route.departure),
+            "destination_key": place_key(route.destination),
+        })
+        return doc
+
+    def _layout_error(self, capacity: int, layout: str):
+        key = (capacity, layout)
+        if key not in self.layout_checks:
+            try:
+                seat_layouts.generate_seats(capacity, layout)
+                self.layout_checks[key] = None
+            except (KeyError, ValueError) as e:
+                self.layout_checks[key] = f"Unknown seat layout {layout}" if isinstance(e, KeyError) else str(e)
+        return self.layout_checks[key]
+
+    def _bus_doc(self, record: dict, now: datetime) -> dict:
+        route = self.routes.get(record.get("route_code"))
+        if route is None:
+            raise ValueError(f"Unknown route_code {record.get('route_code')}")
+        fields = {key: record.get(key) for key in ("bus_number", "capacity", "departure_time", "arrival_time",
+                                                    "description")}
+        fields["route_id"] = route["id"]
+        fields["status"] = record.get("status", "available")
+        if fields["arrival_time"] is None and fields["departure_time"] is not None:
+            departure_time = fields["departure_time"]
+            if isinstance(departure_time, str):
+                departure_time = datetime.fromisoformat(departure_time)
+            fields["arrival_time"] = departure_time + timedelta(minutes=route["duration"])
+        bus = schemas.BusCreate(**fields)
+        if bus.status not in BUS_STATUSES:
+            raise ValueError(f"Invalid status {bus.status}")
+        if bus.capacity <= 0:
+            raise ValueError("Capacity must be positive")
+        if bus.arrival_time <= bus.departure_time:
+            raise ValueError("arrival_time must be after departure_time")
+        layout = record.get("layout", self.layout)
+        if self.generate_seats:
+            error = self._layout_error(bus.capacity, layout)
+            if error:
+                raise ValueError(error)
+        doc = bus.model_dump()
+        doc["created_at"] = now
+        for field in seat_counters.COUNTER_FIELDS:
+            doc[field] = 0
+        # Không lưu vào document bus, chỉ dùng khi sinh ghế
+        doc["_layout"] = layout
+        doc["_price"] = route["price"]
+        return doc
+
+    async def _write_routes(self, routes: List[Tuple[int, dict]]) -> set:
+        """Ghi các route mới; trả về route_code bị lỗi để bỏ các chuyến phụ thuộc."""
+        failed = set()
+        if not routes or self.dry_run:
+            self.report["routes_created"] += len(routes)
+            return failed
+        try:
+            await collection("routes").bulk_write([InsertOne(doc) for _, doc in routes], ordered=False)
+            self.report["routes_created"] += len(routes)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            self.report["routes_created"] += len(routes) - len(errors)
+            for error in errors:
+                row, doc = routes[error["index"]]
+                failed.add(doc["route_code"])
+                self.routes.pop(doc["route_code"], None)
+                self._error(row, error["errmsg"])
+        return failed
+
+    async def _write_buses(self, buses: List[Tuple[int, dict]]):
+        if not buses:
+            return
+        if self.dry_run:
+            self.report["buses_created"] += len(buses)
+            return
+        operations = []
+        for _, doc in buses:
+            stored = {key: value for key, value in doc.items() if not key.startswith("_")}
+            operations.append(UpdateOne(
+                {"route_id": doc["route_id"], "departure_time": doc["departure_time"], "bus_number": doc["bus_number"]},
+                {"$setOnInsert": stored},
+                upsert=True,
+            ))
+        try:
+            result = await collection("buses").bulk_write(operations, ordered=False)
+            upserted = result.upserted_ids
+            failed = 0
+        except BulkWriteError as e:
+            upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+            failed = 0
+            for error in e.details["writeErrors"]:
+                # Trùng khóa: một lần import khác vừa tạo đúng chuyến này (index unique) -> tính là bỏ qua
+                if error["code"] == 11000:
+                    continue
+                failed += 1
+                self._error(buses[error["index"]][0], error["errmsg"])
+        self.report["buses_created"] += len(upserted)
+        for index in upserted:
+            doc = buses[index][1]
+            availability_view.mark_day(doc["route_id"], doc["departure_time"])
+        self.report["buses_skipped"] += len(buses) - len(upserted) - failed
+
+        if self.generate_seats and upserted:
+            seat_maps = []
+            for index, bus_id in upserted.items():
+                doc = buses[index][1]
+                seat_maps.append(
+                    {"bus_id": str(bus_id), "capacity": doc["capacity"], "price": doc["_price"], "layout": doc["_layout"]}
+                )
+            # Chuyến vừa tạo chưa có ghế nên không thể trùng
+            seats = await seat_store.create(seat_maps)
+            await seat_counters.add_available_seats(Counter(seat["bus_id"] for seat in seats))
+            self.report["seats_created"] += len(seats)
+
+    async def _flush(self, routes: List[Tuple[int, dict]], buses: List[Tuple[int, dict]]):
+        failed_codes = await self._write_routes(routes)
+        if failed_codes:
+            for row, doc in buses:
+                if doc["_route_code"] in failed_codes:
+                    self._error(row, f"Route {doc['_route_code']} could not be created")
+            buses = [(row, doc) for row, doc in buses if doc["_route_code"] not in failed_codes]
+        await self._write_buses(buses)
+
+    async def run(self, records: Iterable[Tuple[int, dict]]) -> dict:
+        start = time.perf_counter()
+        await self.load_route_index()
+        now = datetime.utcnow()
+        routes, buses = [], []
+
+        for row, record in records:
+            self.report["rows"] += 1
+            if "_error" in record:
+                self._error(row, record["_error"])
+                continue
+            try:
+                code = record.get("route_code")
+                has_route = record.get("departure") is not None and record.get("destination") is not None
+                has_bus = record.get("bus_number") is not None or record.get("departure_time") is not None
+                if not has_route and not has_bus:
+                    raise ValueError("Row has neither route nor bus fields")
+                # Dòng có thông tin route với route_code chưa có -> tạo route; route đã có thì giữ nguyên
+                if has_route and code not in self.routes:
+                    doc = self._route_doc(record, now)
+                    self.routes[code] = {"id": str(doc["_id"]), "price": doc["price"], "duration": doc["duration"]}
+                    routes.append((row, doc))
+                if has_bus:
+                    doc = self._bus_doc(record, now)
+                    doc["_route_code"] = code
+                    buses.append((row, doc))
+            except ValidationError as e:
+                self._error(row, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            except (ValueError, TypeError) as e:
+                self._error(row, str(e))
+
+            if len(routes) + len(buses) >= IMPORT_BATCH_SIZE:
+                await self._flush(routes, buses)
+                routes, buses = [], []
+        await self._flush(routes, buses)
+
+        if not self.dry_run:
+            if self.report["routes_created"]:
+                await cache.invalidate("routes:list:")
+                route_graph.mark_stale()
+            if self.report["buses_created"]:
+                await cache.invalidate("buses:")
+                await availability_view.flush()
+
+        seconds = time.perf_counter() - start
+        self.report["seconds"] = round(seconds, 3)
+        self.report["rows_per_second"] = round(self.report["rows"] / seconds, 1) if seconds else 0.0
+        self.report["dry_run"] = self.dry_run
+        logger.info(
+            f"Timetable import: {self.report['rows']} rows, {self.report['routes_created']} routes, "
+            f"{self.report['buses_created']} buses, {self.report['seats_created']} seats, "
+            f"{len(self.report['errors'])} errors in {seconds:.1f}s"
+        )
+        return self.report
+
+
+def read_records(text: str, fmt: str) -> Iterator[Tuple[int, dict]]:
+    if fmt == "rules":
+        return expand_rules(text)
+    return parse_rows(text, fmt)
+
+
+if __name__ == "__main__":
+    # python -m app.timetable_import schedule.csv
+    # python -m app.timetable_import rules.json --format rules --generate-seats --layout sleeper_40
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson", "rules"])
+    parser.add_argument("--generate-seats", action="store_true")
+    parser.add_argument("--layout", default="default")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    fmt = args.format or {".csv": "csv", ".json": "rules"}.get(os.path.splitext(args.path)[1], "ndjson")
+    with open(args.path, encoding="utf-8-sig") as f:
+        text = f.read()
+    importer = TimetableImport(args.generate_seats, args.layout, args.dry_run)
+    try:
+        report = asyncio.run(importer.run(read_records(text, fmt)))
+    except ImportFormatError as e:
+        sys.exit(str(e))
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["errors"] else 0)
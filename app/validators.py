@@ -1,6 +1,13 @@
 import re
 from typing import Tuple
 
+# Biên dịch một lần khi import thay vì mỗi lần kiểm tra
+_UPPERCASE = re.compile(r"[A-Z]")
+_LOWERCASE = re.compile(r"[a-z]")
+_DIGIT = re.compile(r"\d")
+_SPECIAL = re.compile(r"[!@#$%^&*(),.?\":{}|<>]")
+_USERNAME = re.compile(r"^[a-zA-Z][a-zA-Z0-9_]*$")
+
 def validate_password(password: str) -> Tuple[bool, str]:
     """
     Kiểm tra độ mạnh của mật khẩu
@@ -14,16 +21,16 @@ def validate_password(password: str) -> Tuple[bool, str]:
     if len(password) < 8:
         return False, "Mật khẩu phải có ít nhất 8 ký tự"
     
-    if not re.search(r"[A-Z]", password):
+    if not _UPPERCASE.search(password):
         return False, "Mật khẩu phải chứa ít nhất 1 chữ hoa"
     
-    if not re.search(r"[a-z]", password):
+    if not _LOWERCASE.search(password):
         return False, "Mật khẩu phải chứa ít nhất 1 chữ thường"
     
-    if not re.search(r"\d", password):
+    if not _DIGIT.search(password):
         return False, "Mật khẩu phải chứa ít nhất 1 số"
     
-    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+    if not _SPECIAL.search(password):
         return False, "Mật khẩu phải chứa ít nhất 1 ký tự đặc biệt"
     
     return True, "Mật khẩu hợp lệ"
@@ -39,7 +46,7 @@ def validate_username(username: str) -> Tuple[bool, str]:
     if not (3 <= len(username) <= 20):
         return False, "Username phải có độ dài từ 3-20 ký tự"
     
-    if not re.match(r"^[a-zA-Z][a-zA-Z0-9_]*$", username):
+    if not _USERNAME.match(username):
         return False, "Username chỉ được chứa chữ cái, số và dấu gạch dưới, và phải bắt đầu bằng chữ cái"
     
     return True, "Username hợp lệ" 
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+Sinh bộ dữ liệu tổng hợp cho load test, xác định hoàn toàn theo seed.
+Quy mô mặc định (scale=1): 100k user, 10k route, 500k chuyến xe, 20M ghế (40 ghế giường nằm mỗi xe).
+
+Ghi vào database riêng (mặc định VeXeKhach_bench), không đụng vào MONGO_DB của .env:
+    python -m benchmarks.dataset --scale 1 --seed 42 --drop
+    python -m benchmarks.dataset --scale 0.01 --db VeXeKhach_bench_small --drop
+
+Mọi user có cùng mật khẩu BENCH_PASSWORD và email bench{i}@example.com để load driver đăng nhập được.
+Thông tin bộ dữ liệu (seed, scale, số lượng, ngày bắt đầu) được lưu trong collection benchmark_meta.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+USERS = 100_000
+ROUTES = 10_000
+BUSES = 500_000
+LAYOUT = "sleeper_40"
+SEATS_PER_BUS = 40
+DAYS = 30
+BATCH_SIZE = 10_000
+CONCURRENT_INSERTS = 4
+
+BENCH_DB = "VeXeKhach_bench"
+BENCH_PASSWORD = "Bench#Pass123"
+BENCH_COLLECTIONS = ("users", "routes", "buses", "seats", "seat_maps", "seat_holds", "email_outbox", "revoked_tokens",
+                     "buses_archive", "seats_archive", "seat_maps_archive", "job_leases", "benchmark_meta")
+
+
+def use_database(name: str):
+    """Trỏ app sang database benchmark; phải gọi trước khi import bất kỳ module nào của app."""
+    os.environ["MONGO_DB"] = name
+
+
+def use_mongomock(name: str):
+    """Dùng mongomock-motor thay cho Mongo thật (chạy thử nhanh trên máy không có mongod)."""
+    from mongomock_motor import AsyncMongoMockClient
+
+    import app.database
+
+    app.database.db = AsyncMongoMockClient()[name]
+
+
+def counts_for(scale: float) -> dict:
+    return {
+        "users": max(1, int(USERS * scale)),
+        "routes": max(1, int(ROUTES * scale)),
+        "buses": max(1, int(BUSES * scale)),
+    }
+
+
+def user_email(i: int) -> str:
+    return f"bench{i}@example.com"
+
+
+async def _write_batches(collection, documents, label: str):
+    """insert_many theo lô BATCH_SIZE, tối đa CONCURRENT_INSERTS lô cùng lúc để không giữ hàng triệu document trong bộ nhớ."""
+    pending = set()
+    batch = []
+    written = 0
+    start = time.perf_counter()
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) == BATCH_SIZE:
+            if len(pending) >= CONCURRENT_INSERTS:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.add(asyncio.create_task(collection.insert_many(batch, ordered=False)))
+            written += len(batch)
+            batch = []
+    if batch:
+        pending.add(asyncio.create_task(collection.insert_many(batch, ordered=False)))
+        written += len(batch)
+    if pending:
+        await asyncio.gather(*pending)
+    print(f"{label}: {written} documents in {time.perf_counter() - start:.1f}s")
+
+
+def _users(count: int, rng: random.Random, hashed_password: str, now: datetime):
+    for i in range(count):
+        yield {
+            "username": f"bench{i}",
+            "email": user_email(i),
+            "hashed_password": hashed_password,
+            "is_email_verified": rng.random() < 0.9,
+            "created_at": now - timedelta(days=rng.randrange(365)),
+            "email_verified_at": None,
+        }
+
+
+def _routes(count: int, rng: random.Random, now: datetime):
+    from app.places import place_key
+    from benchmarks.trip_search import PROVINCES
+
+    for i in range(count):
+        departure, destination = rng.sample(PROVINCES, 2)
+        yield {
+            "route_code": f"BR{i:05d}",
+            "departure": departure,
+            "destination": destination,
+            "departure_key": place_key(departure),
+            "destination_key": place_key(destination),
+            "price": rng.randint(100, 600) * 1000,
+            "duration": rng.randint(120, 1200),
+            "distance": rng.randint(50, 1700),
+            "created_at": now,
+        }
+
+
+def _buses(count: int, routes: list, rng: random.Random, start: datetime, now: datetime):
+    for i in range(count):
+        route = routes[i % len(routes)]
+        departure_time = start + timedelta(minutes=rng.randrange(DAYS * 24 * 60))
+        yield {
+            "bus_number": f"BB-{i:06d}",
+            "capacity": SEATS_PER_BUS,
+            "route_id": str(route["_id"]),
+            "departure_time": departure_time,
+            "arrival_time": departure_time + timedelta(minutes=route["duration"]),
+            "status": "available",
+            "available_seats": SEATS_PER_BUS,
+            "held_seats": 0,
+            "sold_seats": 0,
+            "created_at": now,
+        }
+
+
+def build_seat_documents(bus_id: str, capacity: int, price: float, layout: str, created_at: datetime):
+    """Ghế của một xe cùng dạng DocumentSeatStore.create ghi, để nạp thẳng vào collection seats."""
+    from app.seat_store import layout_seats
+
+    return [
+        {**seat, "bus_id": bus_id, "is_available": True, "price": price, "created_at": created_at}
+        for seat in layout_seats(layout, capacity)
+    ]
+
+
+def _seats(buses, now: datetime):
+    for bus in buses:
+        yield from build_seat_documents(str(bus["_id"]), SEATS_PER_BUS, bus["price"], LAYOUT, now)
+
+
+async def seed(database, scale: float = 1.0, seed: int = 42, drop: bool = False) -> dict:
+    """
+    Ghi bộ dữ liệu vào database rồi tạo index. Index được tạo sau khi ghi để insert nhanh hơn.
+    Trả về document mô tả bộ dữ liệu (cũng được lưu trong benchmark_meta).
+    """
+    from app.auth import hash_password
+    from app.indexes import ensure_indexes
+
+    if drop:
+        for name in BENCH_COLLECTIONS:
+            await database[name].drop()
+
+    rng = random.Random(seed)
+    counts = counts_for(scale)
+    now = datetime.utcnow()
+    # Chuyến xe bắt đầu từ ngày mai để hold/search luôn rơi vào tương lai
+    start = datetime(now.year, now.month, now.day) + timedelta(days=1)
+
+    # bcrypt một lần cho toàn bộ user, hash 100k lần sẽ chiếm gần hết thời gian seed
+    await _write_batches(database["users"], _users(counts["users"], rng, hash_password(BENCH_PASSWORD), now), "users")
+
+    route_docs = list(_routes(counts["routes"], rng, now))
+    await _write_batches(database["routes"], route_docs, "routes")
+
+    # Xe và ghế được ghi theo từng khối để _id của xe có sẵn khi sinh ghế
+    routes_by_id = {str(route["_id"]): route for route in route_docs}
+    buses = _buses(counts["buses"], route_docs, rng, start, now)
+    bus_start = time.perf_counter()
+    written = 0
+    while True:
+        chunk = [bus for _, bus in zip(range(BATCH_SIZE), buses)]
+        if not chunk:
+            break
+        await database["buses"].insert_many(chunk, ordered=False)
+        for bus in chunk:
+            bus["price"] = routes_by_id[bus["route_id"]]["price"]
+        await _write_batches(database["seats"], _seats(chunk, now), f"seats for buses {written}-{written + len(chunk)}")
+        written += len(chunk)
+    print(f"buses: {written} buses with seats in {time.perf_counter() - bus_start:.1f}s")
+
+    await ensure_indexes(database)
+
+    meta = {
+        "_id": "dataset",
+        "seed": seed,
+        "scale": scale,
+        "start": start,
+        "days": DAYS,
+        "password": BENCH_PASSWORD,
+        **counts,
+        "seats": counts["buses"] * SEATS_PER_BUS,
+        "created_at": now,
+    }
+    await database["benchmark_meta"].replace_one({"_id": "dataset"}, meta, upsert=True)
+    return meta
+
+
+async def main(args):
+    from app import database
+
+    meta = await seed(database.db, args.scale, args.seed, args.drop)
+    print({key: value for key, value in meta.items() if key != "password"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=BENCH_DB)
+    parser.add_argument("--drop", action="store_true", help="xóa các collection benchmark trước khi seed")
+    args = parser.parse_args()
+    use_database(args.db)
+    asyncio.run(main(args))
@@ -0,0 +1,118 @@
+"""
+Xuất 1M dòng qua app.exports và kiểm tra bộ nhớ đỉnh (tracemalloc) nằm dưới một trần cố định,
+kèm thời gian tới byte đầu tiên. Exit code 1 nếu vượt trần.
+
+Mặc định dùng cursor tổng hợp (không cần Mongo), sinh document lười như Motor cursor:
+    python -m benchmarks.export_memory --rows 1000000 --max-mb 8 --format csv
+
+Với --mongo, gọi GET /exports/buses qua ASGI trên database benchmark đã seed (benchmarks.dataset):
+    python -m benchmarks.export_memory --mongo --days 31 --max-mb 32
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from benchmarks.dataset import BENCH_DB, use_database
+
+
+async def synthetic_cursor(rows: int):
+    start = datetime(2026, 1, 1)
+    route_ids = [str(ObjectId()) for _ in range(100)]
+    for i in range(rows):
+        departure_time = start + timedelta(minutes=i)
+        yield {
+            "_id": ObjectId(),
+            "bus_number": f"EX-{i:07d}",
+            "capacity": 40,
+            "route_id": route_ids[i % len(route_ids)],
+            "departure_time": departure_time,
+            "arrival_time": departure_time + timedelta(hours=8),
+            "status": "available",
+            "available_seats": 40,
+            "held_seats": 0,
+            "sold_seats": 0,
+            "created_at": start,
+        }
+
+
+async def consume(body_iterator) -> dict:
+    start = time.perf_counter()
+    first_byte = None
+    total = 0
+    lines = 0
+    async for chunk in body_iterator:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        total += len(chunk)
+        lines += chunk.count(b"\n")
+    return {
+        "bytes": total,
+        "lines": lines,
+        "first_byte_ms": round((first_byte or 0) * 1000, 2),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+async def run_synthetic(rows: int, fmt: str) -> dict:
+    from app import exports, projections
+
+    columns = [name for name, _ in projections.bus_projection.fields]
+
+    async def transform(batch):
+        return projections.bus_projection.apply(batch)
+
+    response = exports.export_response(synthetic_cursor(rows), columns, fmt, "buses", transform)
+    return await consume(response.body_iterator)
+
+
+async def run_mongo(days: int, fmt: str) -> dict:
+    import httpx
+
+    from app import database
+    from app.main import app
+
+    meta = await database.db["benchmark_meta"].find_one({"_id": "dataset"})
+    if not meta:
+        raise SystemExit("No benchmark dataset found, run `python -m benchmarks.dataset` first")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        params = {"date": meta["start"].date().isoformat(), "days": days, "format": fmt}
+        async with http.stream("GET", "/exports/buses", params=params) as response:
+            return await consume(response.aiter_raw())
+
+
+def main(args) -> int:
+    # Import trước khi bật tracemalloc để chỉ đo phần xuất dữ liệu
+    import app.main  # noqa: F401
+
+    tracemalloc.start()
+    if args.mongo:
+        result = asyncio.run(run_mongo(args.days, args.format))
+    else:
+        result = asyncio.run(run_synthetic(args.rows, args.format))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["peak_mb"] = round(peak / 2 ** 20, 2)
+    print(result)
+    if result["peak_mb"] > args.max_mb:
+        print(f"FAIL peak memory {result['peak_mb']}MB exceeds {args.max_mb}MB", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--max-mb", type=float, default=8)
+    parser.add_argument("--mongo", action="store_true")
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--db", default=BENCH_DB)
+    args = parser.parse_args()
+    use_database(args.db)
+    sys.exit(main(args))
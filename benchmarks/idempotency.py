@@ -0,0 +1,97 @@
+"""
+Gửi cùng lúc N lần POST /buses với cùng Idempotency-Key (client retry dồn dập khi mạng chập chờn) qua ASGI
+trên app thật, rồi kiểm tra: đúng một xe được tạo, mọi response giống hệt nhau, lần gửi lại sau đó được replay.
+Thoát với mã 1 nếu có xe trùng hoặc response khác nhau. Báo cáo độ trễ của request đầu và các bản trùng.
+
+    python -m benchmarks.idempotency --requests 100
+    python -m benchmarks.idempotency --mongomock --requests 100
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+from benchmarks.dataset import BENCH_DB, use_database, use_mongomock
+from benchmarks.load import percentile
+
+
+async def timed(http: httpx.AsyncClient, payload: dict, key: str) -> tuple:
+    start = time.perf_counter()
+    response = await http.post("/buses", json=payload, headers={"Idempotency-Key": key})
+    return time.perf_counter() - start, response
+
+
+async def main(args) -> int:
+    if args.mongomock:
+        use_mongomock(args.db)
+    from app import database
+    from app.indexes import ensure_indexes
+    from app.main import app
+    from app.jobs import scheduler
+    from app.rate_limit import rate_limiter
+
+    await ensure_indexes()
+    rate_limiter.enabled = False
+    scheduler.enabled = False
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        tag = uuid.uuid4().hex[:8]
+        response = await http.post("/routes", json={
+            "route_code": f"IDEM{tag}", "departure": "Hà Nội", "destination": "Đà Nẵng",
+            "price": 450000, "duration": 780, "distance": 760,
+        })
+        response.raise_for_status()
+        route_id = response.json()["id"]
+        payload = {
+            "bus_number": f"IDEM-{tag}", "capacity": 40, "route_id": route_id,
+            "departure_time": "2026-12-01T20:00:00", "arrival_time": "2026-12-02T09:00:00", "status": "available",
+        }
+        key = str(uuid.uuid4())
+
+        results = await asyncio.gather(*(timed(http, payload, key) for _ in range(args.requests)))
+        retry_seconds, retry = await timed(http, payload, key)
+        _, mismatch = await timed(http, {**payload, "capacity": 41}, key)
+
+    buses = await database.db["buses"].count_documents({"bus_number": payload["bus_number"]})
+    responses = [response for _, response in results]
+    bodies = {response.content for response in responses}
+    replayed = [seconds for seconds, response in results if response.headers.get("idempotent-replayed")]
+    executed = [seconds for seconds, response in results if not response.headers.get("idempotent-replayed")]
+    report = {
+        "requests": args.requests,
+        "buses_created": buses,
+        "statuses": dict(Counter(response.status_code for response in responses)),
+        "distinct_bodies": len(bodies),
+        "executed": len(executed),
+        "executed_ms": round(executed[0] * 1000, 2) if executed else None,
+        "duplicates_p50_ms": round(percentile(replayed, 50) * 1000, 2) if replayed else None,
+        "duplicates_p99_ms": round(percentile(replayed, 99) * 1000, 2) if replayed else None,
+        "retry_ms": round(retry_seconds * 1000, 2),
+        "retry_replayed": retry.headers.get("idempotent-replayed") == "true" and retry.content in bodies,
+        "mismatch_status": mismatch.status_code,
+    }
+    print(json.dumps(report))
+    ok = (
+        buses == 1 and len(bodies) == 1 and len(executed) == 1
+        and report["statuses"] == {200: args.requests}
+        and report["retry_replayed"] and mismatch.status_code == 422
+    )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100, help="số request trùng key gửi cùng lúc")
+    parser.add_argument("--db", default=BENCH_DB)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+    use_database(args.db)
+    sys.exit(asyncio.run(main(args)))
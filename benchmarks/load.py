@@ -0,0 +1,282 @@
+"""
+Load driver: chạy app FastAPI thật qua ASGI với N client đồng thời trên bộ dữ liệu của benchmarks.dataset,
+trộn các luồng đăng ký / đăng nhập / tìm chuyến / xem sơ đồ ghế / đặt vé (hold + confirm).
+In ra (hoặc ghi file) JSON gồm throughput và p50/p95/p99 theo endpoint, và so với một baseline đã lưu.
+
+    python -m benchmarks.dataset --scale 0.1 --drop
+    python -m benchmarks.load --clients 100 --duration 60 --output baseline.json
+    python -m benchmarks.load --clients 100 --duration 60 --baseline baseline.json   # exit 1 nếu chậm đi
+
+Chạy thử không cần mongod (seed bộ dữ liệu nhỏ vào mongomock-motor trong tiến trình):
+    python -m benchmarks.load --mongomock --scale 0.001 --duration 10
+
+Email xác thực của các lượt đăng ký chỉ được ghi vào outbox của database benchmark, không gửi qua SMTP.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+from bson import ObjectId
+
+from benchmarks.dataset import BENCH_DB, BENCH_PASSWORD, LAYOUT, SEATS_PER_BUS, use_database, use_mongomock, user_email
+
+MIX = {"search": 40, "seats": 25, "booking": 15, "login": 15, "register": 5}
+FIXTURE_SIZE = 1000
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, label: str, status, seconds: float):
+        self.latencies[label].append(seconds)
+        self.statuses[label][status] += 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for label in sorted(self.latencies):
+            latencies = self.latencies[label]
+            statuses = self.statuses[label]
+            errors = sum(count for status, count in statuses.items() if status == "error" or status >= 500)
+            endpoints[label] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+                "throughput_rps": round(len(latencies) / elapsed, 2),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            }
+        requests = sum(endpoint["requests"] for endpoint in endpoints.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "total": {
+                "requests": requests,
+                "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+                "throughput_rps": round(requests / elapsed, 2),
+            },
+            "endpoints": endpoints,
+        }
+
+
+class Fixtures:
+    """Mẫu ngẫu nhiên từ bộ dữ liệu (xe, route, token) nạp một lần trước khi đo."""
+    def __init__(self, meta: dict, buses: list, routes: dict, tokens: list):
+        self.meta = meta
+        self.buses = buses
+        self.routes = routes
+        self.tokens = tokens
+
+    @classmethod
+    async def load(cls, database):
+        from app.auth import create_access_token, user_claims
+
+        meta = await database["benchmark_meta"].find_one({"_id": "dataset"})
+        if not meta:
+            raise SystemExit("No benchmark dataset found, run `python -m benchmarks.dataset` first")
+        buses = await database["buses"].aggregate([
+            {"$sample": {"size": FIXTURE_SIZE}},
+            {"$project": {"route_id": 1, "departure_time": 1}},
+        ]).to_list(length=None)
+        route_ids = list({bus["route_id"] for bus in buses})
+        routes = {}
+        async for route in database["routes"].find(
+            {"_id": {"$in": [ObjectId(route_id) for route_id in route_ids]}},
+            {"departure": 1, "destination": 1},
+        ):
+            routes[str(route["_id"])] = route
+        users = await database["users"].aggregate([
+            {"$sample": {"size": FIXTURE_SIZE}},
+            {"$project": {"username": 1, "is_email_verified": 1}},
+        ]).to_list(length=None)
+        tokens = [create_access_token(user_claims(user)) for user in users]
+        return cls(meta, buses, routes, tokens)
+
+
+class Client:
+    """Một người dùng ảo; mỗi client có Random riêng để chuỗi thao tác lặp lại được theo seed."""
+    def __init__(self, http: httpx.AsyncClient, fixtures: Fixtures, recorder: Recorder, rng: random.Random,
+                 run_tag: str, registrations: itertools.count):
+        from app.seat_layouts import generate_seats
+
+        self.http = http
+        self.fixtures = fixtures
+        self.recorder = recorder
+        self.rng = rng
+        self.run_tag = run_tag
+        self.registrations = registrations
+        self.seat_numbers = [seat["seat_number"] for seat in generate_seats(SEATS_PER_BUS, LAYOUT)]
+
+    async def call(self, label: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, **kwargs)
+        except Exception:
+            self.recorder.record(label, "error", time.perf_counter() - start)
+            return None
+        self.recorder.record(label, response.status_code, time.perf_counter() - start)
+        return response
+
+    async def search(self):
+        bus = self.rng.choice(self.fixtures.buses)
+        route = self.fixtures.routes.get(bus["route_id"])
+        if not route:
+            return
+        await self.call("GET /search/trips", "GET", "/search/trips", params={
+            "departure": route["departure"],
+            "destination": route["destination"],
+            "date": bus["departure_time"].date().isoformat(),
+        })
+
+    async def seats(self):
+        bus = self.rng.choice(self.fixtures.buses)
+        await self.call("GET /buses/{bus_id}/seats", "GET", f"/buses/{bus['_id']}/seats")
+
+    async def booking(self):
+        bus_id = str(self.rng.choice(self.fixtures.buses)["_id"])
+        headers = {"Authorization": f"Bearer {self.rng.choice(self.fixtures.tokens)}"}
+        seat_numbers = self.rng.sample(self.seat_numbers, self.rng.randint(1, 2))
+        response = await self.call("POST /buses/{bus_id}/seats/hold", "POST", f"/buses/{bus_id}/seats/hold",
+                                   json={"seat_numbers": seat_numbers}, headers=headers)
+        if response is not None and response.status_code == 200:
+            await self.call("POST /buses/{bus_id}/seats/confirm", "POST", f"/buses/{bus_id}/seats/confirm",
+                            json={"hold_id": response.json()["hold_id"]}, headers=headers)
+
+    async def login(self):
+        i = self.rng.randrange(self.fixtures.meta["users"])
+        await self.call("POST /users/login", "POST", "/users/login",
+                        json={"email": user_email(i), "password": BENCH_PASSWORD})
+
+    async def register(self):
+        username = f"lt{self.run_tag}{next(self.registrations)}"
+        await self.call("POST /users/register", "POST", "/users/register", json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": BENCH_PASSWORD,
+        })
+
+    async def run(self, mix: dict, deadline: float):
+        actions = [getattr(self, name) for name in mix]
+        weights = list(mix.values())
+        while time.perf_counter() < deadline:
+            await self.rng.choices(actions, weights)[0]()
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in MIX:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name}, expected one of {', '.join(MIX)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """So từng endpoint với baseline: p95 tăng hoặc throughput giảm quá tolerance, hoặc tỉ lệ lỗi tăng, là chậm đi."""
+    regressions = []
+    for label, base in baseline["endpoints"].items():
+        current = report["endpoints"].get(label)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {base['throughput_rps']} -> {current['throughput_rps']} rps")
+        base_error_rate = base["errors"] / base["requests"]
+        error_rate = current["errors"] / current["requests"]
+        if error_rate > base_error_rate + 0.01:
+            regressions.append(f"{label}: error rate {base_error_rate:.1%} -> {error_rate:.1%}")
+    return regressions
+
+
+async def main(args) -> int:
+    if args.mongomock:
+        use_mongomock(args.db)
+    from app import database
+    from app.email_service import email_service
+    from app.main import app
+    from app.jobs import scheduler
+    from app.rate_limit import rate_limiter
+
+    if args.mongomock:
+        from benchmarks.dataset import seed
+        await seed(database.db, args.scale, args.seed, drop=True)
+
+    # Không gửi email thật: chỉ giữ phần ghi outbox của luồng đăng ký
+    email_service.worker_count = 0
+    logging.getLogger("app.email_service").setLevel(logging.ERROR)
+    # Mọi client ảo đi qua cùng một địa chỉ ASGI nên tắt giới hạn theo client; load shedding vẫn bật
+    rate_limiter.enabled = False
+    # Job nền (đối soát, archive, compact) không chạy trong lúc đo
+    scheduler.enabled = False
+
+    fixtures = await Fixtures.load(database.db)
+    recorder = Recorder()
+    run_tag = uuid.uuid4().hex[:8]
+    registrations = itertools.count()
+
+    async with app.router.lifespan_context(app):
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits,
+                                     timeout=60) as http:
+            clients = [Client(http, fixtures, recorder, random.Random(args.seed + i), run_tag,
+                              registrations)
+                       for i in range(args.clients)]
+            start = time.perf_counter()
+            deadline = start + args.duration
+            await asyncio.gather(*(client.run(args.mix, deadline) for client in clients))
+            elapsed = time.perf_counter() - start
+
+    report = recorder.report(elapsed)
+    report["config"] = {"clients": args.clients, "duration": args.duration, "mix": args.mix, "seed": args.seed,
+                        "mongomock": args.mongomock}
+    report["dataset"] = {key: fixtures.meta[key] for key in ("seed", "scale", "users", "routes", "buses", "seats")}
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="giây")
+    parser.add_argument("--mix", type=parse_mix, default=MIX,
+                        help="trọng số các luồng, ví dụ search=40,seats=25,booking=15,login=15,register=5")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=BENCH_DB)
+    parser.add_argument("--output", help="ghi báo cáo JSON ra file (dùng làm baseline)")
+    parser.add_argument("--baseline", help="báo cáo JSON trước đó để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="mức chậm đi cho phép so với baseline")
+    parser.add_argument("--mongomock", action="store_true", help="seed và chạy trên mongomock-motor trong tiến trình")
+    parser.add_argument("--scale", type=float, default=0.001, help="quy mô bộ dữ liệu khi dùng --mongomock")
+    args = parser.parse_args()
+    use_database(args.db)
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,77 @@
+"""
+Đo chi phí của phần đo đạc: MetricsMiddleware trên mỗi request và CommandMetricsListener trên mỗi lệnh Mongo.
+Không cần Mongo.
+
+    python -m benchmarks.metrics_overhead --requests 20000
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+
+from app.metrics import CommandMetricsListener, MetricsMiddleware
+
+
+def build_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/buses/{bus_id}")
+    async def bus(bus_id: str):
+        return {"id": bus_id}
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def drive(app, requests: int) -> float:
+    """Gọi app trực tiếp qua ASGI (không qua HTTP client) để phần chênh lệch chỉ là middleware."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/buses/123", "raw_path": b"/buses/123", "query_string": b"", "root_path": "",
+        "headers": [], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def listener_cost(events: int) -> float:
+    listener = CommandMetricsListener()
+    command = {"find": "buses", "filter": {"route_id": "x", "departure_time": {"$gte": 1}}}
+    reply = {"cursor": {"firstBatch": [{}] * 10}}
+    start = time.perf_counter()
+    for i in range(events):
+        listener.started(SimpleNamespace(command=command, command_name="find", connection_id=("h", 1), request_id=i))
+        listener.succeeded(SimpleNamespace(command_name="find", connection_id=("h", 1), request_id=i,
+                                           duration_micros=800, reply=reply))
+    return (time.perf_counter() - start) / events
+
+
+async def run(requests: int):
+    plain = build_app(False)
+    instrumented = build_app(True)
+    await drive(plain, 1000)
+    await drive(instrumented, 1000)
+    base = await drive(plain, requests)
+    with_metrics = await drive(instrumented, requests)
+    print(f"request without metrics: {base * 1e6:.1f}us")
+    print(f"request with metrics:    {with_metrics * 1e6:.1f}us (+{(with_metrics - base) * 1e6:.1f}us)")
+    print(f"mongo listener per command: {listener_cost(requests) * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
@@ -0,0 +1,61 @@
+"""
+So sánh xử lý login đồng thời khi verify bcrypt chạy thẳng trên event loop (trước)
+và qua PasswordHasher (sau). Không cần Mongo.
+
+    python -m benchmarks.password_hashing --logins 64
+
+Ngoài throughput, script đo độ trễ lớn nhất của event loop: đó là thời gian
+mọi request khác trên cùng worker bị treo.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app import auth
+
+
+async def measure(verify, logins: int, hashed: str):
+    max_lag = 0.0
+    stop = False
+
+    async def heartbeat():
+        nonlocal max_lag
+        while not stop:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            max_lag = max(max_lag, time.perf_counter() - start - 0.005)
+
+    ticker = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await asyncio.gather(*(verify("Password1!", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop = True
+    await ticker
+    return logins / elapsed, max_lag
+
+
+async def run(logins: int, workers: int, use_processes: bool):
+    hashed = auth.hash_password("Password1!")
+
+    async def inline_verify(plain, hashed_password):
+        return auth.verify_password(plain, hashed_password)
+
+    hasher = auth.PasswordHasher(workers=workers, use_processes=use_processes)
+    before = await measure(inline_verify, logins, hashed)
+    after = await measure(hasher.verify, logins, hashed)
+    hasher.shutdown()
+
+    print(f"rounds={auth.BCRYPT_ROUNDS} logins={logins} workers={workers} executor={'process' if use_processes else 'thread'}")
+    print(f"inline: {before[0]:.1f} logins/s, max event loop lag {before[1] * 1000:.0f}ms")
+    print(f"pooled: {after[0]:.1f} logins/s, max event loop lag {after[1] * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--processes", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.workers, args.processes))
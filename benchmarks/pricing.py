@@ -0,0 +1,120 @@
+"""
+Đo tốc độ tính giá động cho cả sơ đồ ghế (FareEngine.price_seats) trên một core, không cần Mongo.
+So với cách duyệt rule cho từng ghế, và báo lỗi (exit 1) nếu tốc độ dưới --min-rate ghế/giây.
+
+    python -m benchmarks.pricing --seats 1000000
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app.pricing import FareEngine, _in_range, round_price
+from app.seat_layouts import generate_seats
+
+from benchmarks.dataset import LAYOUT, SEATS_PER_BUS
+
+
+def sample_rules(route_ids, rng: random.Random) -> list:
+    rules = [
+        {"factor": "seat_class", "seat_type": "sleeper", "deck": "upper", "multiplier": 0.9},
+        {"factor": "seat_class", "seat_type": "limousine", "multiplier": 1.5},
+        {"factor": "departure_hour", "min_value": 22, "max_value": 5, "multiplier": 0.85},
+        {"factor": "departure_hour", "min_value": 16, "max_value": 19, "multiplier": 1.1},
+        {"factor": "occupancy", "min_value": 0.7, "multiplier": 1.15},
+        {"factor": "occupancy", "min_value": 0.9, "multiplier": 1.1},
+        {"factor": "days_to_departure", "max_value": 2, "multiplier": 1.2},
+        {"factor": "days_to_departure", "min_value": 30, "multiplier": 0.9},
+    ]
+    for route_id in rng.sample(route_ids, len(route_ids) // 10):
+        rules.append({"factor": "occupancy", "route_id": route_id, "min_value": 0.5, "multiplier": 1.3})
+    return rules
+
+
+def build_buses(count: int, route_ids: list, rng: random.Random, now: datetime) -> list:
+    template = generate_seats(SEATS_PER_BUS, LAYOUT)
+    buses = []
+    for i in range(count):
+        bus = {"route_id": rng.choice(route_ids),
+               "departure_time": now + timedelta(days=rng.randint(0, 45), hours=rng.randint(0, 23))}
+        price = rng.choice([150000.0, 250000.0, 320000.0])
+        occupancy = rng.random()
+        seats = [{**seat, "price": price, "is_available": rng.random() > occupancy} for seat in template]
+        buses.append((bus, seats))
+    return buses
+
+
+def naive_prices(rules: list, bus: dict, seats: list, now: datetime) -> list:
+    """Duyệt toàn bộ rule cho từng ghế, như khi không có bảng giá biên dịch sẵn."""
+    occupancy = sum(not seat["is_available"] for seat in seats) / len(seats)
+    days = (bus["departure_time"] - now).days
+    prices = []
+    for seat in seats:
+        fare = seat["price"]
+        for rule in rules:
+            if rule.get("route_id") not in (None, bus["route_id"]):
+                continue
+            factor = rule["factor"]
+            if factor == "seat_class":
+                if rule.get("seat_type") in (None, seat["seat_type"]) and rule.get("deck") in (None, seat["deck"]):
+                    fare *= rule["multiplier"]
+            elif factor == "departure_hour":
+                if _in_range(rule, bus["departure_time"].hour, wraps=True):
+                    fare *= rule["multiplier"]
+            elif _in_range(rule, occupancy if factor == "occupancy" else days):
+                fare *= rule["multiplier"]
+        prices.append(round_price(fare))
+    return prices
+
+
+def measure(label: str, buses: list, price) -> dict:
+    start = time.perf_counter()
+    seats = 0
+    for bus, bus_seats in buses:
+        seats += len(price(bus, bus_seats))
+    elapsed = time.perf_counter() - start
+    return {"run": label, "seats": seats, "seconds": round(elapsed, 3), "seats_per_second": int(seats / elapsed)}
+
+
+def main(args) -> int:
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    route_ids = [f"route{i}" for i in range(args.routes)]
+    rules = sample_rules(route_ids, rng)
+    buses = build_buses(max(1, args.seats // SEATS_PER_BUS), route_ids, rng, now)
+
+    engine = FareEngine()
+    start = time.perf_counter()
+    engine.load(rules)
+    compile_seconds = time.perf_counter() - start
+
+    results = [
+        # Lần đầu: mọi tổ hợp (route, giờ, ngày, bậc lấp đầy) đều phải tính
+        measure("cold", buses, lambda bus, seats: engine.price_seats(bus, seats, now)),
+        # Các lần sau: giá theo hạng ghế đã được nhớ, chỉ còn đếm ghế và tra bảng
+        measure("warm", buses, lambda bus, seats: engine.price_seats(bus, seats, now)),
+        measure("per-seat rules", buses[:max(1, len(buses) // 10)], lambda bus, seats: naive_prices(rules, bus, seats, now)),
+    ]
+    print(f"compiled {len(rules)} rules for {len(engine.routes) + 1} fare tables in {compile_seconds * 1000:.1f}ms")
+    for result in results:
+        print(result)
+
+    sample_bus, sample_seats = buses[0]
+    if engine.price_seats(sample_bus, sample_seats, now) != naive_prices(rules, sample_bus, sample_seats, now):
+        print("Fare table prices differ from per-seat rule evaluation", file=sys.stderr)
+        return 1
+    warm = results[1]["seats_per_second"]
+    if warm < args.min_rate:
+        print(f"Priced {warm} seats/s, below --min-rate {args.min_rate}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seats", type=int, default=1000000)
+    parser.add_argument("--routes", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-rate", type=int, default=1000000, help="số ghế/giây tối thiểu khi bảng giá đã nóng")
+    sys.exit(main(parser.parse_args()))
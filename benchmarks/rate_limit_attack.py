@@ -0,0 +1,147 @@
+"""
+Đo độ trễ của traffic bình thường khi có một đợt tấn công đăng nhập/đăng ký (credential stuffing),
+qua ba pha: không tấn công, tấn công khi tắt rate limit + load shedding, và tấn công khi bật.
+Mỗi client bình thường có IP riêng và nghỉ giữa các request; attacker gửi liên tục từ --attacker-ips địa chỉ,
+nhắm vào các tài khoản khác với tài khoản của client bình thường.
+
+    python -m benchmarks.dataset --scale 0.001 --drop
+    python -m benchmarks.rate_limit_attack --clients 20 --attackers 200 --duration 30
+    python -m benchmarks.rate_limit_attack --mongomock     # không cần mongod
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+
+import httpx
+
+from benchmarks.dataset import BENCH_DB, BENCH_PASSWORD, use_database, use_mongomock, user_email
+from benchmarks.load import Client, Fixtures, Recorder
+
+NORMAL_MIX = {"search": 50, "seats": 40, "login": 10}
+
+
+class NormalClient(Client):
+    """Người dùng thật: đăng nhập vào nửa đầu danh sách user, nghỉ think_time giữa các thao tác."""
+    think_time = 1.0
+
+    async def login(self):
+        i = self.rng.randrange(max(1, self.fixtures.meta["users"] // 2))
+        await self.call("POST /users/login", "POST", "/users/login",
+                        json={"email": user_email(i), "password": BENCH_PASSWORD})
+
+    async def run(self, mix: dict, deadline: float):
+        actions = [getattr(self, name) for name in mix]
+        weights = list(mix.values())
+        while time.perf_counter() < deadline:
+            await self.rng.choices(actions, weights)[0]()
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+
+
+async def attacker(http: httpx.AsyncClient, users: int, recorder: Recorder, rng: random.Random, deadline: float):
+    """Thử mật khẩu sai trên nửa sau danh sách user, xen kẽ đăng ký tài khoản rác, không nghỉ."""
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if rng.random() < 0.8:
+            label = "attack login"
+            i = rng.randrange(users // 2, users) if users > 1 else 0
+            request = http.post("/users/login", json={"email": user_email(i), "password": "Wrong#Pass123"})
+        else:
+            label = "attack register"
+            name = f"atk{uuid.uuid4().hex[:12]}"
+            request = http.post("/users/register", json={
+                "username": name, "email": f"{name}@example.com", "password": BENCH_PASSWORD,
+            })
+        try:
+            response = await request
+            status = response.status_code
+            retry_after = float(response.headers.get("retry-after", 0))
+        except Exception:
+            status, retry_after = "error", 0
+        recorder.record(label, status, time.perf_counter() - start)
+        # Attacker tuân theo Retry-After tối đa 50ms rồi thử lại, để vẫn gây áp lực liên tục
+        await asyncio.sleep(min(retry_after, 0.05))
+
+
+async def run_phase(app, fixtures, args, attack: bool, protected: bool) -> dict:
+    from app.rate_limit import MemoryBucketBackend, RATE_LIMIT_MAX_KEYS, load_shedder, rate_limiter
+
+    rate_limiter.backend = MemoryBucketBackend(RATE_LIMIT_MAX_KEYS)
+    rate_limiter.enabled = protected
+    load_shedder.enabled = protected
+
+    normal = Recorder()
+    attacks = Recorder()
+    clients = []
+    transports = []
+    for i in range(args.clients):
+        transport = httpx.ASGITransport(app=app, client=(f"10.0.{i // 250}.{i % 250 + 1}", 40000))
+        http = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120)
+        transports.append(http)
+        clients.append(NormalClient(http, fixtures, normal, random.Random(args.seed + i), "", None))
+    attackers = []
+    for i in range(args.attacker_ips if attack else 0):
+        transport = httpx.ASGITransport(app=app, client=(f"203.0.113.{i % 250 + 1}", 50000))
+        attackers.append(httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120))
+
+    deadline = time.perf_counter() + args.duration
+    start = time.perf_counter()
+    tasks = [client.run(NORMAL_MIX, deadline) for client in clients]
+    if attack:
+        tasks += [attacker(attackers[i % len(attackers)], fixtures.meta["users"], attacks,
+                           random.Random(args.seed * 1000 + i), deadline)
+                  for i in range(args.attackers)]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    for http in transports + attackers:
+        await http.aclose()
+
+    report = {"normal": normal.report(elapsed)}
+    if attack:
+        report["attack"] = attacks.report(elapsed)
+    return report
+
+
+async def main(args):
+    if args.mongomock:
+        use_mongomock(args.db)
+    from app import database
+    from app.email_service import email_service
+    from app.jobs import scheduler
+    from app.main import app
+
+    if args.mongomock:
+        from benchmarks.dataset import seed
+        await seed(database.db, args.scale, args.seed, drop=True)
+
+    email_service.worker_count = 0
+    logging.getLogger("app.email_service").setLevel(logging.ERROR)
+    # Job nền không chạy trong lúc đo
+    scheduler.enabled = False
+    fixtures = await Fixtures.load(database.db)
+
+    report = {"config": {"clients": args.clients, "attackers": args.attackers, "attacker_ips": args.attacker_ips,
+                         "duration": args.duration}}
+    async with app.router.lifespan_context(app):
+        report["no_attack"] = await run_phase(app, fixtures, args, attack=False, protected=True)
+        report["attack_unprotected"] = await run_phase(app, fixtures, args, attack=True, protected=False)
+        report["attack_protected"] = await run_phase(app, fixtures, args, attack=True, protected=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=20, help="số người dùng bình thường, mỗi người một IP")
+    parser.add_argument("--attackers", type=int, default=200, help="số request tấn công đồng thời")
+    parser.add_argument("--attacker-ips", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=30, help="giây mỗi pha")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=BENCH_DB)
+    parser.add_argument("--mongomock", action="store_true", help="seed và chạy trên mongomock-motor trong tiến trình")
+    parser.add_argument("--scale", type=float, default=0.001, help="quy mô bộ dữ liệu khi dùng --mongomock")
+    args = parser.parse_args()
+    use_database(args.db)
+    asyncio.run(main(args))
@@ -0,0 +1,112 @@
+"""
+Kiểm tra định tuyến đọc trên replica set thật: đếm opcounters.query của từng member trước và sau
+mỗi nhóm request để xem request đó được phục vụ từ primary hay secondary.
+
+    docker compose -f docker-compose.replica.yml up -d
+    MONGO_URI="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0" \\
+        python -m benchmarks.read_routing --requests 200
+
+Exit code 1 nếu đọc catalog (GET /routes, GET /buses) không chủ yếu rơi vào secondary,
+hoặc đọc cần primary (sơ đồ ghế, đọc lại sau khi tạo route) chạm vào secondary.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+
+import httpx
+from pymongo import MongoClient, uri_parser
+
+from benchmarks.dataset import BENCH_DB, use_database
+
+
+def member_clients(uri: str, hosts: list) -> dict:
+    parsed = uri_parser.parse_uri(uri)
+    return {
+        host: MongoClient(host, directConnection=True, username=parsed["username"], password=parsed["password"],
+                          authSource=parsed["options"].get("authsource", "admin"))
+        for host in hosts
+    }
+
+
+def query_counts(members: dict) -> dict:
+    return {host: client.admin.command("serverStatus")["opcounters"]["query"] for host, client in members.items()}
+
+
+async def measure(members: dict, requests) -> dict:
+    before = query_counts(members)
+    await requests()
+    after = query_counts(members)
+    return {host: after[host] - before[host] for host in members}
+
+
+async def run(args) -> int:
+    from app import database
+    from app.jobs import scheduler
+    from app.main import app
+
+    # Job nền cũng đọc/ghi Mongo, làm sai số lệnh đếm trên từng member
+    scheduler.enabled = False
+
+    hello = await database.client.admin.command("hello")
+    if "setName" not in hello:
+        raise SystemExit("MONGO_URI does not point to a replica set, see docker-compose.replica.yml")
+    primary = hello["primary"]
+    members = member_clients(database.MONGO_URI, hello["hosts"])
+    n = args.requests
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as http:
+            route = (await http.post("/routes", json={
+                "route_code": f"RR-{uuid.uuid4().hex[:6]}", "departure": "Hà Nội", "destination": "Huế",
+                "price": 300000, "duration": 720, "distance": 660,
+            })).json()
+            bus = (await http.post("/buses", json={
+                "bus_number": "RR-1", "capacity": 10, "route_id": route["id"], "status": "available",
+                "departure_time": "2030-01-01T08:00:00", "arrival_time": "2030-01-01T20:00:00",
+            })).json()
+            await http.post(f"/buses/{bus['id']}/seats")
+
+            async def catalog():
+                for i in range(n):
+                    # departure khác nhau để không trúng cache của GET /routes
+                    await http.get("/routes", params={"departure": f"check-{i}"})
+                    await http.get("/buses", params={"route_id": route["id"]})
+
+            async def primary_reads():
+                for i in range(n):
+                    await http.get(f"/buses/{bus['id']}/seats")
+                for i in range(n // 10):
+                    await http.post("/routes", json={
+                        "route_code": f"RR-{uuid.uuid4().hex[:6]}", "departure": "Huế", "destination": "Đà Nẵng",
+                        "price": 100000, "duration": 120, "distance": 100,
+                    })
+
+            report = {
+                "primary": primary,
+                "catalog": await measure(members, catalog),
+                "primary_reads": await measure(members, primary_reads),
+            }
+
+    print(json.dumps(report, indent=2))
+    catalog_total = sum(report["catalog"].values()) or 1
+    failures = []
+    if report["catalog"][primary] / catalog_total > 0.1:
+        failures.append(f"{report['catalog'][primary]}/{catalog_total} catalog queries ran on the primary")
+    secondary_reads = sum(count for host, count in report["primary_reads"].items() if host != primary)
+    if secondary_reads:
+        failures.append(f"{secondary_reads} primary-only queries ran on secondaries")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--db", default=BENCH_DB)
+    args = parser.parse_args()
+    use_database(args.db)
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,98 @@
+"""
+Load test giữ ghế: N client đồng thời tranh nhau giữ ghế trên cùng một xe.
+
+Chạy với Mongo thật (MONGO_URI/MONGO_DB trong .env):
+    python -m benchmarks.seat_hold_load --clients 500
+
+Kiểm tra: không có ghế nào thuộc về hai hold, và in ra p50/p99 latency.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+from bson import ObjectId
+
+from app.auth import create_access_token
+from app.database import db
+from app.indexes import ensure_indexes
+from app.jobs import scheduler
+from app.main import app
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def seed_bus(capacity: int) -> str:
+    now = datetime.utcnow()
+    bus = {
+        "bus_number": f"LOAD-{ObjectId()}",
+        "capacity": capacity,
+        "route_id": str(ObjectId()),
+        "departure_time": now + timedelta(days=1),
+        "arrival_time": now + timedelta(days=1, hours=5),
+        "status": "available",
+        "created_at": now,
+    }
+    result = await db["buses"].insert_one(bus)
+    bus_id = str(result.inserted_id)
+    await db["seats"].insert_many([
+        {"seat_number": f"A{i:02d}", "bus_id": bus_id, "is_available": True, "price": 100000, "created_at": now}
+        for i in range(1, capacity + 1)
+    ])
+    return bus_id
+
+
+async def run(clients: int, capacity: int, seats_per_hold: int):
+    await ensure_indexes()
+    scheduler.enabled = False
+    bus_id = await seed_bus(capacity)
+    seat_numbers = [f"A{i:02d}" for i in range(1, capacity + 1)]
+    latencies = []
+    held = []
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def holder(i: int):
+            token = create_access_token({"sub": str(ObjectId())})
+            wanted = random.sample(seat_numbers, seats_per_hold)
+            start = time.perf_counter()
+            response = await client.post(
+                f"/buses/{bus_id}/seats/hold",
+                json={"seat_numbers": wanted},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code == 200:
+                held.append(response.json())
+
+        await asyncio.gather(*(holder(i) for i in range(clients)))
+
+    counts = Counter(seat for hold in held for seat in hold["seat_numbers"])
+    double_booked = [seat for seat, count in counts.items() if count > 1]
+    in_db = await db["seats"].count_documents({"bus_id": bus_id, "hold_id": {"$ne": None}})
+
+    print(f"clients={clients} successful_holds={len(held)} seats_held={len(counts)} seats_held_in_db={in_db}")
+    print(f"p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms")
+    print(f"double_booked={double_booked}")
+
+    await db["seats"].delete_many({"bus_id": bus_id})
+    await db["seat_holds"].delete_many({"bus_id": bus_id})
+    await db["buses"].delete_one({"_id": ObjectId(bus_id)})
+
+    if double_booked or in_db != len(counts):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--capacity", type=int, default=40)
+    parser.add_argument("--seats-per-hold", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.capacity, args.seats_per_hold))
@@ -0,0 +1,124 @@
+"""
+So sánh hai cách lưu sơ đồ ghế (SEAT_STORAGE=documents và compact) trên cùng một tập xe:
+dung lượng (số document, byte BSON, storageSize/index khi chạy trên mongod) và độ trễ đọc/ghi qua seat store.
+Mỗi cách lưu dùng collection riêng (bench_seats, bench_seat_maps) trong database benchmark.
+
+    python -m benchmarks.seat_storage --buses 5000
+    python -m benchmarks.seat_storage --mongomock --buses 500
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import bson
+from bson import ObjectId
+
+from benchmarks.dataset import BENCH_DB, LAYOUT, SEATS_PER_BUS, use_database, use_mongomock
+from benchmarks.load import percentile
+
+CREATE_BATCH = 500
+
+
+def latency(samples: list) -> dict:
+    return {"p50_ms": round(percentile(samples, 50) * 1000, 2), "p99_ms": round(percentile(samples, 99) * 1000, 2)}
+
+
+async def storage(store, mongomock: bool) -> dict:
+    from app import database
+
+    name = store.collection_name
+    result = {"documents": 0, "bson_bytes": 0}
+    async for doc in database.db[name].find({}):
+        result["documents"] += 1
+        result["bson_bytes"] += len(bson.encode(doc))
+    if not mongomock:
+        stats = await database.db.command("collStats", name)
+        result.update(storage_bytes=stats["storageSize"], index_bytes=stats["totalIndexSize"])
+    return result
+
+
+async def measure(store, bus_ids: list, args) -> dict:
+    from app import database
+    from app.seat_store import layout_seats
+
+    await database.db[store.collection_name].drop()
+    if not store.compact:
+        from app.indexes import INDEXES
+        await database.db[store.collection_name].create_indexes(INDEXES["seats"])
+
+    start = time.perf_counter()
+    for i in range(0, len(bus_ids), CREATE_BATCH):
+        await store.create([
+            {"bus_id": bus_id, "capacity": SEATS_PER_BUS, "price": 300000.0, "layout": LAYOUT}
+            for bus_id in bus_ids[i:i + CREATE_BATCH]
+        ])
+    create_seconds = time.perf_counter() - start
+
+    # Cùng seed cho cả hai cách lưu: cùng xe, cùng ghế, cùng thứ tự thao tác
+    rng = random.Random(args.seed)
+    numbers = [seat["seat_number"] for seat in layout_seats(LAYOUT, SEATS_PER_BUS)]
+    holds, confirms = [], []
+    for k in range(args.writes):
+        bus_id = bus_ids[k % len(bus_ids)]
+        pair = numbers[2 * (k // len(bus_ids)) % SEATS_PER_BUS:][:2]
+        hold_id = ObjectId()
+        now = datetime.utcnow()
+        start = time.perf_counter()
+        held = await store.try_hold(bus_id, pair, "bench", hold_id, now + timedelta(minutes=10))
+        holds.append(time.perf_counter() - start)
+        if held:
+            start = time.perf_counter()
+            await store.confirm(bus_id, pair, hold_id, "bench", now)
+            confirms.append(time.perf_counter() - start)
+
+    reads = []
+    for _ in range(args.reads):
+        bus_id = rng.choice(bus_ids)
+        start = time.perf_counter()
+        seats = await store.find(bus_id)
+        reads.append(time.perf_counter() - start)
+        assert len(seats) == SEATS_PER_BUS
+
+    return {
+        "storage": type(store).__name__,
+        "create_seats_per_second": int(len(bus_ids) * SEATS_PER_BUS / create_seconds),
+        **await storage(store, args.mongomock),
+        "read_seat_map": latency(reads),
+        "hold": latency(holds),
+        "confirm": latency(confirms) if confirms else None,
+    }
+
+
+async def main(args):
+    if args.mongomock:
+        use_mongomock(args.db)
+    from app.seat_store import CompactSeatStore, DocumentSeatStore
+
+    bus_ids = [str(ObjectId()) for _ in range(args.buses)]
+    results = [
+        await measure(DocumentSeatStore("bench_seats"), bus_ids, args),
+        await measure(CompactSeatStore("bench_seat_maps"), bus_ids, args),
+    ]
+    for result in results:
+        print(json.dumps(result))
+    documents, compact = results
+    print(json.dumps({
+        "bson_bytes_ratio": round(documents["bson_bytes"] / compact["bson_bytes"], 1),
+        "read_p50_ratio": round(documents["read_seat_map"]["p50_ms"] / max(compact["read_seat_map"]["p50_ms"], 0.01), 1),
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buses", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--writes", type=int, default=2000, help="số lần giữ rồi bán 2 ghế")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=BENCH_DB)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+    use_database(args.db)
+    asyncio.run(main(args))
@@ -0,0 +1,173 @@
+"""
+So sánh chi phí theo dõi sơ đồ ghế: N client poll GET /buses/{bus_id}/seats mỗi giây
+với N subscriber nhận delta qua SeatEventHub (cùng generator mà endpoint SSE dùng),
+trong khi một writer liên tục giữ/nhả ghế. Báo cáo CPU, số lần đọc Mongo và số delta đã giao.
+
+    python -m benchmarks.seat_stream --clients 10000 --buses 100 --seconds 10
+    python -m benchmarks.seat_stream --mongo   # dùng MONGO_URI (replica set -> change stream)
+
+Mặc định chạy trên mongomock-motor trong tiến trình; khi đó hub dùng chế độ poll chung (một query mỗi giây).
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+from collections import deque
+
+import httpx
+
+from benchmarks.dataset import BENCH_DB, build_seat_documents, use_database, use_mongomock
+
+
+async def seed(buses: int, capacity: int) -> list:
+    from datetime import datetime, timedelta
+
+    from app.database import collection
+
+    now = datetime.utcnow()
+    bus_docs = [{
+        "bus_number": f"SS-{i}", "capacity": capacity, "route_id": "seat-stream", "status": "available",
+        "departure_time": now + timedelta(days=1), "arrival_time": now + timedelta(days=1, hours=5),
+        "available_seats": capacity, "held_seats": 0, "sold_seats": 0, "created_at": now,
+    } for i in range(buses)]
+    result = await collection("buses").insert_many(bus_docs)
+    bus_ids = [str(bus_id) for bus_id in result.inserted_ids]
+    seats = [seat for bus_id in bus_ids for seat in build_seat_documents(bus_id, capacity, 100000, "default", now)]
+    await collection("seats").insert_many(seats)
+    return bus_ids
+
+
+async def writer(bus_ids: list, capacity: int, rate: float, deadline: float, rng: random.Random) -> int:
+    """Giữ ghế ngẫu nhiên với tốc độ rate thao tác/giây; mỗi hold được nhả sau khoảng 2 giây."""
+    from app import reservations
+    from app.seat_store import seat_store
+
+    async def release(bus_id, hold_id):
+        await seat_store.release_hold(bus_id, hold_id)
+        await reservations.adjust_counters(bus_id, available=1, held=-1)
+        await reservations.get_hold_collection().delete_one({"_id": hold_id})
+
+    operations = 0
+    holds = deque()
+    while time.perf_counter() < deadline:
+        bus_id = rng.choice(bus_ids)
+        seat = f"A{rng.randint(1, capacity):02d}"
+        try:
+            hold = await reservations.hold_seats(bus_id, [seat], "seat-stream")
+            holds.append((bus_id, hold["_id"]))
+        except reservations.SeatsUnavailable:
+            pass
+        if len(holds) > rate * 2:
+            await release(*holds.popleft())
+        operations += 1
+        await asyncio.sleep(1 / rate)
+    while holds:
+        await release(*holds.popleft())
+    return operations
+
+
+async def run_poll(bus_ids, args, rng) -> dict:
+    from app.main import app
+
+    served = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def poller(i: int):
+            nonlocal served
+            bus_id = bus_ids[i % len(bus_ids)]
+            await asyncio.sleep(rng.random() * args.interval)
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await http.get(f"/buses/{bus_id}/seats")
+                served += 1
+                await asyncio.sleep(max(0, args.interval - (time.perf_counter() - start)))
+
+        deadline = time.perf_counter() + args.seconds
+        cpu = time.process_time()
+        operations, *_ = await asyncio.gather(
+            writer(bus_ids, args.capacity, args.updates, deadline, rng),
+            *(poller(i) for i in range(args.clients)),
+        )
+        cpu = time.process_time() - cpu
+    return {
+        "requests": served,
+        "target_requests": int(args.clients * args.seconds / args.interval),
+        "mongo_reads": served,
+        "seat_documents_read": served * args.capacity,
+        "writer_operations": operations,
+        "cpu_seconds": round(cpu, 2),
+    }
+
+
+async def run_push(bus_ids, args, rng) -> dict:
+    from app.seat_events import seat_events
+
+    received = 0
+    connected = 0
+    await seat_events.start()
+
+    async def subscriber(i: int):
+        nonlocal received, connected
+        stream = seat_events.sse(bus_ids[i % len(bus_ids)])
+        try:
+            await stream.__anext__()
+            connected += 1
+            while True:
+                chunk = await stream.__anext__()
+                if chunk.startswith(b"event: seats"):
+                    received += 1
+        finally:
+            await stream.aclose()
+
+    tasks = [asyncio.create_task(subscriber(i)) for i in range(args.clients)]
+    while connected < args.clients:
+        await asyncio.sleep(0.1)
+    reads_after_connect = seat_events.reads
+    cpu = time.process_time()
+    deadline = time.perf_counter() + args.seconds
+    operations = await writer(bus_ids, args.capacity, args.updates, deadline, rng)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    cpu = time.process_time() - cpu
+    await seat_events.stop()
+    return {
+        "mode": seat_events.mode,
+        "subscribers": args.clients,
+        "snapshot_reads": reads_after_connect,
+        "mongo_reads": seat_events.reads,
+        "events_delivered": received,
+        "dropped_subscribers": seat_events.dropped,
+        "writer_operations": operations,
+        "cpu_seconds": round(cpu, 2),
+    }
+
+
+async def main(args):
+    if not args.mongo:
+        use_mongomock(args.db)
+    rng = random.Random(args.seed)
+    bus_ids = await seed(args.buses, args.capacity)
+    report = {"clients": args.clients, "buses": args.buses, "seconds": args.seconds}
+    report["push"] = await run_push(bus_ids, args, rng)
+    report["poll"] = await run_poll(bus_ids, args, rng)
+    report["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--buses", type=int, default=100)
+    parser.add_argument("--capacity", type=int, default=40)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=1.0, help="chu kỳ poll của mỗi client (giây)")
+    parser.add_argument("--updates", type=float, default=20, help="số thao tác giữ/nhả ghế mỗi giây")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo", action="store_true")
+    parser.add_argument("--db", default=BENCH_DB)
+    args = parser.parse_args()
+    use_database(args.db)
+    asyncio.run(main(args))
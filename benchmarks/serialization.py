@@ -0,0 +1,89 @@
+"""
+Micro-benchmark CPU cho một trang 100 bản ghi của get_routes, get_buses và get_bus_seats.
+
+before: đổi _id -> id từng dict, dựng schemas.*Response, rồi để FastAPI validate lại
+        qua response_model và render JSONResponse (đúng đường đi cũ của handler)
+after:  projections.*.apply() + ORJSONResponse
+
+    python -m benchmarks.serialization --rounds 2000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import projections, schemas
+
+NOW = datetime(2026, 11, 1, 6, 0, 0, 152000)
+
+
+def route_doc(i):
+    return {"_id": ObjectId(), "route_code": f"R{i}", "departure": "Hà Nội", "destination": "Đà Nẵng",
+            "departure_key": "ha-noi", "destination_key": "da-nang", "price": 350000.0, "duration": 900,
+            "distance": 760.0, "description": None, "created_at": NOW}
+
+
+def bus_doc(i):
+    return {"_id": ObjectId(), "bus_number": f"29B-{i:05d}", "capacity": 40, "route_id": str(ObjectId()),
+            "departure_time": NOW + timedelta(minutes=i), "arrival_time": NOW + timedelta(hours=15),
+            "status": "available", "description": None, "created_at": NOW,
+            "available_seats": 30, "held_seats": 2, "sold_seats": 8}
+
+
+def seat_doc(i):
+    return {"_id": ObjectId(), "seat_number": f"A{i:02d}", "bus_id": str(ObjectId()), "is_available": True,
+            "price": 350000.0, "deck": "lower", "seat_type": "seat", "created_at": NOW}
+
+
+def before(model, field, docs):
+    formatted = []
+    for doc in docs:
+        doc = dict(doc)
+        doc["id"] = str(doc["_id"])
+        del doc["_id"]
+        formatted.append(model(**doc))
+    # serialize_response không await gì bên trong, chạy thẳng coroutine để không tính chi phí event loop
+    coroutine = serialize_response(field=field, response_content=formatted)
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return JSONResponse(done.value).body
+
+
+def after(projection, docs):
+    return projection.response(docs).body
+
+
+def run(rounds: int):
+    cases = [
+        ("get_routes", schemas.RouteResponse, projections.route_projection, route_doc),
+        ("get_buses", schemas.BusResponse, projections.bus_projection, bus_doc),
+        ("get_bus_seats", schemas.SeatResponse, projections.seat_projection, seat_doc),
+    ]
+    for name, model, projection, make_doc in cases:
+        docs = [make_doc(i) for i in range(100)]
+        field = create_response_field(name=f"Response_{name}", type_=List[model], mode="serialization")
+
+        start = time.process_time()
+        for _ in range(rounds):
+            before(model, field, docs)
+        before_us = (time.process_time() - start) / rounds * 1e6
+
+        start = time.process_time()
+        for _ in range(rounds):
+            after(projection, docs)
+        after_us = (time.process_time() - start) / rounds * 1e6
+
+        print(f"{name}: before {before_us:.0f}us/page, after {after_us:.0f}us/page ({before_us / after_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.rounds)
@@ -0,0 +1,122 @@
+"""
+Benchmark tìm chuyến trên lịch chạy tổng hợp toàn quốc: 63 tỉnh, 10k route, 1M chuyến (90 ngày).
+Đo phần chạy trong tiến trình của /search/trips: liệt kê đường đi trên RouteGraph
+và ghép chặng từ kết quả aggregation. Các chuyến được sinh theo nhu cầu thay vì lưu
+hết 1M bản ghi trong bộ nhớ; phần aggregation trên Mongo dùng index (route_id, departure_time, _id).
+
+    python -m benchmarks.trip_search --routes 10000 --departures 1000000 --searches 500
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app import search
+from app.places import place_key
+
+PROVINCES = [
+    "Hà Nội", "Hải Phòng", "Quảng Ninh", "Lạng Sơn", "Cao Bằng", "Lào Cai", "Yên Bái", "Điện Biên",
+    "Sơn La", "Hòa Bình", "Thái Nguyên", "Bắc Giang", "Bắc Ninh", "Hải Dương", "Hưng Yên", "Thái Bình",
+    "Nam Định", "Ninh Bình", "Thanh Hóa", "Nghệ An", "Hà Tĩnh", "Quảng Bình", "Quảng Trị", "Huế",
+    "Đà Nẵng", "Quảng Nam", "Quảng Ngãi", "Bình Định", "Phú Yên", "Khánh Hòa", "Ninh Thuận", "Bình Thuận",
+    "Kon Tum", "Gia Lai", "Đắk Lắk", "Đắk Nông", "Lâm Đồng", "Bình Phước", "Tây Ninh", "Bình Dương",
+    "Đồng Nai", "Bà Rịa - Vũng Tàu", "TP. Hồ Chí Minh", "Long An", "Tiền Giang", "Bến Tre", "Trà Vinh",
+    "Vĩnh Long", "Đồng Tháp", "An Giang", "Kiên Giang", "Cần Thơ", "Hậu Giang", "Sóc Trăng", "Bạc Liêu",
+    "Cà Mau", "Hà Giang", "Tuyên Quang", "Bắc Kạn", "Phú Thọ", "Vĩnh Phúc", "Hà Nam", "Lai Châu",
+]
+DAYS = 90
+START = datetime(2026, 1, 1)
+
+
+def build_routes(count: int, rng: random.Random):
+    routes = []
+    for i in range(count):
+        departure, destination = rng.sample(PROVINCES, 2)
+        routes.append({
+            "_id": f"r{i}",
+            "route_code": f"R{i}",
+            "departure": departure,
+            "destination": destination,
+            "departure_key": place_key(departure),
+            "destination_key": place_key(destination),
+            "price": rng.randint(100, 600) * 1000,
+            "duration": rng.randint(120, 1200),
+        })
+    return routes
+
+
+def departures_for(route_ids, routes_by_id, per_day: float, start: datetime, end: datetime):
+    """Sinh chuyến xe của các route trong khoảng [start, end) một cách xác định (như kết quả aggregation)."""
+    departures = []
+    day = start.replace(hour=0, minute=0)
+    while day < end:
+        for route_id in route_ids:
+            rng = random.Random(f"{route_id}:{day.toordinal()}")
+            trips = int(per_day) + (rng.random() < per_day % 1)
+            for n in range(trips):
+                departure_time = day + timedelta(minutes=rng.randrange(0, 24 * 60))
+                if start <= departure_time < end:
+                    departures.append({
+                        "_id": f"{route_id}:{day.toordinal()}:{n}",
+                        "route_id": route_id,
+                        "bus_number": "BENCH",
+                        "departure_time": departure_time,
+                        "arrival_time": departure_time + timedelta(minutes=routes_by_id[route_id]["duration"]),
+                        "available_seats": rng.randint(0, 40),
+                    })
+        day += timedelta(days=1)
+    departures.sort(key=lambda bus: bus["departure_time"])
+    return departures
+
+
+def run(route_count: int, departure_count: int, searches: int, seed: int):
+    rng = random.Random(seed)
+    routes = build_routes(route_count, rng)
+    routes_by_id = {route["_id"]: route for route in routes}
+    per_day = departure_count / route_count / DAYS
+
+    graph = search.RouteGraph()
+    start = time.perf_counter()
+    graph.load(routes)
+    print(f"graph: {route_count} routes loaded in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    path_times, fetched_rows, assemble_times, results = [], [], [], []
+    for _ in range(searches):
+        origin, destination = rng.sample(PROVINCES, 2)
+        date = START + timedelta(days=rng.randrange(DAYS - 2))
+
+        start = time.perf_counter()
+        place_paths = graph.paths(place_key(origin), place_key(destination), 2)
+        route_ids = sorted({r for path in place_paths for edge in zip(path, path[1:]) for r in graph.edges[edge]})
+        path_times.append(time.perf_counter() - start)
+
+        departures = departures_for(route_ids, routes_by_id, per_day, date,
+                                    date + timedelta(hours=search.MAX_TRIP_HOURS))
+        fetched_rows.append(len(departures))
+
+        start = time.perf_counter()
+        itineraries = search.build_itineraries(place_paths, graph, departures, date, date + timedelta(days=1), 1)
+        itineraries.sort(key=lambda legs: (legs[-1]["arrival_time"], len(legs)))
+        [search.format_itinerary(legs, graph) for legs in itineraries[:20]]
+        assemble_times.append(time.perf_counter() - start)
+        results.append(len(itineraries))
+
+    def pct(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+
+    print(f"searches={searches} departures≈{departure_count} per_route_per_day={per_day:.2f}")
+    print(f"path enumeration: p50={pct(path_times, 50):.2f}ms p99={pct(path_times, 99):.2f}ms")
+    print(f"itinerary assembly: p50={pct(assemble_times, 50):.2f}ms p99={pct(assemble_times, 99):.2f}ms")
+    print(f"rows per aggregation: avg={sum(fetched_rows) / len(fetched_rows):.0f} max={max(fetched_rows)}")
+    print(f"itineraries per search: avg={sum(results) / len(results):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=10000)
+    parser.add_argument("--departures", type=int, default=1000000)
+    parser.add_argument("--searches", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run(args.routes, args.departures, args.searches, args.seed)
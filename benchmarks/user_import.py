@@ -0,0 +1,105 @@
+"""
+So sánh onboard N tài khoản bằng N lần POST /users/register với một lần POST /users/import,
+qua ASGI trên app thật. Báo cáo thời gian, số tài khoản/giây và số lệnh Mongo (khi chạy trên mongod).
+
+    python -m benchmarks.user_import --accounts 2000 --bcrypt-rounds 4
+    python -m benchmarks.user_import --mongomock --accounts 500 --bcrypt-rounds 4
+
+--bcrypt-rounds thấp để phần được đo là các round trip thay vì bcrypt; bỏ đi để đo với chi phí hash thật.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+import httpx
+
+from benchmarks.dataset import BENCH_DB, BENCH_PASSWORD, use_database, use_mongomock
+
+
+def mongo_commands() -> int:
+    from app.metrics import registry
+
+    series = registry.histograms.get("mongo_command_duration_seconds", {})
+    return sum(histogram.count for histogram in series.values())
+
+
+async def run(http: httpx.AsyncClient, label: str, accounts: list, call) -> dict:
+    commands = mongo_commands()
+    start = time.perf_counter()
+    created = await call(http, accounts)
+    elapsed = time.perf_counter() - start
+    return {
+        "run": label,
+        "accounts": len(accounts),
+        "created": created,
+        "seconds": round(elapsed, 2),
+        "accounts_per_second": round(len(accounts) / elapsed, 1),
+        "mongo_commands": mongo_commands() - commands,
+    }
+
+
+async def register_each(http: httpx.AsyncClient, accounts: list) -> int:
+    created = 0
+    for account in accounts:
+        response = await http.post("/users/register", json=account)
+        created += response.status_code == 200
+    return created
+
+
+async def import_batch(http: httpx.AsyncClient, accounts: list) -> int:
+    from app.auth import create_access_token
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'benchmark', 'role': 'admin'})}"}
+    response = await http.post("/users/import", json={"users": accounts}, headers=headers)
+    response.raise_for_status()
+    return response.json()["created"]
+
+
+async def main(args):
+    if args.mongomock:
+        use_mongomock(args.db)
+    from app.email_service import email_service
+    from app.indexes import ensure_indexes
+    from app.main import app
+    from app.jobs import scheduler
+    from app.rate_limit import rate_limiter
+
+    await ensure_indexes()
+    email_service.worker_count = 0
+    logging.getLogger("app.email_service").setLevel(logging.ERROR)
+    rate_limiter.enabled = False
+    scheduler.enabled = False
+
+    def accounts(prefix: str) -> list:
+        tag = uuid.uuid4().hex[:6]
+        return [{"username": f"{prefix}{tag}{i}", "email": f"{prefix}{tag}{i}@corp.example.com",
+                 "password": BENCH_PASSWORD} for i in range(args.accounts)]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        results = [
+            await run(http, "register each", accounts("reg"), register_each),
+            await run(http, "bulk import", accounts("imp"), import_batch),
+        ]
+    for result in results:
+        if args.mongomock:
+            # mongomock không phát sự kiện lệnh cho CommandListener
+            del result["mongo_commands"]
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--bcrypt-rounds", type=int, help="ghi đè BCRYPT_ROUNDS cho lần chạy này")
+    parser.add_argument("--db", default=BENCH_DB)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+    if args.bcrypt_rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    use_database(args.db)
+    asyncio.run(main(args))
@@ -0,0 +1,107 @@
+"""
+Đo throughput khi tăng số worker uvicorn: với mỗi số worker, chạy entry point production
+(`uvicorn app.main:app --workers N`) trong tiến trình con rồi bắn request qua TCP thật.
+Cần Mongo theo .env (nên dùng database benchmark đã seed bằng benchmarks.dataset).
+
+    python -m benchmarks.worker_scaling --workers 1 2 4 --clients 200 --duration 20
+    python -m benchmarks.worker_scaling --path "/routes?limit=20" --path "/buses/<id>/seats"
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.dataset import BENCH_DB
+from benchmarks.load import percentile
+
+
+async def wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup (is MongoDB reachable?)")
+            try:
+                await client.get("/metrics")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.5)
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+async def drive(base_url: str, paths: list, clients: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        async def client(i: int):
+            nonlocal errors
+            n = i
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await http.get(paths[n % len(paths)])
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+                n += 1
+
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(client(i) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run(args) -> dict:
+    results = {}
+    # Job nền (đối soát, archive) không chạy trong lúc đo
+    env = {**os.environ, "MONGO_DB": args.db, "JOBS_ENABLED": "0"}
+    for workers in args.workers:
+        base_url = f"http://127.0.0.1:{args.port}"
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port),
+             "--workers", str(workers), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            await wait_ready(base_url, process)
+            # Làm nóng cache/pool của mọi worker trước khi đo
+            await drive(base_url, args.path, args.clients, min(3, args.duration))
+            results[workers] = await drive(base_url, args.path, args.clients, args.duration)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        print(f"workers={workers}: {results[workers]}", file=sys.stderr)
+
+    base = results[args.workers[0]]["throughput_rps"]
+    for result in results.values():
+        result["speedup"] = round(result["throughput_rps"] / base, 2) if base else None
+    return {"clients": args.clients, "duration": args.duration, "paths": args.path, "workers": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--path", action="append", help="có thể lặp lại; mặc định /routes?limit=20")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default=BENCH_DB)
+    args = parser.parse_args()
+    args.path = args.path or ["/routes?limit=20"]
+    print(json.dumps(asyncio.run(run(args)), indent=2))